@@ -0,0 +1,237 @@
+import os
+import re
+import csv
+import bisect
+import difflib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Bundled airport/city dataset (IATA code, airport name, city, country, region, coordinates, aliases)
+AIRPORTS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'airports.csv')
+# Locations resolved by the model or by fuzzy matching that are kept for later lookups
+AIRPORT_LEARNED_MAX_ENTRIES = int(os.getenv("AIRPORT_LEARNED_MAX_ENTRIES", 10000))
+
+# Words that carry no information when matching a location to an airport
+STOP_WORDS = {'the', 'airport', 'international', 'intl', 'airfield'}
+
+IATA_CODE_RE = re.compile(r'^[A-Za-z]{3}$')
+
+# Other names of countries in "City, Country" strings (normalized)
+COUNTRY_ALIASES = {
+    'usa': 'united states', 'us': 'united states', 'u s': 'united states', 'u s a': 'united states',
+    'united states of america': 'united states', 'america': 'united states',
+    'uk': 'united kingdom', 'u k': 'united kingdom', 'great britain': 'united kingdom',
+    'britain': 'united kingdom', 'gb': 'united kingdom',
+    'uae': 'united arab emirates', 'korea': 'south korea', 'czechia': 'czech republic', 'holland': 'netherlands',
+}
+
+
+def normalize_location(location):
+    """
+    Normalize a location string for index lookups.
+
+    Strips accents and punctuation, lowercases and collapses whitespace, so that
+    "Zürich", "zurich" and " ZURICH " all map to the same key.
+
+    Args:
+        location (str): Free-form location text
+
+    Returns:
+        str: Normalized lookup key (may be empty)
+    """
+    text = unicodedata.normalize('NFKD', location)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.lower().replace('&', ' and ').replace("'", '')
+    text = re.sub(r'[^a-z0-9]+', ' ', text)
+    return ' '.join(word for word in text.split() if word not in STOP_WORDS)
+
+
+class AirportIndex:
+    """
+    In-memory index of airports supporting exact code, alias, normalized-name,
+    "City, Country", prefix and fuzzy lookups.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._airports = {}        # IATA code -> airport record
+        self._by_name = {}         # normalized name/alias -> IATA code
+        self._by_city_country = {} # (normalized city, normalized country) -> IATA code
+        self._places = {}          # IATA code -> normalized country and region names it is in
+        self._learned = OrderedDict()  # normalized location -> IATA code, least recently used first
+        self._sorted_names = []    # sorted normalized names, for prefix search
+        self._buckets = {}         # first letter -> normalized names, for fuzzy search
+
+    @classmethod
+    def from_csv(cls, path=AIRPORTS_CSV):
+        """
+        Build an index from the bundled airport CSV file.
+
+        Args:
+            path (str): Path to the CSV file
+
+        Returns:
+            AirportIndex: Populated index
+        """
+        index = cls()
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                aliases = [alias for alias in row['aliases'].split('|') if alias]
+                regions = [region for region in row['region'].split('|') if region]
+                index.add_airport(
+                    row['iata'], row['name'], row['city'], row['country'],
+                    float(row['latitude']), float(row['longitude']), aliases, regions
+                )
+        return index
+
+    def add_airport(self, code, name, city, country, latitude=None, longitude=None, aliases=(), regions=()):
+        """Add an airport and all of its names to the index."""
+        code = code.upper()
+        with self._lock:
+            self._airports[code] = {
+                'code': code,
+                'name': name,
+                'city': city,
+                'country': country,
+                'latitude': latitude,
+                'longitude': longitude,
+            }
+            # The first airport listed for a city wins, so the CSV lists the primary airport first
+            for label in (city, name, *aliases):
+                self._add_name(normalize_location(label), code)
+            self._by_city_country.setdefault((normalize_location(city), normalize_location(country)), code)
+            self._places[code] = {normalize_location(place) for place in (country, *regions)}
+
+    def _add_name(self, key, code):
+        """Register a normalized name for a code. Caller must hold the lock."""
+        if not key or key in self._by_name:
+            return
+        self._by_name[key] = code
+        bisect.insort(self._sorted_names, key)
+        self._buckets.setdefault(key[0], []).append(key)
+
+    def remember(self, location, code):
+        """
+        Write an externally resolved location -> code mapping back into the index.
+
+        Learned locations are kept apart from the dataset's names, up to
+        AIRPORT_LEARNED_MAX_ENTRIES of the most recently used.
+
+        Args:
+            location (str): Location as the user typed it
+            code (str): Resolved 3-letter IATA code
+        """
+        self._learn(normalize_location(location), code.upper())
+
+    def _learn(self, key, code):
+        if not key or key in self._by_name:
+            return
+        with self._lock:
+            self._learned[key] = code
+            self._learned.move_to_end(key)
+            while len(self._learned) > AIRPORT_LEARNED_MAX_ENTRIES:
+                self._learned.popitem(last=False)
+
+    def _learned_code(self, key):
+        with self._lock:
+            code = self._learned.get(key)
+            if code:
+                self._learned.move_to_end(key)
+        return code
+
+    def get_airport(self, code):
+        """Return the airport record for a code, or None if unknown."""
+        return self._airports.get(code.upper()) if code else None
+
+    def lookup(self, location):
+        """
+        Resolve a location to an IATA code without calling the model.
+
+        Args:
+            location (str): Name of the location (city, country, airport or code)
+
+        Returns:
+            str: 3-letter IATA airport code or None if the index has no match
+        """
+        if not location or not location.strip():
+            return None
+
+        stripped = location.strip()
+        if IATA_CODE_RE.match(stripped) and stripped.upper() in self._airports:
+            return stripped.upper()
+
+        key = normalize_location(stripped)
+        if not key:
+            return None
+
+        # Exact name or alias, or a location resolved before
+        code = self._by_name.get(key) or self._learned_code(key)
+        if code:
+            return code
+
+        # "City, Country" / "City, State, Country" strings
+        if ',' in stripped:
+            parts = [normalize_location(part) for part in stripped.split(',')]
+            parts = [part for part in parts if part]
+            if len(parts) > 1:
+                qualifiers = [COUNTRY_ALIASES.get(part, part) for part in parts[1:]]
+                code = self._by_city_country.get((parts[0], qualifiers[-1])) or self._match_key(parts[0])
+                # A state or country the city's airport isn't in ("Paris, Texas") means
+                # another place of the same name, which the index doesn't know
+                if code and all(qualifier in self._places.get(code, ()) for qualifier in qualifiers):
+                    return code
+                return None
+            if parts:
+                key = parts[0]
+
+        return self._match_key(key)
+
+    def _match_key(self, key):
+        """Exact, prefix, then fuzzy match for a normalized key."""
+        code = self._by_name.get(key) or self._learned_code(key)
+        if code:
+            return code
+
+        # Prefix match ("san fran" -> "san francisco"), only when unambiguous
+        if len(key) >= 4:
+            start = bisect.bisect_left(self._sorted_names, key)
+            codes = set()
+            for name in self._sorted_names[start:]:
+                if not name.startswith(key):
+                    break
+                codes.add(self._by_name[name])
+                if len(codes) > 1:
+                    break
+            if len(codes) == 1:
+                return codes.pop()
+
+        # Fuzzy match for typos, restricted to names sharing the first letter
+        if len(key) >= 4:
+            candidates = self._buckets.get(key[0], [])
+            matches = difflib.get_close_matches(key, candidates, n=1, cutoff=0.85)
+            if matches:
+                code = self._by_name[matches[0]]
+                self._learn(key, code)
+                return code
+
+        return None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_airport_index():
+    """
+    Return the process-wide airport index, loading the bundled dataset on first use.
+
+    Returns:
+        AirportIndex: Shared airport index
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AirportIndex.from_csv()
+    return _index
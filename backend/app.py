@@ -1,11 +1,71 @@
-from flask import Flask, request, jsonify
+import time
+_started = time.perf_counter()  # cold start is measured from here
+
+from flask import Flask, Response, request, jsonify, stream_with_context, g
 from flask_cors import CORS
 import json
-from gemini_api import generate_travel_plan, get_destination_recommendations, get_airport_code
+from gemini_api import (
+    generate_travel_plan, stream_travel_plan, get_destination_recommendations, get_airport_code,
+    get_airport_codes, stream_destination_recommendations, start_warm_up, readiness, AIRPORT_CODES_MAX_LOCATIONS,
+    generate_multi_city_plan
+)
+from routing import MULTI_CITY_MAX_STOPS
+from cache import response_cache
+from semantic_cache import semantic_cache
+from destinations import shortlist_destinations
+from model_backends import RateLimitError
+from scheduler import SchedulerOverloaded
+from resilience import CircuitOpenError, StageTimeout, resilience_stats
+from metrics import begin_request, finish_request, render_metrics, mark_startup, startup_phases
+from jobs import job_queue, submit_plan_job
+from plans import plan_store, with_plan_id, store_plan_events, compress_response_body
+from prewarm import log_request
+from batch import generate_travel_plans, BatchError, BATCH_CONCURRENCY
 
 app = Flask(__name__, static_folder='../frontend', static_url_path='/')
 CORS(app)  # Enable CORS for all routes
 
+# Load the airport index and model client in the background (see MODEL_WARMUP)
+start_warm_up()
+mark_startup('imported', _started)
+
+@app.before_request
+def start_job_workers():
+    """
+    Process queued background jobs, including those left over from before a restart.
+
+    Workers start with the first request this process serves rather than at import,
+    so the debug reloader's watcher process and modules that merely import the app
+    (such as benchmark.py) don't claim jobs.
+    """
+    job_queue.start()
+
+@app.before_request
+def start_request_timing():
+    """Start collecting per-stage timings for the Server-Timing header"""
+    g.request_start = begin_request()
+
+@app.after_request
+def add_server_timing(response):
+    """Record the request in metrics and report its stage timings in a Server-Timing header"""
+    start = g.get('request_start')
+    if start is not None:
+        response.headers['Server-Timing'] = finish_request(start, request.endpoint or 'unknown', response.status_code)
+    mark_startup('first_request', _started)
+    return response
+
+@app.after_request
+def compress_json_response(response):
+    """Compress large JSON bodies (such as whole plans) for clients that accept gzip or brotli"""
+    if response.mimetype == 'application/json' and not response.is_streamed and not response.direct_passthrough \
+            and 'Content-Encoding' not in response.headers:
+        body, encoding = compress_response_body(response.get_data(), request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.set_data(body)
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/')
 def index():
     """Serve the frontend application"""
@@ -23,8 +83,17 @@ def create_travel_plan():
         "dates": "June 10-20, 2024",
         "budget": "$3000",
         "travelers": "2",
-        "interests": ["art", "history", "food"]
+        "interests": ["art", "history", "food"],
+        "include_flights": true,
+        "stream": false
     }
+
+    Clients that set "stream": true (or send "Accept: text/event-stream") receive
+    Server-Sent Events instead of a single JSON response:
+    "codes", "chunk" (Markdown fragments), "flights", then "done" or "error".
+
+    The plan is stored and its "plan_id" returned, so it can be fetched again with
+    GET /api/plans/<plan_id>.
     """
     try:
         data = request.json
@@ -37,6 +106,7 @@ def create_travel_plan():
         travelers = data.get('travelers', '')
         interests = data.get('interests', [])
         include_flights = data.get('include_flights', False)
+        stream = data.get('stream', False) or 'text/event-stream' in request.headers.get('Accept', '')
         
         # Validate required fields
         if not all([source, destination, dates, budget, travelers]) or not interests:
@@ -44,25 +114,78 @@ def create_travel_plan():
                 'success': False,
                 'error': 'Missing required fields'
             }), 400
-        
+        log_request('plan', data)
+
+        if stream:
+            events = store_plan_events(stream_travel_plan(
+                source, destination, dates, budget, travelers, interests, include_flights
+            ))
+            return Response(
+                stream_with_context(sse_stream(events)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
         # Generate travel plan
-        result = generate_travel_plan(
+        result = with_plan_id(generate_travel_plan(
             source, destination, dates, budget, travelers, interests, include_flights
-        )
+        ))
 
         return jsonify({
             'success': True,
+            'plan_id': result['plan_id'],
             'travel_plan': result['travel_plan'],
             'source_code': result['source_code'],
             'destination_code': result['destination_code'],
-            'flight_details': result.get('flight_details')
+            'flight_details': result.get('flight_details'),
+            'timings': result.get('timings')
         })
         
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        return error_response(e)
+
+def error_response(e):
+    """
+    Build the JSON error response for an exception raised while handling a request.
+
+    Quota problems get a fast 503 (our scheduler shed the call or the circuit
+    breaker is open) or 429 (the model rejected it) with a Retry-After header, and
+    stage deadlines a 504, instead of a generic 500.
+    """
+    status = 500
+    if isinstance(e, (SchedulerOverloaded, CircuitOpenError)):
+        status = 503
+    elif isinstance(e, RateLimitError):
+        status = 429
+    elif isinstance(e, StageTimeout):
+        status = 504
+
+    response = jsonify({
+        'success': False,
+        'error': str(e)
+    })
+    response.status_code = status
+    retry_after = getattr(e, 'retry_after', None)
+    if status in (429, 503):
+        response.headers['Retry-After'] = str(int(retry_after or 60))
+    return response
+
+def format_sse(event, data):
+    """Format a single Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_stream(events):
+    """
+    Convert (event, data) tuples into Server-Sent Events.
+
+    Errors raised after the response has started are reported as an "error"
+    event, since the status code has already been sent.
+    """
+    try:
+        for event, data in events:
+            yield format_sse(event, data)
+    except Exception as e:
+        yield format_sse('error', {'success': False, 'error': str(e), 'retry_after': getattr(e, 'retry_after', None)})
 
 @app.route('/api/recommend-destinations', methods=['POST'])
 def recommend_destinations():
@@ -74,8 +197,13 @@ def recommend_destinations():
         "interests": ["beach", "hiking", "food"],
         "budget": "$2000",
         "dates": "August 5-15, 2024",
-        "travelers": "2"
+        "travelers": "2",
+        "stream": false
     }
+
+    The response carries the ranked catalog "shortlist" next to the written
+    "recommendations" for its top destinations. Streaming clients receive the
+    shortlist as a first event while the recommendations are written.
     """
     try:
         data = request.json
@@ -85,6 +213,7 @@ def recommend_destinations():
         budget = data.get('budget', '')
         dates = data.get('dates', '')
         travelers = data.get('travelers', '')
+        stream = data.get('stream', False) or 'text/event-stream' in request.headers.get('Accept', '')
         
         # Validate required fields
         if not all([budget, dates, travelers]) or not interests:
@@ -92,22 +221,30 @@ def recommend_destinations():
                 'success': False,
                 'error': 'Missing required fields'
             }), 400
+        log_request('recommend', data)
+
+        if stream:
+            events = stream_destination_recommendations(interests, budget, dates, travelers)
+            return Response(
+                stream_with_context(sse_stream(events)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
         
-        # Get recommendations
+        # Rank the catalog, then get the write-up of the top destinations
+        shortlist = shortlist_destinations(interests, budget, dates, travelers)
         recommendations = get_destination_recommendations(
-            interests, budget, dates, travelers
+            interests, budget, dates, travelers, shortlist
         )
         
         return jsonify({
             'success': True,
-            'recommendations': recommendations
+            'recommendations': recommendations,
+            'shortlist': shortlist
         })
         
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        return error_response(e)
 
 @app.route('/api/get-airport-code', methods=['POST'])
 def airport_code():
@@ -144,10 +281,283 @@ def airport_code():
             }), 404
 
     except Exception as e:
+        return error_response(e)
+
+@app.route('/api/get-airport-codes', methods=['POST'])
+def airport_codes():
+    """
+    Get the airport codes for several locations, asking the model about all of
+    them at once.
+
+    Expected JSON payload:
+    {
+        "locations": ["New York", "Paris", "Springfield, Illinois"]
+    }
+
+    Locations that could not be resolved map to null.
+    """
+    try:
+        data = request.json
+        locations = data.get('locations')
+
+        if not isinstance(locations, list) or not locations \
+                or not all(isinstance(location, str) and location.strip() for location in locations):
+            return jsonify({
+                'success': False,
+                'error': "'locations' must be a non-empty list of location names"
+            }), 400
+        if len(locations) > AIRPORT_CODES_MAX_LOCATIONS:
+            return jsonify({
+                'success': False,
+                'error': f"At most {AIRPORT_CODES_MAX_LOCATIONS} locations can be looked up at once"
+            }), 400
+
+        codes = get_airport_codes(locations)
+
+        return jsonify({
+            'success': True,
+            'airport_codes': codes,
+            'unresolved': [location for location, code in codes.items() if code is None]
+        })
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/multi-city-plan', methods=['POST'])
+def create_multi_city_plan():
+    """
+    Generate a travel plan that visits several cities.
+
+    Expected JSON payload:
+    {
+        "source": "New York",
+        "cities": ["Rome", "Paris", "Berlin"],
+        "dates": "June 10-24, 2025",
+        "budget": "$6000",
+        "travelers": "2",
+        "interests": ["art", "food"],
+        "include_flights": true,
+        "optimize_order": true,
+        "round_trip": false
+    }
+
+    The cities are visited in the order that makes the route shortest unless
+    "optimize_order" is false. The response's "route" lists each stop's days and
+    dates and each leg's date and distance.
+    """
+    try:
+        data = request.json
+
+        source = data.get('source', '')
+        cities = data.get('cities')
+        dates = data.get('dates', '')
+        budget = data.get('budget', '')
+        travelers = data.get('travelers', '')
+        interests = data.get('interests', [])
+        include_flights = data.get('include_flights', False)
+        optimize_order = data.get('optimize_order', True)
+        round_trip = data.get('round_trip', False)
+
+        if not isinstance(cities, list) or not cities \
+                or not all(isinstance(city, str) and city.strip() for city in cities):
+            return jsonify({
+                'success': False,
+                'error': "'cities' must be a non-empty list of city names"
+            }), 400
+        # Each city is visited once
+        cities = list(dict.fromkeys(city.strip() for city in cities))
+        if len(cities) > MULTI_CITY_MAX_STOPS:
+            return jsonify({
+                'success': False,
+                'error': f"At most {MULTI_CITY_MAX_STOPS} cities can be planned at once"
+            }), 400
+        if not all([source, dates, budget, travelers]) or not interests:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required fields'
+            }), 400
+
+        result = with_plan_id(generate_multi_city_plan(
+            source, cities, dates, budget, travelers, interests, include_flights, optimize_order, round_trip
+        ))
+
+        return jsonify({
+            'success': True,
+            'plan_id': result['plan_id'],
+            'travel_plan': result['travel_plan'],
+            'route': result['route'],
+            'source_code': result['source_code'],
+            'destination_code': result['destination_code'],
+            'flight_details': result.get('flight_details'),
+            'timings': result.get('timings')
+        })
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/batch/generate-plans', methods=['POST'])
+def batch_generate_plans():
+    """
+    Generate travel plans for a list of trips.
+
+    Expected JSON payload:
+    {
+        "trips": [{"id": "t1", "source": "New York", "destination": "Paris", ...}, ...],
+        "concurrency": 4
+    }
+
+    Streams one JSON object per line (NDJSON) as each trip finishes, with its
+    "index" in the batch, "success" and either the plan fields or "error".
+    """
+    try:
+        data = request.get_json()
+        items = generate_travel_plans(data.get('trips'), data.get('concurrency', BATCH_CONCURRENCY))
+    except BatchError as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }), 400
+    except Exception as e:
+        return error_response(e)
+
+    return Response(
+        stream_with_context(ndjson_stream(items)),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def ndjson_stream(items):
+    """Serialize dicts as newline-delimited JSON, reporting a failure after the response started as a last line"""
+    try:
+        for item in items:
+            yield json.dumps(item) + "\n"
+    except Exception as e:
+        yield json.dumps({'success': False, 'error': str(e)}) + "\n"
+
+@app.route('/api/jobs', methods=['POST'])
+def create_plan_job():
+    """
+    Queue a travel plan for background generation and return its job id at once.
+
+    Accepts the same payload as /api/generate-plan. Submitting the same trip again
+    returns the existing job instead of starting another generation.
+    """
+    try:
+        data = request.get_json()
+
+        # Extract data from request
+        source = data.get('source', '')
+        destination = data.get('destination', '')
+        dates = data.get('dates', '')
+        budget = data.get('budget', '')
+        travelers = data.get('travelers', '')
+        interests = data.get('interests', [])
+        include_flights = data.get('include_flights', False)
+
+        # Validate required fields
+        if not all([source, destination, dates, budget, travelers]) or not interests:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required fields'
+            }), 400
+
+        job = submit_plan_job(source, destination, dates, budget, travelers, interests, include_flights)
+
+        return jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'status_url': f"/api/jobs/{job['job_id']}"
+        }), 202
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Report a job's status, and its result once done.
+
+    With ?wait=<seconds> the request is held until the job finishes or the wait
+    (capped by JOB_MAX_WAIT_SECONDS) runs out.
+    """
+    try:
+        wait = request.args.get('wait', 0, type=float)
+        job = job_queue.wait(job_id, wait) if wait > 0 else job_queue.get(job_id)
+
+        if job is None:
+            return jsonify({
+                'success': False,
+                'error': 'Unknown job'
+            }), 404
+
+        return jsonify(dict(job, success=True))
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/plans/<plan_id>', methods=['GET'])
+def get_plan(plan_id):
+    """
+    Fetch a stored plan by id.
+
+    With ?section=flights,day-3 only those sections are returned (the full plan lists
+    the available section names). Responses carry a strong ETag and are answered
+    with 304 when If-None-Match matches.
+    """
+    try:
+        sections = [name.strip() for value in request.args.getlist('section') for name in value.split(',') if name.strip()]
+        status, body, headers = plan_store.response(
+            plan_id, sections, request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding')
+        )
+        return Response(body, status=status, headers=headers)
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Report response cache hit/miss counters"""
+    return jsonify({
+        'success': True,
+        'cache': response_cache.stats(),
+        'semantic_cache': semantic_cache.stats()
+    })
+
+@app.route('/api/resilience/stats', methods=['GET'])
+def model_stage_stats():
+    """Report per-stage hedging, timeout and circuit breaker statistics"""
+    return jsonify({
+        'success': True,
+        'stages': resilience_stats()
+    })
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness: the airport index and model client are loaded.
+
+    Answers 503 while warming up or when the model cannot be configured (e.g. a
+    missing GEMINI_API_KEY).
+    """
+    ready, warm_up = readiness()
+    if ready:
+        mark_startup('ready', _started)
+    return jsonify({
+        'ready': ready,
+        'warm_up': warm_up,
+        'startup_seconds': startup_phases()
+    }), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose latency, token, cache and retry metrics in the Prometheus text format"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
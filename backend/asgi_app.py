@@ -0,0 +1,488 @@
+import time
+_started = time.perf_counter()  # cold start is measured from here
+
+from quart import Quart, request, jsonify, g
+from quart.wrappers.response import DataBody
+from quart_cors import cors
+import json
+import asyncio
+from async_api import (
+    generate_travel_plan_async, stream_travel_plan_async,
+    get_destination_recommendations_async, stream_destination_recommendations_async, get_airport_code_async, get_airport_codes_async,
+    generate_multi_city_plan_async
+)
+from routing import MULTI_CITY_MAX_STOPS
+from cache import response_cache
+from semantic_cache import semantic_cache
+from destinations import shortlist_destinations
+from model_backends import RateLimitError
+from scheduler import SchedulerOverloaded
+from resilience import CircuitOpenError, StageTimeout, resilience_stats
+from metrics import begin_request, finish_request, render_metrics, mark_startup, startup_phases
+from jobs import job_queue, submit_plan_job
+from plans import plan_store, with_plan_id, store_plan_events_async, compress_response_body
+from prewarm import log_request
+from batch import generate_travel_plans_async, BatchError, BATCH_CONCURRENCY
+from gemini_api import start_warm_up, readiness, AIRPORT_CODES_MAX_LOCATIONS
+
+# Async (ASGI) version of app.py. It exposes the same endpoints and payloads, but
+# model calls are awaited instead of holding a worker thread, so one process can
+# keep many slow generations in flight. Run it with an ASGI server, e.g.:
+#
+#     hypercorn asgi_app:app --bind 0.0.0.0:5000
+
+app = Quart(__name__, static_folder='../frontend', static_url_path='/')
+app = cors(app, allow_origin='*')  # Enable CORS for all routes
+mark_startup('imported', _started)
+
+@app.before_serving
+async def warm_up_in_background():
+    """Load the airport index and model client in the background (see MODEL_WARMUP)"""
+    start_warm_up()
+    # Process queued background jobs, including those left over from before a restart
+    job_queue.start()
+
+@app.before_request
+async def start_request_timing():
+    """Start collecting per-stage timings for the Server-Timing header"""
+    g.request_start = begin_request()
+
+@app.after_request
+async def add_server_timing(response):
+    """Record the request in metrics and report its stage timings in a Server-Timing header"""
+    start = g.get('request_start')
+    if start is not None:
+        response.headers['Server-Timing'] = finish_request(start, request.endpoint or 'unknown', response.status_code)
+    mark_startup('first_request', _started)
+    return response
+
+@app.after_request
+async def compress_json_response(response):
+    """Compress large JSON bodies (such as whole plans) for clients that accept gzip or brotli"""
+    if response.mimetype == 'application/json' and isinstance(response.response, DataBody) \
+            and 'Content-Encoding' not in response.headers:
+        body, encoding = compress_response_body(await response.get_data(), request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.set_data(body)
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/')
+async def index():
+    """Serve the frontend application"""
+    return await app.send_static_file('index.html')
+
+@app.route('/api/generate-plan', methods=['POST'])
+async def create_travel_plan():
+    """
+    Generate a travel plan based on user inputs.
+
+    Accepts the same payload as the Flask app, including "stream": true for
+    Server-Sent Events, and likewise returns the stored plan's "plan_id".
+    """
+    try:
+        data = await request.get_json()
+
+        # Extract data from request
+        source = data.get('source', '')
+        destination = data.get('destination', '')
+        dates = data.get('dates', '')
+        budget = data.get('budget', '')
+        travelers = data.get('travelers', '')
+        interests = data.get('interests', [])
+        include_flights = data.get('include_flights', False)
+        stream = data.get('stream', False) or 'text/event-stream' in request.headers.get('Accept', '')
+
+        # Validate required fields
+        if not all([source, destination, dates, budget, travelers]) or not interests:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required fields'
+            }), 400
+        log_request('plan', data)
+
+        if stream:
+            events = store_plan_events_async(stream_travel_plan_async(
+                source, destination, dates, budget, travelers, interests, include_flights
+            ))
+            return sse_stream(events), 200, {
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+
+        # Generate travel plan
+        result = await generate_travel_plan_async(
+            source, destination, dates, budget, travelers, interests, include_flights
+        )
+        result = await asyncio.to_thread(with_plan_id, result)
+
+        return jsonify({
+            'success': True,
+            'plan_id': result['plan_id'],
+            'travel_plan': result['travel_plan'],
+            'source_code': result['source_code'],
+            'destination_code': result['destination_code'],
+            'flight_details': result.get('flight_details'),
+            'timings': result.get('timings')
+        })
+
+    except Exception as e:
+        return error_response(e)
+
+def error_response(e):
+    """
+    Build the JSON error response for an exception raised while handling a request.
+
+    Quota problems get a fast 503 (our scheduler shed the call or the circuit
+    breaker is open) or 429 (the model rejected it) with a Retry-After header, and
+    stage deadlines a 504, instead of a generic 500.
+    """
+    status = 500
+    if isinstance(e, (SchedulerOverloaded, CircuitOpenError)):
+        status = 503
+    elif isinstance(e, RateLimitError):
+        status = 429
+    elif isinstance(e, StageTimeout):
+        status = 504
+
+    response = jsonify({
+        'success': False,
+        'error': str(e)
+    })
+    response.status_code = status
+    retry_after = getattr(e, 'retry_after', None)
+    if status in (429, 503):
+        response.headers['Retry-After'] = str(int(retry_after or 60))
+    return response
+
+def format_sse(event, data):
+    """Format a single Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def sse_stream(events):
+    """Convert (event, data) tuples from an async generator into Server-Sent Events"""
+    try:
+        async for event, data in events:
+            yield format_sse(event, data).encode('utf-8')
+    except Exception as e:
+        yield format_sse('error', {'success': False, 'error': str(e), 'retry_after': getattr(e, 'retry_after', None)}).encode('utf-8')
+
+@app.route('/api/recommend-destinations', methods=['POST'])
+async def recommend_destinations():
+    """
+    Get destination recommendations based on user preferences.
+
+    Accepts the same payload as the Flask app, including "stream": true for
+    Server-Sent Events (the ranked shortlist first, then the recommendations).
+    """
+    try:
+        data = await request.get_json()
+
+        # Extract data from request
+        interests = data.get('interests', [])
+        budget = data.get('budget', '')
+        dates = data.get('dates', '')
+        travelers = data.get('travelers', '')
+        stream = data.get('stream', False) or 'text/event-stream' in request.headers.get('Accept', '')
+
+        # Validate required fields
+        if not all([budget, dates, travelers]) or not interests:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required fields'
+            }), 400
+        log_request('recommend', data)
+
+        if stream:
+            events = stream_destination_recommendations_async(interests, budget, dates, travelers)
+            return sse_stream(events), 200, {
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+
+        # Rank the catalog, then get the write-up of the top destinations
+        shortlist = shortlist_destinations(interests, budget, dates, travelers)
+        recommendations = await get_destination_recommendations_async(
+            interests, budget, dates, travelers, shortlist
+        )
+
+        return jsonify({
+            'success': True,
+            'recommendations': recommendations,
+            'shortlist': shortlist
+        })
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/get-airport-code', methods=['POST'])
+async def airport_code():
+    """Get the airport code for a given location."""
+    try:
+        data = await request.get_json()
+        location = data.get('location', '')
+
+        if not location:
+            return jsonify({
+                'success': False,
+                'error': 'Missing location'
+            }), 400
+
+        airport_code = await get_airport_code_async(location)
+
+        if airport_code:
+            return jsonify({
+                'success': True,
+                'location': location,
+                'airport_code': airport_code
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'error': 'Could not determine airport code'
+            }), 404
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/get-airport-codes', methods=['POST'])
+async def airport_codes():
+    """Get the airport codes for several locations in one model call."""
+    try:
+        data = await request.get_json()
+        locations = data.get('locations')
+
+        if not isinstance(locations, list) or not locations \
+                or not all(isinstance(location, str) and location.strip() for location in locations):
+            return jsonify({
+                'success': False,
+                'error': "'locations' must be a non-empty list of location names"
+            }), 400
+        if len(locations) > AIRPORT_CODES_MAX_LOCATIONS:
+            return jsonify({
+                'success': False,
+                'error': f"At most {AIRPORT_CODES_MAX_LOCATIONS} locations can be looked up at once"
+            }), 400
+
+        codes = await get_airport_codes_async(locations)
+
+        return jsonify({
+            'success': True,
+            'airport_codes': codes,
+            'unresolved': [location for location, code in codes.items() if code is None]
+        })
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/multi-city-plan', methods=['POST'])
+async def create_multi_city_plan():
+    """Generate a travel plan that visits several cities (same payload and response as the Flask app)"""
+    try:
+        data = await request.get_json()
+
+        source = data.get('source', '')
+        cities = data.get('cities')
+        dates = data.get('dates', '')
+        budget = data.get('budget', '')
+        travelers = data.get('travelers', '')
+        interests = data.get('interests', [])
+        include_flights = data.get('include_flights', False)
+        optimize_order = data.get('optimize_order', True)
+        round_trip = data.get('round_trip', False)
+
+        if not isinstance(cities, list) or not cities \
+                or not all(isinstance(city, str) and city.strip() for city in cities):
+            return jsonify({
+                'success': False,
+                'error': "'cities' must be a non-empty list of city names"
+            }), 400
+        # Each city is visited once
+        cities = list(dict.fromkeys(city.strip() for city in cities))
+        if len(cities) > MULTI_CITY_MAX_STOPS:
+            return jsonify({
+                'success': False,
+                'error': f"At most {MULTI_CITY_MAX_STOPS} cities can be planned at once"
+            }), 400
+        if not all([source, dates, budget, travelers]) or not interests:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required fields'
+            }), 400
+
+        result = await generate_multi_city_plan_async(
+            source, cities, dates, budget, travelers, interests, include_flights, optimize_order, round_trip
+        )
+        result = await asyncio.to_thread(with_plan_id, result)
+
+        return jsonify({
+            'success': True,
+            'plan_id': result['plan_id'],
+            'travel_plan': result['travel_plan'],
+            'route': result['route'],
+            'source_code': result['source_code'],
+            'destination_code': result['destination_code'],
+            'flight_details': result.get('flight_details'),
+            'timings': result.get('timings')
+        })
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/batch/generate-plans', methods=['POST'])
+async def batch_generate_plans():
+    """
+    Generate travel plans for a list of trips.
+
+    Accepts the same payload as the Flask app and streams NDJSON in completion order.
+    """
+    try:
+        data = await request.get_json()
+        items = generate_travel_plans_async(data.get('trips'), data.get('concurrency', BATCH_CONCURRENCY))
+    except BatchError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return error_response(e)
+
+    return ndjson_stream(items), 200, {
+        'Content-Type': 'application/x-ndjson',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    }
+
+async def ndjson_stream(items):
+    """Serialize dicts from an async generator as newline-delimited JSON"""
+    try:
+        async for item in items:
+            yield (json.dumps(item) + "\n").encode('utf-8')
+    except Exception as e:
+        yield (json.dumps({'success': False, 'error': str(e)}) + "\n").encode('utf-8')
+
+@app.route('/api/jobs', methods=['POST'])
+async def create_plan_job():
+    """
+    Queue a travel plan for background generation and return its job id at once.
+
+    Accepts the same payload as /api/generate-plan. Submitting the same trip again
+    returns the existing job instead of starting another generation.
+    """
+    try:
+        data = await request.get_json()
+
+        # Extract data from request
+        source = data.get('source', '')
+        destination = data.get('destination', '')
+        dates = data.get('dates', '')
+        budget = data.get('budget', '')
+        travelers = data.get('travelers', '')
+        interests = data.get('interests', [])
+        include_flights = data.get('include_flights', False)
+
+        # Validate required fields
+        if not all([source, destination, dates, budget, travelers]) or not interests:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required fields'
+            }), 400
+
+        job = await asyncio.to_thread(
+            submit_plan_job, source, destination, dates, budget, travelers, interests, include_flights
+        )
+
+        return jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'status_url': f"/api/jobs/{job['job_id']}"
+        }), 202
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    """
+    Report a job's status, and its result once done.
+
+    With ?wait=<seconds> the request is held until the job finishes or the wait
+    (capped by JOB_MAX_WAIT_SECONDS) runs out.
+    """
+    try:
+        wait = request.args.get('wait', 0, type=float)
+        if wait > 0:
+            job = await asyncio.to_thread(job_queue.wait, job_id, wait)
+        else:
+            job = await asyncio.to_thread(job_queue.get, job_id)
+
+        if job is None:
+            return jsonify({
+                'success': False,
+                'error': 'Unknown job'
+            }), 404
+
+        return jsonify(dict(job, success=True))
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/plans/<plan_id>', methods=['GET'])
+async def get_plan(plan_id):
+    """Fetch a stored plan, or ?section=... of it, with ETag and compression (see app.py)"""
+    try:
+        sections = [name.strip() for value in request.args.getlist('section') for name in value.split(',') if name.strip()]
+        status, body, headers = await asyncio.to_thread(
+            plan_store.response,
+            plan_id, sections, request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding')
+        )
+        return body, status, headers
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/cache/stats', methods=['GET'])
+async def cache_stats():
+    """Report response cache hit/miss counters"""
+    return jsonify({
+        'success': True,
+        'cache': response_cache.stats(),
+        'semantic_cache': semantic_cache.stats()
+    })
+
+@app.route('/api/resilience/stats', methods=['GET'])
+async def model_stage_stats():
+    """Report per-stage hedging, timeout and circuit breaker statistics"""
+    return jsonify({
+        'success': True,
+        'stages': resilience_stats()
+    })
+
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+async def readyz():
+    """Readiness: the airport index and model client are loaded (503 while warming up or misconfigured)"""
+    ready, warm_up = await asyncio.to_thread(readiness)
+    if ready:
+        mark_startup('ready', _started)
+    return jsonify({
+        'ready': ready,
+        'warm_up': warm_up,
+        'startup_seconds': startup_phases()
+    }), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Expose latency, token, cache and retry metrics in the Prometheus text format"""
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+if __name__ == '__main__':
+    app.run(debug=True, port=5000)
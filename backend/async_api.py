@@ -0,0 +1,479 @@
+import time
+import asyncio
+import gemini_api
+from airports import get_airport_index, normalize_location
+from model_backends import RateLimitError
+from scheduler import SchedulerOverloaded, PRIORITY_AIRPORT
+from resilience import stages
+from metrics import observe_stage, record_model_response, record_model_error
+from cache import (
+    response_cache, plan_cache_key, multi_city_cache_key, recommendations_cache_key, flights_cache_key,
+    airport_cache_key
+)
+from semantic_cache import semantic_cache, recommendation_features
+from destinations import shortlist_destinations
+from gemini_api import (
+    build_travel_plan_prompt, build_trip_details, sectioned_itinerary_days, build_itinerary_skeleton_prompt,
+    skeleton_tokens, output_budget, parse_itinerary_skeleton, sectioned_itinerary_calls, format_itinerary_part,
+    build_airport_code_prompt, parse_airport_code, AIRPORT_BATCH_ATTEMPTS,
+    AIRPORT_CODES_SCHEMA, build_airport_codes_prompt, parse_airport_codes,
+    _index_airport_codes, _airport_batches, _apply_airport_codes,
+    build_flight_details_prompt, flight_output_options, parse_flight_details,
+    build_recommendations_prompt, recommendation_output_options, RECOMMENDATION_TOP_K, extract_travel_date, format_flight_section, is_complete_plan, elapsed_ms,
+    plan_multi_city_route, multi_city_calls, assemble_multi_city_plan, compute_timings, ITINERARY_SECTIONS_IN_FLIGHT
+)
+
+# Async counterparts of the gemini_api entry points, used by the ASGI app.
+# They share prompts, parsing, the airport index and the response cache with the
+# synchronous versions, but await Gemini's async API instead of blocking a thread.
+
+async def generate_travel_plan_async(source, destination, dates, budget, travelers, interests, include_flights=False,
+                                     airport_codes=None):
+    """
+    Generate a travel plan without blocking the event loop.
+
+    Args:
+        source (str): Departure location
+        destination (str): Travel destination
+        dates (str): Travel dates
+        budget (str): Budget for the trip
+        travelers (str): Number of travelers
+        interests (list): List of interests/preferences
+        include_flights (bool): Whether to include flight details
+        airport_codes (dict): Already resolved location -> airport code mapping (e.g. for a batch)
+
+    Returns:
+        dict: Generated travel plan, airport codes and per-stage timings in milliseconds
+    """
+    start = time.perf_counter()
+    timings = {}
+
+    result = await response_cache.get_or_compute_async(
+        plan_cache_key(source, destination, dates, budget, travelers, interests, include_flights),
+        lambda: _generate_travel_plan_async(
+            source, destination, dates, budget, travelers, interests, include_flights, compute_timings(timings),
+            airport_codes
+        ),
+        should_cache=lambda plan: is_complete_plan(plan, include_flights)
+    )
+
+    timings["total"] = elapsed_ms(start)
+    return dict(result, timings=timings)
+
+async def _generate_travel_plan_async(source, destination, dates, budget, travelers, interests, include_flights, timings,
+                                      airport_codes=None):
+    """Generate a travel plan without consulting the cache"""
+    airport_codes = airport_codes or {}
+    source_code, destination_code = await asyncio.gather(
+        _timed_async(timings, "source_airport", _known_or_lookup_async(airport_codes, source)),
+        _timed_async(timings, "destination_airport", _known_or_lookup_async(airport_codes, destination))
+    )
+
+    # Generate the itinerary and the flight section concurrently
+    itinerary = _timed_async(timings, "itinerary", generate_itinerary_async(
+        source, destination, dates, budget, travelers, interests, source_code, destination_code
+    ))
+    if include_flights and source_code and destination_code:
+        flights = _timed_async(
+            timings, "flights", get_flight_section_async(source_code, destination_code, dates)
+        )
+        travel_plan, flight_details = await asyncio.gather(itinerary, flights)
+    else:
+        travel_plan, flight_details = await itinerary, None
+
+    if flight_details:
+        # Combine flight details with travel plan
+        travel_plan = flight_details + "\n\n" + travel_plan
+
+    return {
+        "travel_plan": travel_plan,
+        "source_code": source_code,
+        "destination_code": destination_code,
+        "flight_details": flight_details if include_flights else None
+    }
+
+async def stream_travel_plan_async(source, destination, dates, budget, travelers, interests, include_flights=False):
+    """
+    Async version of gemini_api.stream_travel_plan().
+
+    Yields:
+        tuple: (event name, event payload dict)
+    """
+    cache_key = plan_cache_key(source, destination, dates, budget, travelers, interests, include_flights)
+    # A stale plan is refreshed in the background with the synchronous pipeline
+    cached = await asyncio.to_thread(
+        response_cache.get, cache_key,
+        lambda: gemini_api._generate_travel_plan(
+            source, destination, dates, budget, travelers, interests, include_flights, {}
+        ),
+        lambda plan: is_complete_plan(plan, include_flights)
+    )
+    if cached is not None:
+        yield "codes", {
+            "source_code": cached["source_code"],
+            "destination_code": cached["destination_code"]
+        }
+        if cached["flight_details"]:
+            yield "flights", {"flight_details": cached["flight_details"]}
+        yield "done", cached
+        return
+
+    source_code, destination_code = await asyncio.gather(
+        get_airport_code_async(source), get_airport_code_async(destination)
+    )
+
+    yield "codes", {
+        "source_code": source_code,
+        "destination_code": destination_code
+    }
+
+    # Generate the flight section in the background while the itinerary streams
+    flight_task = None
+    if include_flights and source_code and destination_code:
+        flight_task = asyncio.create_task(get_flight_section_async(source_code, destination_code, dates))
+
+    chunks = []
+    flight_details = None
+    flights_sent = False
+
+    try:
+        with observe_stage("itinerary_stream"):
+            async for text in stream_itinerary_async(
+                source, destination, dates, budget, travelers, interests, source_code, destination_code
+            ):
+                chunks.append(text)
+                yield "chunk", {"text": text}
+
+                if flight_task and not flights_sent and flight_task.done():
+                    flight_details = flight_task.result()
+                    flights_sent = True
+                    yield "flights", {"flight_details": flight_details}
+
+        if flight_task and not flights_sent:
+            flight_details = await flight_task
+            yield "flights", {"flight_details": flight_details}
+    finally:
+        if flight_task and not flight_task.done():
+            flight_task.cancel()
+
+    travel_plan = "".join(chunks)
+    if flight_details:
+        travel_plan = flight_details + "\n\n" + travel_plan
+
+    result = {
+        "travel_plan": travel_plan,
+        "source_code": source_code,
+        "destination_code": destination_code,
+        "flight_details": flight_details if include_flights else None
+    }
+    if is_complete_plan(result, include_flights):
+        await asyncio.to_thread(response_cache.set, cache_key, result)
+
+    yield "done", result
+
+async def generate_itinerary_async(source, destination, dates, budget, travelers, interests, source_code,
+                                   destination_code):
+    """Async version of gemini_api.generate_itinerary()"""
+    days = sectioned_itinerary_days(dates)
+    if days:
+        parts = [part async for part in iter_sectioned_itinerary_async(
+            source, destination, dates, budget, travelers, interests, source_code, destination_code, days
+        )]
+        return "".join(parts).strip()
+
+    prompt = build_travel_plan_prompt(
+        source, destination, dates, budget, travelers, interests, source_code, destination_code
+    )
+    response = await call_model_async("itinerary", prompt)
+    return response.text
+
+async def stream_itinerary_async(source, destination, dates, budget, travelers, interests, source_code,
+                                 destination_code):
+    """Async version of gemini_api.stream_itinerary()"""
+    days = sectioned_itinerary_days(dates)
+    if days:
+        async for part in iter_sectioned_itinerary_async(
+            source, destination, dates, budget, travelers, interests, source_code, destination_code, days
+        ):
+            yield part
+        return
+
+    prompt = build_travel_plan_prompt(
+        source, destination, dates, budget, travelers, interests, source_code, destination_code
+    )
+    async for text in stream_model_async("itinerary", prompt):
+        yield text
+
+async def iter_sectioned_itinerary_async(source, destination, dates, budget, travelers, interests, source_code,
+                                         destination_code, days):
+    """Async version of gemini_api.iter_sectioned_itinerary()"""
+    details = build_trip_details(
+        source, destination, dates, budget, travelers, interests, source_code, destination_code
+    )
+    response = await call_model_async(
+        "itinerary_skeleton", build_itinerary_skeleton_prompt(details, days), **output_budget(skeleton_tokens(days))
+    )
+    title, outline, overview = parse_itinerary_skeleton(response.text, destination)
+
+    day_calls, section_calls = sectioned_itinerary_calls(details, days, outline)
+    tasks = _fan_out_async([
+        lambda prompt=prompt, options=options: call_model_async("itinerary_section", prompt, **options)
+        for prompt, options, _ in day_calls + section_calls
+    ])
+    day_tasks, section_tasks = tasks[:len(day_calls)], tasks[len(day_calls):]
+
+    try:
+        yield title + "\n\n## Day-by-Day Itinerary\n\n"
+        for task in day_tasks:
+            yield format_itinerary_part((await task).text)
+        if overview:
+            yield overview + "\n\n"
+        for task, (_, _, heading) in zip(section_tasks, section_calls):
+            yield format_itinerary_part((await task).text, heading)
+    finally:
+        for task in day_tasks + section_tasks:
+            task.cancel()
+
+async def generate_multi_city_plan_async(source, cities, dates, budget, travelers, interests, include_flights=False,
+                                         optimize_order=True, round_trip=False):
+    """Async version of gemini_api.generate_multi_city_plan()"""
+    start = time.perf_counter()
+    timings = {}
+
+    result = await response_cache.get_or_compute_async(
+        multi_city_cache_key(
+            source, cities, dates, budget, travelers, interests, include_flights, optimize_order, round_trip
+        ),
+        lambda: _generate_multi_city_plan_async(
+            source, cities, dates, budget, travelers, interests, include_flights, optimize_order, round_trip,
+            compute_timings(timings)
+        ),
+        should_cache=lambda plan: is_complete_plan(plan, include_flights)
+    )
+
+    timings["total"] = elapsed_ms(start)
+    return dict(result, timings=timings)
+
+async def _generate_multi_city_plan_async(source, cities, dates, budget, travelers, interests, include_flights,
+                                          optimize_order, round_trip, timings):
+    """Generate a multi-city travel plan without consulting the cache"""
+    codes = await _timed_async(timings, "airports", get_airport_codes_async([source, *cities]))
+    start = time.perf_counter()
+    route = plan_multi_city_route(source, cities, codes, dates, optimize_order, round_trip)
+    timings["routing"] = elapsed_ms(start)
+
+    start = time.perf_counter()
+    city_calls = [
+        lambda prompt=prompt, options=options: call_model_async("itinerary_section", prompt, **options)
+        for prompt, options in multi_city_calls(route, budget, travelers, interests)
+    ]
+    flight_calls = [lambda leg=leg: get_leg_flight_section_async(leg) for leg in route['legs']] if include_flights else []
+    tasks = _fan_out_async(city_calls + flight_calls)
+    city_tasks, flight_tasks = tasks[:len(city_calls)], tasks[len(city_calls):]
+    try:
+        city_sections = [(await task).text for task in city_tasks]
+        flight_sections = [await task for task in flight_tasks]
+    finally:
+        for task in city_tasks + flight_tasks:
+            task.cancel()
+    timings["sections"] = elapsed_ms(start)
+
+    return assemble_multi_city_plan(source, route, city_sections, flight_sections, include_flights)
+
+async def get_leg_flight_section_async(leg):
+    """Async version of gemini_api.get_leg_flight_section()"""
+    if not leg['from_code'] or not leg['to_code']:
+        return None
+    flight_data = await get_flight_details_async(leg['from_code'], leg['to_code'], leg['date'])
+    return format_flight_section(flight_data, leg['from_code'], leg['to_code'])
+
+async def get_flight_section_async(source_code, destination_code, dates):
+    """Generate the Markdown flight section for a route"""
+    flight_data = await get_flight_details_async(source_code, destination_code, extract_travel_date(dates))
+    return format_flight_section(flight_data, source_code, destination_code)
+
+async def _known_or_lookup_async(airport_codes, location):
+    if location in airport_codes:
+        return airport_codes[location]
+    return await get_airport_code_async(location)
+
+async def get_airport_code_async(location):
+    """
+    Convert a location name to its airport code, asking Gemini only when the index misses.
+
+    Returns:
+        str: 3-letter IATA airport code or None if not found
+    """
+    airport_index = get_airport_index()
+    with observe_stage("airport_index"):
+        airport_code = airport_index.lookup(location)
+    if airport_code:
+        return airport_code
+
+    airport_code = await response_cache.get_or_compute_async(
+        airport_cache_key(location), lambda: _generate_airport_code_async(location), should_cache=bool
+    )
+    if airport_code:
+        airport_index.remember(location, airport_code)
+    return airport_code
+
+async def _generate_airport_code_async(location):
+    """Ask Gemini for a location's airport code without consulting the caches"""
+    try:
+        response = await call_model_async(
+            "airport", build_airport_code_prompt(location), priority=PRIORITY_AIRPORT, expected_output_tokens=16
+        )
+        return parse_airport_code(response.text)
+    except (SchedulerOverloaded, RateLimitError):
+        raise
+    except Exception as e:
+        print(f"Error getting airport code: {e}")
+        return None
+
+async def get_airport_codes_async(locations):
+    """
+    Convert many location names to airport codes, asking Gemini about all index
+    misses in one structured prompt (see gemini_api.get_airport_codes).
+
+    Returns:
+        dict: Each given location -> 3-letter IATA airport code, or None if not found
+    """
+    codes, pending = await asyncio.to_thread(_index_airport_codes, locations)
+    for attempt in range(AIRPORT_BATCH_ATTEMPTS):
+        retry = {}
+        for batch in _airport_batches(pending):
+            try:
+                response = await call_model_async(
+                    "airport", build_airport_codes_prompt(list(batch.values())), priority=PRIORITY_AIRPORT,
+                    expected_output_tokens=16 * len(batch), response_schema=AIRPORT_CODES_SCHEMA
+                )
+                answers = parse_airport_codes(response.text, len(batch))
+            except (SchedulerOverloaded, RateLimitError):
+                raise
+            except Exception as e:
+                print(f"Error getting airport codes: {e}")
+                answers = {}
+            retry.update(await asyncio.to_thread(_apply_airport_codes, codes, batch, answers))
+        pending = retry
+    return {location: codes.get(normalize_location(location)) for location in locations}
+
+async def get_flight_details_async(source_code, destination_code, date):
+    """
+    Generate flight details, served from the response cache when possible.
+
+    Returns:
+        dict: Flight details, or a dict with an 'error' key on failure
+    """
+    return await response_cache.get_or_compute_async(
+        flights_cache_key(source_code, destination_code, date),
+        lambda: _generate_flight_details_async(source_code, destination_code, date),
+        should_cache=lambda flight_data: 'error' not in flight_data and not flight_data.get('partial')
+    )
+
+async def _generate_flight_details_async(source_code, destination_code, date):
+    """Generate flight details without consulting the cache"""
+    try:
+        response = await call_model_async(
+            "flights", build_flight_details_prompt(source_code, destination_code, date), **flight_output_options()
+        )
+        return parse_flight_details(response.text)
+    except Exception as e:
+        print(f"Error generating flight data: {e}")
+        return {
+            'error': f"Error generating flight data: {str(e)}"
+        }
+
+async def get_destination_recommendations_async(interests, budget, dates, travelers, shortlist=None):
+    """
+    Get destination recommendations for the catalog's top destinations, served from
+    the response cache or the similarity cache when possible.
+
+    Returns:
+        str: Destination recommendations
+    """
+    if shortlist is None:
+        shortlist = shortlist_destinations(interests, budget, dates, travelers)
+    return await response_cache.get_or_compute_async(
+        recommendations_cache_key(interests, budget, dates, travelers),
+        lambda: _similar_or_generate_recommendations_async(interests, budget, dates, travelers, shortlist)
+    )
+
+async def stream_destination_recommendations_async(interests, budget, dates, travelers):
+    """Async version of gemini_api.stream_destination_recommendations()"""
+    shortlist = shortlist_destinations(interests, budget, dates, travelers)
+    yield "shortlist", {'shortlist': shortlist}
+    recommendations = await get_destination_recommendations_async(interests, budget, dates, travelers, shortlist)
+    yield "done", {'recommendations': recommendations, 'shortlist': shortlist}
+
+async def _similar_or_generate_recommendations_async(interests, budget, dates, travelers, shortlist):
+    """
+    Reuse the recommendations of a near-identical earlier request that covers only
+    destinations in this request's shortlist, or write up its top candidates
+    """
+    candidates = shortlist[:RECOMMENDATION_TOP_K]
+    features = recommendation_features(interests, budget, dates, travelers, candidates)
+    shown = [destination['name'] for destination in shortlist]
+    # In a worker thread: the first lookup loads the saved index and adds periodically save it
+    with observe_stage("semantic_lookup"):
+        recommendations = await asyncio.to_thread(semantic_cache.lookup, features, shown)
+    if recommendations is None:
+        recommendations = await _generate_destination_recommendations_async(
+            interests, budget, dates, travelers, candidates
+        )
+        await asyncio.to_thread(semantic_cache.add, features, recommendations)
+    return recommendations
+
+async def _generate_destination_recommendations_async(interests, budget, dates, travelers, candidates):
+    """Generate destination recommendations without consulting the cache"""
+    response = await call_model_async(
+        "recommendations", build_recommendations_prompt(interests, budget, dates, travelers, candidates),
+        **recommendation_output_options(candidates)
+    )
+    return response.text
+
+async def call_model_async(stage, prompt, **kwargs):
+    """Async version of gemini_api.call_model()"""
+    with observe_stage(stage):
+        try:
+            response = await stages[stage].call_async(
+                lambda: gemini_api.model.generate_content_async(prompt, **kwargs)
+            )
+        except Exception as e:
+            record_model_error(stage, e)
+            raise
+    record_model_response(stage, prompt, response)
+    return response
+
+def _fan_out_async(calls, limit=ITINERARY_SECTIONS_IN_FLIGHT):
+    """
+    Async version of gemini_api._fan_out(): `calls` create the coroutines, and at
+    most `limit` of them run at a time, started in the given order.
+
+    Returns:
+        list: A task per call, in call order
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(call):
+        async with semaphore:
+            return await call()
+    return [asyncio.create_task(run(call)) for call in calls]
+
+async def stream_model_async(stage, prompt, **kwargs):
+    """Async version of gemini_api.stream_model()"""
+    try:
+        async for chunk in stages[stage].stream_async(
+            lambda: gemini_api.model.generate_content_async(prompt, stream=True, **kwargs)
+        ):
+            yield chunk.text
+    except Exception as e:
+        record_model_error(stage, e)
+        raise
+
+async def _timed_async(timings, stage, awaitable):
+    """Await a coroutine and record its wall time in milliseconds under timings[stage]"""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = elapsed_ms(start)
@@ -0,0 +1,222 @@
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cache import plan_cache_key
+from scheduler import priority_scope, PRIORITY_BULK
+from gemini_api import generate_travel_plan, get_airport_codes
+from async_api import generate_travel_plan_async, get_airport_codes_async
+from plans import with_plan_id
+
+# Bulk plan generation for lists of trips (group tours, corporate travel batches).
+# Identical trips are generated once and every distinct location is resolved once
+# for the whole batch. Generations run with a per-batch concurrency cap on their
+# own threads (not gemini_api's executor, which the generations themselves use),
+# at bulk priority, so interactive users keep their share of the model quota.
+# Locations the airport index doesn't know are resolved in one batched prompt.
+# Results are yielded in completion order with per-trip errors.
+
+BATCH_MAX_TRIPS = int(os.getenv("BATCH_MAX_TRIPS", 100))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 16))
+
+TRIP_FIELDS = ('source', 'destination', 'dates', 'budget', 'travelers', 'interests', 'include_flights')
+TEXT_FIELDS = ('source', 'destination', 'dates')
+# Fields that may also be given as numbers ("travelers": 2)
+NUMBER_FIELDS = ('budget', 'travelers')
+
+
+class BatchError(ValueError):
+    """Raised when a batch as a whole is invalid (not a list, too large, bad concurrency)"""
+
+
+def _check_batch(trips, concurrency):
+    """Validate the batch itself; individual trips are validated as they are processed"""
+    if not isinstance(trips, list) or not trips:
+        raise BatchError("'trips' must be a non-empty list")
+    if len(trips) > BATCH_MAX_TRIPS:
+        raise BatchError(f"A batch may contain at most {BATCH_MAX_TRIPS} trips")
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+        raise BatchError("'concurrency' must be a positive integer")
+    return min(concurrency, BATCH_MAX_CONCURRENCY)
+
+
+def _trip_error(trip):
+    """Return why a trip spec is invalid, or None"""
+    if not isinstance(trip, dict):
+        return "Trip must be an object"
+    if not all(trip.get(field) for field in TEXT_FIELDS + NUMBER_FIELDS) or not trip.get('interests'):
+        return "Missing required fields"
+    for field in TEXT_FIELDS:
+        if not isinstance(trip[field], str):
+            return f"'{field}' must be a string"
+    for field in NUMBER_FIELDS:
+        if isinstance(trip[field], bool) or not isinstance(trip[field], (str, int, float)):
+            return f"'{field}' must be a string or a number"
+    interests = trip['interests']
+    if not isinstance(interests, list) or not all(isinstance(interest, str) for interest in interests):
+        return "'interests' must be a list of strings"
+    if not isinstance(trip.get('include_flights', False), bool):
+        return "'include_flights' must be a boolean"
+    return None
+
+
+def _trip_args(trip):
+    """generate_travel_plan() arguments for a valid trip spec"""
+    args = {field: trip.get(field, False if field == 'include_flights' else '') for field in TRIP_FIELDS}
+    for field in NUMBER_FIELDS:
+        args[field] = str(args[field])
+    return args
+
+
+def _group_trips(trips):
+    """
+    Split a batch into invalid trips, distinct trips and the locations they use.
+
+    Returns:
+        tuple: ({index: error}, {cache key: (trip args, [indices])}, [locations])
+    """
+    invalid = {}
+    groups = {}
+    locations = []
+    for index, trip in enumerate(trips):
+        error = _trip_error(trip)
+        if error:
+            invalid[index] = error
+            continue
+        args = _trip_args(trip)
+        try:
+            key = plan_cache_key(**args)
+        except (TypeError, ValueError) as e:
+            # Anything validation missed fails this trip only, not the batch
+            invalid[index] = f"Invalid trip: {e}"
+            continue
+        if key in groups:
+            groups[key][1].append(index)
+        else:
+            groups[key] = (args, [index])
+        locations += [args['source'], args['destination']]
+    return invalid, groups, locations
+
+
+def _item(trips, index, result=None, error=None):
+    """One line of batch output"""
+    item = {'index': index}
+    trip = trips[index]
+    if isinstance(trip, dict) and 'id' in trip:
+        item['id'] = trip['id']
+    if error is None:
+        item.update(success=True, **result)
+    else:
+        item.update(success=False, error=str(error))
+        if getattr(error, 'retry_after', None):
+            item['retry_after'] = error.retry_after
+    return item
+
+
+def _lookup_locations(locations):
+    """Resolve all locations at once; on failure each trip looks up its own"""
+    try:
+        return get_airport_codes(locations)
+    except Exception as e:
+        print(f"Error getting airport codes: {e}")
+        return {}
+
+
+def _generate_and_store(**kwargs):
+    """Generate a plan and store it, so each item carries a plan_id"""
+    return with_plan_id(generate_travel_plan(**kwargs))
+
+
+def generate_travel_plans(trips, concurrency=BATCH_CONCURRENCY):
+    """
+    Generate travel plans for a batch of trips.
+
+    Args:
+        trips (list): Trip specs with the /api/generate-plan fields, plus an optional
+                      'id' that is echoed back
+        concurrency (int): Maximum generations in flight (capped by BATCH_MAX_CONCURRENCY)
+
+    Returns:
+        generator: One dict per trip in completion order, with 'index', 'success' and
+                   either the plan fields or 'error'
+
+    Raises:
+        BatchError: If the batch itself is invalid (raised before anything is generated)
+    """
+    concurrency = _check_batch(trips, concurrency)
+    return _generate_travel_plans(trips, concurrency)
+
+
+def _generate_travel_plans(trips, concurrency):
+    invalid, groups, locations = _group_trips(trips)
+    for index, error in invalid.items():
+        yield _item(trips, index, error=error)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+
+    def submit(func, *args, **kwargs):
+        return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+    try:
+        with priority_scope(PRIORITY_BULK):
+            airport_codes = _lookup_locations(locations)
+            futures = {
+                submit(_generate_and_store, airport_codes=airport_codes, **args): indices
+                for args, indices in groups.values()
+            }
+
+        for future in as_completed(futures):
+            error = future.exception()
+            for index in futures[future]:
+                yield _item(trips, index, future.result() if error is None else None, error)
+    finally:
+        # Stop queued generations if the consumer goes away (e.g. the client disconnected)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def generate_travel_plans_async(trips, concurrency=BATCH_CONCURRENCY):
+    """
+    Async version of generate_travel_plans(), for the ASGI app.
+
+    Returns:
+        async generator: One dict per trip in completion order
+
+    Raises:
+        BatchError: If the batch itself is invalid
+    """
+    concurrency = _check_batch(trips, concurrency)
+    return _generate_travel_plans_async(trips, concurrency)
+
+
+async def _generate_travel_plans_async(trips, concurrency):
+    invalid, groups, locations = _group_trips(trips)
+    for index, error in invalid.items():
+        yield _item(trips, index, error=error)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(args, indices):
+        async with semaphore:
+            try:
+                result = await generate_travel_plan_async(airport_codes=airport_codes, **args)
+                result = await asyncio.to_thread(with_plan_id, result)
+            except Exception as e:
+                return [_item(trips, index, error=e) for index in indices]
+            return [_item(trips, index, result) for index in indices]
+
+    with priority_scope(PRIORITY_BULK):
+        try:
+            airport_codes = await get_airport_codes_async(locations)
+        except Exception as e:
+            print(f"Error getting airport codes: {e}")
+            airport_codes = {}
+        tasks = [asyncio.ensure_future(generate(args, indices)) for args, indices in groups.values()]
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for item in await next_done:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
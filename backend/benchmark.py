@@ -0,0 +1,456 @@
+"""
+Load-testing benchmark for the Travel Planner API.
+
+Drives /api/generate-plan, /api/recommend-destinations and /api/get-airport-code
+at a fixed concurrency and reports throughput and p50/p95/p99 latency.
+
+Without --url the Flask app is started in-process on a free local port with the
+offline stub model backend, so the benchmark measures our own overhead and never
+touches the Gemini API:
+
+    python benchmark.py --concurrency 16 --requests 200
+    STUB_LATENCY_MS=800 python benchmark.py --endpoint plan
+    python benchmark.py --url http://localhost:5000 --endpoint airport
+
+--cold-start N instead starts the app N times in a fresh process and reports the
+time until /healthz answers, the first API response and /readyz turning ready:
+
+    MODEL_BACKEND=gemini python benchmark.py --cold-start 5
+
+--semantic-index N fills the recommendations similarity cache with N synthetic
+requests and reports the latency of nearest-neighbour lookups:
+
+    python benchmark.py --semantic-index 100000
+
+--dates checks the travel dates parser against the expressions in
+data/travel_dates_corpus.jsonl and reports its accuracy and parse latency:
+
+    python benchmark.py --dates
+
+--routing N orders N random cities from the bundled airport dataset for a
+multi-city trip and reports the routing latency and how far the route is from
+the shortest one (checked exhaustively for N <= 8):
+
+    python benchmark.py --routing 12
+
+--log replays the plan and recommendation requests of request logs (see
+REQUEST_LOG_PATH). With the model calls recorded to cassettes
+(MODEL_CASSETTE_MODE=record) and replayed at zero latency, it measures our
+own overhead on real traffic without network access; --max-p95-ms turns it
+into a regression check:
+
+    MODEL_CASSETTE_MODE=replay MODEL_REPLAY_LATENCY=zero python benchmark.py --log requests.jsonl --max-p95-ms 50
+"""
+import os
+import sys
+import json
+import math
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import tempfile
+import random
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CITIES = ["New York", "Paris", "Tokyo", "London", "Rome", "Barcelona", "Sydney", "Bangkok",
+          "Lisbon", "Cape Town", "Mexico City", "Reykjavik", "Springfield", "Atlantis"]
+INTERESTS = ["food", "history", "art", "nature", "nightlife", "beach", "hiking", "shopping"]
+
+ENDPOINTS = {
+    'plan': '/api/generate-plan',
+    'recommend': '/api/recommend-destinations',
+    'airport': '/api/get-airport-code',
+}
+
+
+def make_payload(endpoint, i, unique=True):
+    """Build the i-th request body for an endpoint; unique bodies defeat the response cache"""
+    n = i if unique else 0
+    if endpoint == 'plan':
+        return {
+            "source": CITIES[n % len(CITIES)],
+            "destination": CITIES[(n + 1) % len(CITIES)],
+            "dates": "June 10-20, 2025",
+            "budget": f"${2000 + n}",
+            "travelers": "2",
+            "interests": [INTERESTS[n % len(INTERESTS)], INTERESTS[(n + 3) % len(INTERESTS)]],
+            "include_flights": True,
+        }
+    if endpoint == 'recommend':
+        return {
+            "interests": [INTERESTS[n % len(INTERESTS)]],
+            "budget": f"${1500 + n}",
+            "dates": "August 5-15, 2025",
+            "travelers": "2",
+        }
+    return {"location": CITIES[n % len(CITIES)] + (f" {n}" if unique else "")}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def run_endpoint(base_url, endpoint, total, concurrency, unique=True, first=0, payloads=None):
+    """
+    Send `total` requests to one endpoint with `concurrency` workers.
+
+    Request bodies are numbered from `first`, so warm-up runs can use bodies
+    that the measured run won't repeat. `payloads` sends these bodies in order
+    instead of generated ones.
+
+    Returns:
+        dict: Throughput, latency percentiles (ms) and status counts
+    """
+    local = threading.local()
+    url = base_url.rstrip('/') + ENDPOINTS[endpoint]
+
+    def send(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            body = payloads[i % len(payloads)] if payloads else make_payload(endpoint, i, unique)
+            status = session.post(url, json=body, timeout=300).status_code
+        except requests.RequestException:
+            status = 'error'
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(first, first + total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        'endpoint': ENDPOINTS[endpoint],
+        'requests': total,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        'statuses': statuses,
+    }
+
+
+def start_local_server(port=0, background=True):
+    """
+    Start the Flask app with the stub model backend (unless MODEL_BACKEND is set),
+    caches and the plan store off and a throwaway job queue.
+
+    Args:
+        port (int): Port to listen on (0 picks a free one)
+        background (bool): Serve from a daemon thread instead of blocking
+
+    Returns:
+        str: Base URL of the local server
+    """
+    os.environ.setdefault("MODEL_BACKEND", "stub")
+    os.environ.setdefault("RESPONSE_CACHE_PATH", "")
+    os.environ.setdefault("SEMANTIC_CACHE_PATH", "")
+    # Keep stub plans out of the real plan store and the stub server away from the real job queue
+    os.environ.setdefault("PLAN_STORE_PATH", "")
+    os.environ.setdefault("JOB_WORKERS", "0")
+    if "JOB_QUEUE_PATH" not in os.environ:
+        os.environ["JOB_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="benchmark-jobs-"), 'jobs.sqlite3')
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+
+    # Keep per-request access logs out of the report
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    if not background:
+        server.serve_forever()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def _wait_for(url, deadline, status=200, method='GET', json_body=None):
+    """Poll url until it answers with `status`; return the seconds since the epoch it did"""
+    while time.time() < deadline:
+        try:
+            response = requests.request(method, url, json=json_body, timeout=5)
+            if response.status_code == status:
+                return time.time()
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{url} did not answer {status} in time")
+
+
+def measure_cold_start(timeout=60):
+    """
+    Start the app in a new process and time its startup.
+
+    Returns:
+        dict: Milliseconds from process launch to /healthz, the first airport lookup and /readyz
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    launched = time.time()
+    process = subprocess.Popen(
+        [sys.executable, '-c', f"import benchmark; benchmark.start_local_server({port}, background=False)"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL
+    )
+    try:
+        deadline = launched + timeout
+        healthy = _wait_for(base_url + '/healthz', deadline)
+        first_response = _wait_for(base_url + ENDPOINTS['airport'], deadline, method='POST',
+                                   json_body=make_payload('airport', 0, unique=False))
+        ready = _wait_for(base_url + '/readyz', deadline)
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        'healthz_ms': round((healthy - launched) * 1000, 1),
+        'first_response_ms': round((first_response - launched) * 1000, 1),
+        'readyz_ms': round((ready - launched) * 1000, 1),
+    }
+
+
+def measure_semantic_index(entries, lookups=2000, seed=1):
+    """
+    Time similarity cache lookups over an index of `entries` synthetic requests,
+    all for the same month (the worst case for partitioning).
+
+    Returns:
+        dict: Index size, hit ratio and lookup latency percentiles in milliseconds
+    """
+    from semantic_cache import SemanticCache, recommendation_features
+
+    rng = random.Random(seed)
+
+    def request():
+        return (rng.sample(INTERESTS, rng.randint(1, 4)), f"${rng.randrange(500, 20000, 50)}",
+                "August 5-15, 2025", rng.choice(["1", "2", "2", "2", "3", "4", "6"]))
+
+    index = SemanticCache(path='', max_entries=entries)
+    for i in range(entries):
+        index.add(recommendation_features(*request()), f"recommendations {i}")
+
+    queries = [recommendation_features(*request()) for _ in range(lookups)]
+    latencies = []
+    for features in queries:
+        start = time.perf_counter()
+        index.lookup(features)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'entries': entries,
+        'hit_ratio': index.stats()['hit_ratio'],
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+    }
+
+
+def measure_date_parsing(path=None, rounds=20):
+    """
+    Check the travel dates parser against a corpus of expressions with their
+    expected start, end and length, and time parsing each one (bypassing the
+    parser's memo, so every parse does the full work).
+
+    Returns:
+        dict: Corpus size, mismatches and parse latency percentiles in microseconds
+    """
+    from datetime import date
+    from travel_dates import TravelDates, parse_travel_dates, normalize_date_text, _parse
+
+    path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'travel_dates_corpus.jsonl')
+    with open(path, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    mismatches = []
+    for case in corpus:
+        today = date.fromisoformat(case['today'])
+        parsed = parse_travel_dates(case['text'], today) or TravelDates(None, None, None)
+        got = {'start': parsed.start and parsed.start.isoformat(), 'end': parsed.end and parsed.end.isoformat(),
+               'days': parsed.days}
+        if got != {key: case[key] for key in got}:
+            mismatches.append({'text': case['text'], 'got': got})
+
+    latencies = []
+    for _ in range(rounds):
+        for case in corpus:
+            today = date.fromisoformat(case['today'])
+            start = time.perf_counter()
+            _parse.__wrapped__(normalize_date_text(case['text']), today)
+            latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return {
+        'expressions': len(corpus),
+        'mismatches': mismatches,
+        'p50_us': round(percentile(latencies, 50), 1),
+        'p99_us': round(percentile(latencies, 99), 1),
+        'max_us': round(latencies[-1], 1),
+    }
+
+
+def measure_routing(stops, trials=200, seed=1):
+    """
+    Time ordering `stops` random airports for a multi-city trip from a random
+    origin, and compare the routes with the shortest ones where that is cheap
+    to compute.
+
+    Returns:
+        dict: Stops, routing latency percentiles in milliseconds and, for up to 8
+              stops, the mean and worst excess length over the shortest route in percent
+    """
+    import csv
+    import itertools
+    from airports import AIRPORTS_CSV
+    from routing import distance_matrix, order_stops, route_length
+
+    rng = random.Random(seed)
+    with open(AIRPORTS_CSV, newline='', encoding='utf-8') as f:
+        points = [(float(row['latitude']), float(row['longitude'])) for row in csv.DictReader(f)]
+
+    latencies, excess = [], []
+    for _ in range(trials):
+        origin, *cities = rng.sample(points, stops + 1)
+        start = time.perf_counter()
+        order = order_stops(origin, cities)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if stops <= 8:
+            distances = distance_matrix([origin, *cities]).tolist()
+            length = route_length([0] + [index + 1 for index in order], distances)
+            best = min(route_length([0, *route], distances) for route in itertools.permutations(range(1, stops + 1)))
+            excess.append((length / best - 1) * 100)
+    latencies.sort()
+    result = {
+        'stops': stops,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+    }
+    if excess:
+        result['mean_excess_pct'] = round(statistics.mean(excess), 2)
+        result['max_excess_pct'] = round(max(excess), 2)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Base URL of a running server (default: start one in-process with the stub backend)")
+    parser.add_argument('--endpoint', choices=[*ENDPOINTS, 'all'], default='all')
+    parser.add_argument('--requests', type=int, default=100, help="Requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per endpoint")
+    parser.add_argument('--duplicates', action='store_true', help="Send identical bodies (measures cache hits)")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--log', nargs='+', metavar='PATH',
+                        help="Replay the plan and recommendation requests in these request logs, once each")
+    parser.add_argument('--max-p95-ms', type=float, metavar='MS',
+                        help="Exit with status 1 if any endpoint's p95 exceeds MS or any request fails")
+    parser.add_argument('--cold-start', type=int, metavar='N', help="Measure startup time over N fresh processes")
+    parser.add_argument('--semantic-index', type=int, metavar='N',
+                        help="Measure similarity cache lookups over an index of N entries")
+    parser.add_argument('--dates', action='store_true',
+                        help="Check the travel dates parser against its corpus and measure parse latency")
+    parser.add_argument('--routing', type=int, metavar='N',
+                        help="Measure multi-city route ordering for N cities")
+    args = parser.parse_args(argv)
+
+    if args.routing:
+        result = measure_routing(args.routing)
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            print("multi-city routing: " + ", ".join(f"{k}={v}" for k, v in result.items()))
+        return 0
+
+    if args.dates:
+        result = measure_date_parsing()
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            for mismatch in result['mismatches']:
+                print(f"mismatch: {mismatch['text']!r} parsed as {mismatch['got']}")
+            print(f"travel dates: {result['expressions'] - len(result['mismatches'])}/{result['expressions']} correct, "
+                  f"p50={result['p50_us']}us, p99={result['p99_us']}us, max={result['max_us']}us")
+        return 1 if result['mismatches'] else 0
+
+    if args.semantic_index:
+        result = measure_semantic_index(args.semantic_index)
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            print("similarity cache lookups: " + ", ".join(f"{k}={v}" for k, v in result.items()))
+        return 0
+
+    if args.cold_start:
+        runs = [measure_cold_start() for _ in range(args.cold_start)]
+        summary = {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+        if args.json:
+            print(json.dumps({'runs': runs, 'median': summary}, indent=2))
+        else:
+            print(f"cold start over {len(runs)} runs (median ms): " + ", ".join(f"{k}={v}" for k, v in summary.items()))
+        return 0
+
+    if not args.duplicates:
+        # Unique bodies are meant to miss every cache, including the similarity cache
+        os.environ.setdefault("SEMANTIC_CACHE_MAX_ENTRIES", "0")
+    base_url = args.url or start_local_server()
+    endpoints = list(ENDPOINTS) if args.endpoint == 'all' else [args.endpoint]
+
+    logged = {}
+    if args.log:
+        # Imported after the server has set up its environment (prewarm loads the response cache)
+        from prewarm import load_requests
+        for kind, payload in load_requests(args.log):
+            logged.setdefault(kind, []).append(payload)
+        endpoints = [endpoint for endpoint in endpoints if logged.get(endpoint)]
+
+    results = []
+    for endpoint in endpoints:
+        if endpoint in logged:
+            payloads = logged[endpoint]
+            results.append(run_endpoint(base_url, endpoint, len(payloads), args.concurrency, payloads=payloads))
+            continue
+        if args.warmup:
+            run_endpoint(base_url, endpoint, args.warmup, min(args.warmup, args.concurrency),
+                         not args.duplicates, first=args.requests)
+        results.append(run_endpoint(base_url, endpoint, args.requests, args.concurrency, not args.duplicates))
+
+    failed = []
+    if args.max_p95_ms is not None:
+        failed = [r['endpoint'] for r in results
+                  if r['p95_ms'] > args.max_p95_ms or set(r['statuses']) != {'200'}]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 1 if failed else 0
+
+    print(f"{'endpoint':<28}{'reqs':>6}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+    for r in results:
+        print(f"{r['endpoint']:<28}{r['requests']:>6}{r['concurrency']:>6}{r['throughput_rps']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}  {r['statuses']}")
+    if failed:
+        print(f"over the {args.max_p95_ms} ms p95 budget or with failed requests: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,814 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import uuid
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from airports import normalize_location
+from scheduler import priority_scope, PRIORITY_BULK
+from travel_dates import parse_travel_dates
+
+# Cache configuration
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(CACHE_DIR, 'responses.sqlite3'))
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+# The disk tier is shared by every worker process on the host. It is kept under
+# this size by evicting the least recently used entries.
+CACHE_MAX_DISK_MB = float(os.getenv("RESPONSE_CACHE_MAX_DISK_MB", 512))
+# A process generating a key holds a lease on it, so other processes wait for its
+# result instead of generating the same response. Leases of crashed processes expire.
+CACHE_LEASE_SECONDS = float(os.getenv("RESPONSE_CACHE_LEASE_SECONDS", 120))
+CACHE_LEASE_POLL_SECONDS = float(os.getenv("RESPONSE_CACHE_LEASE_POLL_SECONDS", 0.1))
+# Stale-while-revalidate: for this long after its TTL, an entry in the disk tier is
+# still served immediately while a background refresh regenerates it (0 disables)
+CACHE_STALE_SECONDS = float(os.getenv("RESPONSE_CACHE_STALE_SECONDS", 7 * 24 * 60 * 60))
+CACHE_REFRESH_WORKERS = int(os.getenv("RESPONSE_CACHE_REFRESH_WORKERS", 2))
+
+CURRENCY_SYMBOLS = {'$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '₹': 'INR'}
+CURRENCY_WORDS = {
+    'usd': 'USD', 'dollar': 'USD', 'dollars': 'USD', 'bucks': 'USD',
+    'eur': 'EUR', 'euro': 'EUR', 'euros': 'EUR',
+    'gbp': 'GBP', 'pound': 'GBP', 'pounds': 'GBP',
+    'jpy': 'JPY', 'yen': 'JPY',
+    'inr': 'INR', 'rupee': 'INR', 'rupees': 'INR',
+    'cad': 'CAD', 'aud': 'AUD', 'chf': 'CHF',
+}
+# Currency assumed for a budget given as a bare amount ("3000", "3k")
+BUDGET_DEFAULT_CURRENCY = os.getenv("BUDGET_DEFAULT_CURRENCY", "USD")
+
+_CURRENCY_WORD = '|'.join(sorted(CURRENCY_WORDS, key=len, reverse=True))
+BUDGET_PATTERN = re.compile(
+    rf"(?:(?P<symbol>[{''.join(CURRENCY_SYMBOLS)}])|(?P<prefix>{_CURRENCY_WORD})\s*)?"
+    r"(?P<amount>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)\s*(?P<k>k)?"
+    rf"(?:\s*(?P<suffix>{_CURRENCY_WORD}))?"
+)
+PER_PERSON_PATTERN = re.compile(r'\b(?:per (?:person|head|travell?er|adult)|each|pp|a head)\b')
+TRAVELERS_PATTERN = re.compile(r'(\d+)(?:\s*(?:people|persons?|travell?ers?|adults?|pax|guests?))?')
+
+# ---------------------------------------------------------------------------
+# Request normalization
+# ---------------------------------------------------------------------------
+
+def normalize_text(text):
+    """Lowercase, trim and collapse whitespace"""
+    return ' '.join(str(text).lower().split())
+
+def normalize_interests(interests):
+    """Normalize, deduplicate and sort a list of interests"""
+    return sorted({normalize_text(interest) for interest in interests if str(interest).strip()})
+
+def _currency(text):
+    """Currency code of the first currency symbol or word in normalized text, or ''"""
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in text:
+            return code
+    for word in re.findall(r'[a-z]+', text):
+        if word in CURRENCY_WORDS:
+            return CURRENCY_WORDS[word]
+    return ''
+
+def _amount(number, thousands):
+    """Amount from a matched number and "k" suffix, formatted without float noise"""
+    amount = float(number.replace(',', '')) * (1000 if thousands else 1)
+    return f"{amount:.2f}".rstrip('0').rstrip('.')
+
+def normalize_budget(budget):
+    """
+    Normalize a budget string so that "$3000", "3,000 USD" and "3k" match.
+
+    Only a budget that is nothing but an amount and a currency is canonicalized. A
+    bare amount is taken to be in BUDGET_DEFAULT_CURRENCY. Anything else ("$3000 per
+    person", "$2000-3000") keeps its wording, since it changes what is being asked.
+
+    Args:
+        budget (str): Budget as entered by the user
+
+    Returns:
+        str: Canonical budget such as "3000 USD", or the normalized text
+    """
+    text = normalize_text(budget)
+    match = BUDGET_PATTERN.fullmatch(text)
+    if not match or (match.group('symbol') or match.group('prefix')) and match.group('suffix'):
+        return text
+    currency = match.group('symbol') or match.group('prefix') or match.group('suffix')
+    currency = _currency(currency) if currency else BUDGET_DEFAULT_CURRENCY
+    return f"{_amount(match.group('amount'), match.group('k'))} {currency}"
+
+def parse_budget(budget):
+    """
+    Read an amount out of any budget string, for scoring rather than cache keys:
+    "$2000-3000" gives its lower bound and "$3000 per person" its amount.
+
+    Returns:
+        tuple: (amount, currency code, whether the amount is per person), or None if
+               the budget has no amount
+    """
+    text = normalize_text(budget)
+    match = re.search(r'(\d[\d,]*(?:\.\d+)?)\s*(k)?\b', text)
+    if not match:
+        return None
+    amount = float(_amount(match.group(1), match.group(2)))
+    return amount, _currency(text) or BUDGET_DEFAULT_CURRENCY, bool(PER_PERSON_PATTERN.search(text))
+
+def normalize_travelers(travelers):
+    """
+    Normalize a party size so that "2", "2 people" and "2 travelers" match. A party
+    described in parts ("2 adults, 2 kids") keeps its wording.
+
+    Returns:
+        int | str: Number of travelers, or the normalized text
+    """
+    text = normalize_text(travelers)
+    match = TRAVELERS_PATTERN.fullmatch(text)
+    return int(match.group(1)) if match else text
+
+def traveler_count(travelers):
+    """Total number of travelers in any party description ("2 adults + 1 infant" is 3), or None"""
+    counts = [int(count) for count in re.findall(r'\d+', str(travelers))]
+    return sum(counts) or None
+
+def normalize_dates(dates):
+    """
+    Normalize a travel dates string so that "June 10-20", "10-20 June" and
+    "06/10 - 06/20" match.
+
+    Returns:
+        str: Canonical range such as "2025-06-10..2025-06-20", or the normalized text
+             if the dates cannot be parsed
+    """
+    travel_dates = parse_travel_dates(dates)
+    return travel_dates.key() if travel_dates else normalize_text(dates)
+
+def make_cache_key(namespace, **fields):
+    """
+    Build a canonical cache key from already-normalized request fields.
+
+    Returns:
+        str: "<namespace>:<sha256 of the fields>"
+    """
+    payload = json.dumps(fields, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+def plan_cache_key(source, destination, dates, budget, travelers, interests, include_flights=False):
+    """Cache key for generate_travel_plan()"""
+    return make_cache_key(
+        'plan',
+        source=normalize_location(source),
+        destination=normalize_location(destination),
+        dates=normalize_dates(dates),
+        budget=normalize_budget(budget),
+        travelers=normalize_travelers(travelers),
+        interests=normalize_interests(interests),
+        include_flights=bool(include_flights),
+    )
+
+def multi_city_cache_key(source, cities, dates, budget, travelers, interests, include_flights=False,
+                         optimize_order=True, round_trip=False):
+    """Cache key for generate_multi_city_plan()"""
+    cities = [normalize_location(city) for city in cities]
+    return make_cache_key(
+        'multi_city',
+        source=normalize_location(source),
+        # The given order only matters when the route is not optimized
+        cities=sorted(cities) if optimize_order else cities,
+        dates=normalize_dates(dates),
+        budget=normalize_budget(budget),
+        travelers=normalize_travelers(travelers),
+        interests=normalize_interests(interests),
+        include_flights=bool(include_flights),
+        round_trip=bool(round_trip),
+    )
+
+def recommendations_cache_key(interests, budget, dates, travelers):
+    """Cache key for get_destination_recommendations()"""
+    return make_cache_key(
+        'recommendations',
+        interests=normalize_interests(interests),
+        budget=normalize_budget(budget),
+        dates=normalize_dates(dates),
+        travelers=normalize_travelers(travelers),
+    )
+
+def airport_cache_key(location):
+    """Cache key for a model-resolved airport code"""
+    return make_cache_key('airport', location=normalize_location(location))
+
+def flights_cache_key(source_code, destination_code, date):
+    """Cache key for get_flight_details()"""
+    return make_cache_key(
+        'flights',
+        source=source_code.strip().upper(),
+        destination=destination_code.strip().upper(),
+        date=normalize_dates(date),
+    )
+
+# ---------------------------------------------------------------------------
+# Storage tiers
+# ---------------------------------------------------------------------------
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry time to live"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value (for ttl seconds, default the cache's), evicting the least recently used entries when full"""
+        with self._lock:
+            self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStore:
+    """
+    On-disk JSON value store backed by SQLite, so cached responses survive restarts
+    and are shared by all worker processes on the host.
+
+    The database runs in WAL mode, so readers in one process never block writers
+    in another. Leases give cross-process single-flight generation, and the store
+    is kept under max_bytes by evicting the least recently used entries. Entries
+    are kept for stale_seconds past their TTL, to be served while they are refreshed.
+    """
+
+    # Sets between size checks
+    EVICT_EVERY = 64
+    # Reads only refresh an entry's last access when it is older than this
+    TOUCH_SECONDS = 60
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_DISK_MB * 1024 * 1024,
+                 stale_seconds=CACHE_STALE_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._sets = 0
+
+    def _connect(self):
+        """Open the database on first use. Caller must hold the lock."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+            if 'accessed_at' not in columns:
+                # Databases written before the store was size-bounded
+                self._conn.execute("ALTER TABLE responses ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+                self._conn.execute("ALTER TABLE responses ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE responses SET accessed_at = created_at, size = length(value)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    def get(self, key):
+        """Return the stored value or None if missing or expired"""
+        entry = self.lookup(key)
+        if entry is None or entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def lookup(self, key):
+        """
+        Return a stored value with its age, including entries past their TTL that
+        are still within the stale period.
+
+        Returns:
+            tuple: (value, age in seconds) or None if missing or too old
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at, accessed_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] + self.ttl + self.stale_seconds >= now and row[2] + self.TOUCH_SECONDS < now:
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        if row is None:
+            return None
+        value, created_at, _ = row
+        if created_at + self.ttl + self.stale_seconds < now:
+            self.delete(key)
+            return None
+        return json.loads(value), now - created_at
+
+    def set(self, key, value):
+        """Store a JSON-serializable value"""
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, now, now, len(payload))
+            )
+            self._sets += 1
+            if self._sets % self.EVICT_EVERY == 1:
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        """
+        Drop expired entries, then the least recently used ones until the store is
+        back under 90% of max_bytes. Caller must hold the lock.
+        """
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl - self.stale_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes * 0.9
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def acquire_lease(self, key, owner, seconds=CACHE_LEASE_SECONDS):
+        """
+        Atomically take the lease for generating a key, unless another live owner holds it.
+
+        Returns:
+            bool: Whether owner now holds the lease
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            # Insert-if-absent, or take over a lease whose holder died
+            cursor = conn.execute(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ?",
+                (key, owner, now + seconds, now)
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, key, owner):
+        """Give up a lease held by owner"""
+        with self._lock:
+            self._connect().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def size(self):
+        """
+        Return the number of stored entries and their total size in bytes.
+        """
+        with self._lock:
+            entries, total = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return entries, total
+
+    def delete(self, key):
+        with self._lock:
+            self._connect().execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.execute("DELETE FROM leases")
+
+
+# Background refreshes of stale entries
+_refresh_executor = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+# Set while refreshing, so stale entries the refresh depends on (such as a plan's
+# flight data) are regenerated rather than copied into the refreshed value
+_refreshing = contextvars.ContextVar("response_cache_refreshing", default=False)
+
+
+def refreshing():
+    """Whether the caller runs inside a background refresh of a stale entry"""
+    return _refreshing.get()
+
+
+class _Flight:
+    """A generation in progress that concurrent identical requests wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Two-tier response cache (in-process LRU in front of SQLite) with single-flight
+    deduplication: concurrent requests for the same key share one computation,
+    within a process and, through the disk tier's leases, across processes.
+
+    Disk entries past their TTL but within the store's stale period are served
+    immediately while a background refresh (at bulk priority) regenerates them.
+    Set serve_stale to False to regenerate them inline instead, and refresh_margin
+    to treat entries that expire within that many seconds as stale already.
+    """
+
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.disk = disk
+        self.serve_stale = True
+        self.refresh_margin = 0.0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._async_in_flight = {}
+        self._refreshing = set()
+        self._refresh_tasks = set()
+        self._stats = {
+            'memory_hits': 0, 'disk_hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'shared_waits': 0,
+            'refreshes': 0, 'errors': 0
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache from environment settings; an empty RESPONSE_CACHE_PATH disables the disk tier"""
+        disk = SQLiteStore(CACHE_PATH, CACHE_TTL, CACHE_MAX_DISK_MB * 1024 * 1024, CACHE_STALE_SECONDS) if CACHE_PATH else None
+        return cls(LRUCache(CACHE_MAX_ENTRIES, CACHE_TTL), disk)
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _get_disk(self, key):
+        """
+        Read from the disk tier, promoting fresh hits into memory for the rest of their TTL.
+
+        Returns:
+            tuple: (value or None, whether the value is stale)
+        """
+        if self.disk is None:
+            return None, False
+        try:
+            entry = self.disk.lookup(key)
+        except sqlite3.Error as e:
+            print(f"Error reading response cache: {e}")
+            self._count('errors')
+            return None, False
+        if entry is None:
+            return None, False
+        value, age = entry
+        remaining = self.disk.ttl - age
+        if remaining <= self.refresh_margin:
+            return value, True
+        self.memory.set(key, value, ttl=min(remaining, self.memory.ttl))
+        return value, False
+
+    def get(self, key, refresh=None, should_cache=None):
+        """
+        Look up a key in memory, then on disk.
+
+        Args:
+            key (str): Canonical cache key
+            refresh (callable): Regenerates the value; if given, a stale entry is
+                returned and refreshed in the background
+            should_cache (callable): Optional predicate for the refreshed value
+
+        Returns:
+            The cached value or None on a miss
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+        value, stale = self._get_disk(key)
+        if value is not None and not stale:
+            self._count('disk_hits')
+            return value
+        if value is not None and refresh is not None and self._serves_stale():
+            self._count('stale_hits')
+            self._refresh_later(key, refresh, should_cache)
+            return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        """Store a value in both tiers"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                print(f"Error writing response cache: {e}")
+                self._count('errors')
+
+    def _acquire_lease(self, key, owner):
+        """Take the disk tier's lease on a key; a failing disk tier doesn't stop generation"""
+        try:
+            return self.disk.acquire_lease(key, owner)
+        except sqlite3.Error as e:
+            print(f"Error taking response cache lease: {e}")
+            self._count('errors')
+            return True
+
+    def _release_lease(self, key, owner):
+        try:
+            self.disk.release_lease(key, owner)
+        except sqlite3.Error as e:
+            print(f"Error releasing response cache lease: {e}")
+            self._count('errors')
+
+    def _compute_shared(self, key, compute, should_cache):
+        """
+        Compute and store a missing value, unless another process is already
+        generating it, in which case its result is awaited instead (up to the
+        lease time; after that the value is computed here).
+        """
+        if self.disk is None:
+            return self._compute(key, compute, should_cache)
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + CACHE_LEASE_SECONDS
+        waited = False
+        while not self._acquire_lease(key, owner):
+            if not waited:
+                self._count('shared_waits')
+                waited = True
+            time.sleep(CACHE_LEASE_POLL_SECONDS)
+            value, stale = self._get_disk(key)
+            if value is not None and not stale:
+                return value
+            if time.monotonic() > deadline:
+                break
+        try:
+            return self._compute(key, compute, should_cache)
+        finally:
+            self._release_lease(key, owner)
+
+    def _compute(self, key, compute, should_cache):
+        value = compute()
+        if should_cache is None or should_cache(value):
+            self.set(key, value)
+        return value
+
+    def get_or_compute(self, key, compute, should_cache=None):
+        """
+        Return the cached value for key, computing it at most once across concurrent callers.
+
+        Args:
+            key (str): Canonical cache key
+            compute (callable): Produces the value on a miss
+            should_cache (callable): Optional predicate; values it rejects are returned but not stored
+
+        Returns:
+            The cached or freshly computed value
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._in_flight[key] = flight
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value, stale = self._get_disk(key)
+            if value is not None and not stale:
+                self._count('disk_hits')
+            elif value is not None and self._serves_stale():
+                self._count('stale_hits')
+                self._refresh_later(key, compute, should_cache)
+            else:
+                self._count('misses')
+                value = self._compute_shared(key, compute, should_cache)
+            flight.value = value
+            return value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+
+    async def get_or_compute_async(self, key, compute, should_cache=None):
+        """
+        Async variant of get_or_compute() for the ASGI app.
+
+        Disk access runs in a worker thread so the event loop is never blocked, and
+        concurrent identical requests on the same loop await a single computation.
+
+        Args:
+            key (str): Canonical cache key
+            compute (callable): Returns an awaitable producing the value on a miss
+            should_cache (callable): Optional predicate; values it rejects are returned but not stored
+
+        Returns:
+            The cached or freshly computed value
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        flight = self._async_in_flight.get(key)
+        if flight is not None:
+            self._count('coalesced')
+            try:
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+            # The leading request was cancelled (its client went away): take over the computation
+            return await self.get_or_compute_async(key, compute, should_cache)
+
+        flight = asyncio.get_running_loop().create_future()
+        self._async_in_flight[key] = flight
+        try:
+            value, stale = await asyncio.to_thread(self._get_disk, key)
+            if value is not None and not stale:
+                self._count('disk_hits')
+            elif value is not None and self._serves_stale():
+                self._count('stale_hits')
+                self._refresh_later_async(key, compute, should_cache)
+            else:
+                self._count('misses')
+                value = await self._compute_shared_async(key, compute, should_cache)
+            flight.set_result(value)
+            return value
+        except Exception as e:
+            flight.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            flight.exception()
+            raise
+        except BaseException:
+            # Cancelled: waiting requests retry instead of waiting forever
+            flight.cancel()
+            raise
+        finally:
+            if self._async_in_flight.get(key) is flight:
+                del self._async_in_flight[key]
+
+    async def _compute_shared_async(self, key, compute, should_cache):
+        """Async variant of _compute_shared()"""
+        if self.disk is None:
+            return await self._compute_async(key, compute, should_cache)
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + CACHE_LEASE_SECONDS
+        waited = False
+        while not await asyncio.to_thread(self._acquire_lease, key, owner):
+            if not waited:
+                self._count('shared_waits')
+                waited = True
+            await asyncio.sleep(CACHE_LEASE_POLL_SECONDS)
+            value, stale = await asyncio.to_thread(self._get_disk, key)
+            if value is not None and not stale:
+                return value
+            if time.monotonic() > deadline:
+                break
+        try:
+            return await self._compute_async(key, compute, should_cache)
+        finally:
+            await asyncio.to_thread(self._release_lease, key, owner)
+
+    async def _compute_async(self, key, compute, should_cache):
+        value = await compute()
+        if should_cache is None or should_cache(value):
+            await asyncio.to_thread(self.set, key, value)
+        return value
+
+    def _serves_stale(self):
+        return self.serve_stale and not _refreshing.get()
+
+    def _start_refresh(self, key):
+        """Whether to start refreshing a key (False if this process is already refreshing it)"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh_later(self, key, compute, should_cache):
+        """Regenerate a stale entry on the refresh workers"""
+        if self._start_refresh(key):
+            _refresh_executor.submit(contextvars.copy_context().run, self._refresh, key, compute, should_cache)
+
+    def _refresh(self, key, compute, should_cache):
+        owner = uuid.uuid4().hex
+        try:
+            # Skip the refresh if another process is refreshing the key or already has
+            if not self._acquire_lease(key, owner):
+                return
+            try:
+                value, stale = self._get_disk(key)
+                if value is None or stale:
+                    _refreshing.set(True)
+                    with priority_scope(PRIORITY_BULK):
+                        self._compute(key, compute, should_cache)
+                    self._count('refreshes')
+            finally:
+                self._release_lease(key, owner)
+        except Exception as e:
+            print(f"Error refreshing cached response: {e}")
+            self._count('errors')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_later_async(self, key, compute, should_cache):
+        """Regenerate a stale entry in a background task on the running event loop"""
+        if self._start_refresh(key):
+            task = asyncio.get_running_loop().create_task(self._refresh_async(key, compute, should_cache))
+            # Keep a reference so the task isn't garbage collected before it finishes
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh_async(self, key, compute, should_cache):
+        owner = uuid.uuid4().hex
+        try:
+            if not await asyncio.to_thread(self._acquire_lease, key, owner):
+                return
+            try:
+                value, stale = await asyncio.to_thread(self._get_disk, key)
+                if value is None or stale:
+                    # The task runs in its own copy of the context
+                    _refreshing.set(True)
+                    with priority_scope(PRIORITY_BULK):
+                        await self._compute_async(key, compute, should_cache)
+                    self._count('refreshes')
+            finally:
+                await asyncio.to_thread(self._release_lease, key, owner)
+        except Exception as e:
+            print(f"Error refreshing cached response: {e}")
+            self._count('errors')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        """
+        Return hit/miss counters for sizing the cache.
+
+        Returns:
+            dict: Counters plus the current number of in-memory entries and hit ratio
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._in_flight) + len(self._async_in_flight)
+            stats['refreshing'] = len(self._refreshing)
+        hits = stats['memory_hits'] + stats['disk_hits'] + stats['stale_hits']
+        lookups = hits + stats['misses']
+        stats['memory_entries'] = len(self.memory)
+        if self.disk is not None:
+            try:
+                stats['disk_entries'], stats['disk_bytes'] = self.disk.size()
+            except sqlite3.Error as e:
+                print(f"Error reading response cache size: {e}")
+        stats['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+# Shared cache for model responses
+response_cache = ResponseCache.from_env()
@@ -0,0 +1,347 @@
+import os
+import glob
+import gzip
+import json
+import time
+import atexit
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from model_backends import ModelBackend, ModelBackendError, RateLimitError
+
+# Record and replay model calls. In record mode every call to the real backend is
+# captured to a cassette: the response text (or stream chunks), token usage, any
+# error, and how long the model took. In replay mode calls are answered from the
+# cassettes by a hash of the prompt, after the recorded latency or none at all,
+# without network access or credentials. Replaying captured traffic therefore
+# profiles the app's own overhead (prompt building, JSON parsing, Markdown
+# rendering, caching) with the model's real answers, and gives CI reproducible
+# end-to-end runs.
+#
+# Cassettes are gzip-compressed JSONL, one call per line. Each process records to
+# its own file in MODEL_CASSETTE_PATH (a directory), so multi-worker servers can
+# record at the same time; replay loads every cassette in the directory, or a
+# single file. Prompts are not stored unless MODEL_CASSETTE_PROMPTS is set.
+
+# "record", "replay" or empty to call the model normally
+MODEL_CASSETTE_MODE = os.getenv("MODEL_CASSETTE_MODE", "").lower()
+MODEL_CASSETTE_PATH = os.getenv(
+    "MODEL_CASSETTE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cassettes')
+)
+# Keep the prompts in the cassette, for inspecting what was recorded
+MODEL_CASSETTE_PROMPTS = os.getenv("MODEL_CASSETTE_PROMPTS", "false").lower() == "true"
+# "recorded" replays the original latency, "zero" answers immediately, a number scales the recorded latency
+MODEL_REPLAY_LATENCY = os.getenv("MODEL_REPLAY_LATENCY", "recorded").lower()
+# What to do with a prompt that isn't in the cassettes: "error" or "live" (call MODEL_BACKEND)
+MODEL_REPLAY_MISS = os.getenv("MODEL_REPLAY_MISS", "error").lower()
+
+CASSETTE_PATTERNS = ('*.jsonl.gz', '*.jsonl')
+
+
+class CassetteMiss(ModelBackendError):
+    """Raised in replay mode for a prompt that was never recorded"""
+
+
+class CassetteResponse:
+    """A replayed response or stream chunk"""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def prompt_key(prompt):
+    """Cassette key of a prompt"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:32]
+
+
+def latency_scale(setting):
+    """Multiplier for recorded latencies from MODEL_REPLAY_LATENCY"""
+    if setting == 'recorded':
+        return 1.0
+    if setting == 'zero':
+        return 0.0
+    return max(0.0, float(setting))
+
+
+def _usage(response):
+    """(prompt tokens, response tokens) from a response's usage_metadata, or None"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return None
+    return [getattr(usage, 'prompt_token_count', 0) or 0, getattr(usage, 'candidates_token_count', 0) or 0]
+
+
+def _error(error):
+    """Recorded form of a backend error"""
+    kind = 'rate_limit' if isinstance(error, RateLimitError) else 'error'
+    return {'type': kind, 'message': str(error)}
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+class CassetteWriter:
+    """Appends recorded calls to this process's cassette file"""
+
+    def __init__(self, path=MODEL_CASSETTE_PATH, prompts=MODEL_CASSETTE_PROMPTS):
+        if os.path.isdir(path) or not path.endswith(('.jsonl', '.jsonl.gz')):
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz"
+            path = os.path.join(path, name)
+        self.path = path
+        self.prompts = prompts
+        self._file = None
+        self._keys = set()
+        self._lock = threading.Lock()
+
+    def write(self, prompt, entry):
+        """
+        Record one call. Only the first successful call of each prompt is kept.
+
+        Args:
+            prompt (str): The prompt
+            entry (dict): Response fields (text or chunks, usage, error, timings)
+        """
+        key = prompt_key(prompt)
+        line = {'key': key, **entry}
+        if self.prompts:
+            line['prompt'] = prompt
+        data = json.dumps(line, ensure_ascii=False, separators=(',', ':')) + "\n"
+        try:
+            with self._lock:
+                if key in self._keys:
+                    return
+                if self._file is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    opener = gzip.open if self.path.endswith('.gz') else open
+                    self._file = opener(self.path, 'at', encoding='utf-8')
+                    atexit.register(self.close)
+                self._file.write(data)
+                # Flush so the cassette is readable while the process still runs
+                self._file.flush()
+                # A failed call is recorded again until one succeeds; replay uses the last line
+                if 'error' not in entry:
+                    self._keys.add(key)
+        except OSError as e:
+            print(f"Error writing cassette: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def cassette_files(path):
+    """Cassette files at a path: the file itself, or the cassettes in a directory in name order"""
+    if os.path.isdir(path):
+        return sorted(name for pattern in CASSETTE_PATTERNS for name in glob.glob(os.path.join(path, pattern)))
+    return [path] if os.path.exists(path) else []
+
+
+def load_cassettes(path=MODEL_CASSETTE_PATH):
+    """
+    Read recorded calls.
+
+    A cassette whose process did not exit cleanly ends in a truncated line or gzip
+    member; the calls before it are kept. Later files win for prompts recorded twice.
+
+    Returns:
+        dict: Prompt key -> recorded call
+    """
+    entries = {}
+    for name in cassette_files(path):
+        opener = gzip.open if name.endswith('.gz') else open
+        try:
+            with opener(name, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries[entry['key']] = entry
+        except (EOFError, OSError) as e:
+            print(f"Error reading cassette {name}: {e}")
+    return entries
+
+
+class RecordingBackend(ModelBackend):
+    """Passes calls through to a backend and records them to a cassette"""
+
+    def __init__(self, backend, writer):
+        self.backend = backend
+        self.writer = writer
+        self.name = backend.name
+
+    @classmethod
+    def from_env(cls, backend):
+        return cls(backend, CassetteWriter())
+
+    def warm_up(self):
+        self.backend.warm_up()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.backend.generate_content(prompt, stream=stream, **kwargs)
+        except ModelBackendError as e:
+            self.writer.write(prompt, {'error': _error(e), 'latency_ms': _ms(start)})
+            raise
+        if stream:
+            return self._record_stream(prompt, response, start)
+        self._record(prompt, response, start)
+        return response
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.backend.generate_content_async(prompt, stream=stream, **kwargs)
+        except ModelBackendError as e:
+            self.writer.write(prompt, {'error': _error(e), 'latency_ms': _ms(start)})
+            raise
+        if stream:
+            return self._record_stream_async(prompt, response, start)
+        self._record(prompt, response, start)
+        return response
+
+    def _record(self, prompt, response, start):
+        try:
+            text = response.text
+        except Exception:
+            # Blocked or empty answers have no text to replay
+            return
+        self.writer.write(prompt, {'text': text, 'usage': _usage(response), 'latency_ms': _ms(start)})
+
+    def _record_stream(self, prompt, response, start):
+        chunks, offsets = [], []
+        try:
+            for chunk in response:
+                chunks.append(chunk.text)
+                offsets.append(_ms(start))
+                yield chunk
+        except ModelBackendError as e:
+            self._write_stream(prompt, chunks, offsets, start, e)
+            raise
+        self._write_stream(prompt, chunks, offsets, start)
+
+    async def _record_stream_async(self, prompt, response, start):
+        chunks, offsets = [], []
+        try:
+            async for chunk in response:
+                chunks.append(chunk.text)
+                offsets.append(_ms(start))
+                yield chunk
+        except ModelBackendError as e:
+            self._write_stream(prompt, chunks, offsets, start, e)
+            raise
+        self._write_stream(prompt, chunks, offsets, start)
+
+    def _write_stream(self, prompt, chunks, offsets, start, error=None):
+        """Record a stream that ran to its end (streams the caller abandoned are not recorded)"""
+        entry = {'chunks': chunks, 'offsets_ms': offsets, 'latency_ms': _ms(start)}
+        if error is not None:
+            entry['error'] = _error(error)
+        self.writer.write(prompt, entry)
+
+
+class ReplayBackend(ModelBackend):
+    """Answers calls from recorded cassettes"""
+
+    def __init__(self, entries, latency=1.0, fallback=None, name="replay"):
+        self.entries = entries
+        self.latency = latency
+        self.fallback = fallback
+        self.name = name
+
+    @classmethod
+    def from_env(cls, name, live=None):
+        """
+        Args:
+            name (str): Name of the live backend being replayed
+            live (callable): Creates the live backend, for MODEL_REPLAY_MISS=live
+        """
+        entries = load_cassettes()
+        if not entries:
+            print(f"No recorded model calls found in {MODEL_CASSETTE_PATH}")
+        fallback = live() if MODEL_REPLAY_MISS == 'live' and live else None
+        return cls(entries, latency_scale(MODEL_REPLAY_LATENCY), fallback, name)
+
+    def warm_up(self):
+        if self.fallback is not None:
+            self.fallback.warm_up()
+
+    def _lookup(self, prompt):
+        entry = self.entries.get(prompt_key(prompt))
+        if entry is None and self.fallback is None:
+            raise CassetteMiss(f"No recorded response for prompt {prompt_key(prompt)}: {prompt[:80]!r}")
+        return entry
+
+    def _replay(self, entry):
+        """
+        Returns:
+            tuple: (response text, stream chunks, their offsets in seconds, total latency in seconds, error)
+        """
+        scale = self.latency / 1000
+        chunks = entry.get('chunks')
+        if chunks is None:
+            text = entry.get('text') or ''
+            chunks = [text] if text else []
+        text = ''.join(chunks)
+        latency = entry.get('latency_ms', 0) * scale
+        # Calls recorded without streaming deliver their one chunk at the end
+        offsets = [offset * scale for offset in entry.get('offsets_ms') or [entry.get('latency_ms', 0)]]
+        error = entry.get('error')
+        if error:
+            error_type = RateLimitError if error['type'] == 'rate_limit' else ModelBackendError
+            error = error_type(error['message'])
+        return text, chunks, offsets, latency, error
+
+    def _response(self, entry, text):
+        usage = entry.get('usage')
+        if usage is not None:
+            usage = SimpleNamespace(prompt_token_count=usage[0], candidates_token_count=usage[1])
+        return CassetteResponse(text, usage)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        entry = self._lookup(prompt)
+        if entry is None:
+            return self.fallback.generate_content(prompt, stream=stream, **kwargs)
+        text, chunks, offsets, latency, error = self._replay(entry)
+        if stream:
+            return self._stream(chunks, offsets, latency, error)
+        time.sleep(latency)
+        if error:
+            raise error
+        return self._response(entry, text)
+
+    def _stream(self, chunks, offsets, latency, error):
+        start = time.perf_counter()
+        for chunk, offset in zip(chunks, offsets):
+            time.sleep(max(0.0, offset - (time.perf_counter() - start)))
+            yield CassetteResponse(chunk)
+        if error:
+            time.sleep(max(0.0, latency - (time.perf_counter() - start)))
+            raise error
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        entry = self._lookup(prompt)
+        if entry is None:
+            return await self.fallback.generate_content_async(prompt, stream=stream, **kwargs)
+        text, chunks, offsets, latency, error = self._replay(entry)
+        if stream:
+            return self._stream_async(chunks, offsets, latency, error)
+        await asyncio.sleep(latency)
+        if error:
+            raise error
+        return self._response(entry, text)
+
+    async def _stream_async(self, chunks, offsets, latency, error):
+        start = time.perf_counter()
+        for chunk, offset in zip(chunks, offsets):
+            await asyncio.sleep(max(0.0, offset - (time.perf_counter() - start)))
+            yield CassetteResponse(chunk)
+        if error:
+            await asyncio.sleep(max(0.0, latency - (time.perf_counter() - start)))
+            raise error
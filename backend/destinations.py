@@ -0,0 +1,159 @@
+import os
+import csv
+import threading
+import numpy as np
+from cache import parse_budget, traveler_count
+from semantic_cache import canonical_interest, travel_month
+from travel_dates import parse_travel_dates
+
+# Bundled destination catalog (name, country, nearest airport, interest tags, typical
+# daily cost per person in USD, and a 0-10 climate score for each month). Every
+# destination is scored against a request in one vectorized pass, so the
+# recommendations endpoint can return a ranked shortlist straight away and the
+# model only writes up the top few.
+DESTINATIONS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'destinations.csv')
+
+DESTINATION_SHORTLIST = int(os.getenv("DESTINATION_SHORTLIST", 10))
+
+# Weights of the interest, budget and climate scores in the overall match (sum to 1)
+SCORE_WEIGHTS = (0.45, 0.25, 0.3)
+
+# Share of the budget expected to go to costs on the ground (the rest is flights)
+ON_GROUND_BUDGET_SHARE = 0.65
+DEFAULT_TRIP_DAYS = 7
+
+# Approximate USD value of one unit of each currency parse_budget() recognises
+USD_RATES = {'USD': 1.0, 'EUR': 1.08, 'GBP': 1.27, 'JPY': 0.0067, 'INR': 0.012, 'CAD': 0.73, 'AUD': 0.66, 'CHF': 1.12}
+
+
+def trip_days(dates):
+    """
+    Trip length from free-form dates ("June 10-20", "10 days", "2 weeks").
+
+    Returns:
+        int: Number of days, DEFAULT_TRIP_DAYS if the dates do not say
+    """
+    travel_dates = parse_travel_dates(dates)
+    return travel_dates.days if travel_dates and travel_dates.days else DEFAULT_TRIP_DAYS
+
+
+def daily_budget_usd(budget, travelers, dates):
+    """
+    On-the-ground budget per person per day in USD.
+
+    Returns:
+        float: Daily budget, or None if the budget has no amount
+    """
+    parsed = parse_budget(budget)
+    if parsed is None:
+        return None
+    amount, currency, per_person = parsed
+    count = 1 if per_person else traveler_count(travelers) or 1
+    return amount * USD_RATES.get(currency, 1.0) * ON_GROUND_BUDGET_SHARE / count / trip_days(dates)
+
+
+class DestinationCatalog:
+    """Destinations as NumPy arrays: a tag matrix, a cost vector and a month-by-month climate matrix"""
+
+    def __init__(self, rows):
+        self.names = [row['name'] for row in rows]
+        self.countries = [row['country'] for row in rows]
+        self.airports = [row['airport'] for row in rows]
+        row_tags = [[canonical_interest(tag) for tag in row['tags'].split('|')] for row in rows]
+        self.tags = sorted({tag for tags in row_tags for tag in tags})
+        self._tag_columns = {tag: column for column, tag in enumerate(self.tags)}
+        self.tag_matrix = np.zeros((len(rows), len(self.tags)), dtype=np.float32)
+        for i, tags in enumerate(row_tags):
+            self.tag_matrix[i, [self._tag_columns[tag] for tag in tags]] = 1.0
+        self.daily_cost = np.array([float(row['daily_cost_usd']) for row in rows], dtype=np.float32)
+        self.climate = np.array([[float(v) for v in row['climate'].split('|')] for row in rows], dtype=np.float32) / 10
+
+    @classmethod
+    def from_csv(cls, path=DESTINATIONS_CSV):
+        with open(path, newline='', encoding='utf-8') as f:
+            return cls(list(csv.DictReader(f)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def score(self, interests, budget, dates, travelers):
+        """
+        Score every destination against a request.
+
+        Returns:
+            tuple: (overall scores, interest scores, budget scores, climate scores) as arrays
+                   with one entry per destination, all in 0..1, the matched tag columns and
+                   the daily budget (None if the budget has no amount)
+        """
+        columns = sorted({self._tag_columns[term] for term in map(canonical_interest, interests)
+                          if term in self._tag_columns})
+        if columns:
+            # Share of the requested interests each destination offers
+            interest_scores = self.tag_matrix[:, columns].sum(axis=1) / len(columns)
+        else:
+            interest_scores = np.full(len(self), 0.5, dtype=np.float32)
+
+        daily_budget = daily_budget_usd(budget, travelers, dates)
+        if daily_budget:
+            # Full marks within budget, decaying as the destination gets more expensive
+            over = np.maximum(self.daily_cost / daily_budget - 1, 0)
+            budget_scores = np.exp(-2 * over)
+        else:
+            budget_scores = np.full(len(self), 0.5, dtype=np.float32)
+
+        month = travel_month(dates)
+        climate_scores = self.climate[:, month - 1] if month else self.climate.mean(axis=1)
+
+        # Squared, so a rainy or freezing season costs much more than a merely average month
+        interest_weight, budget_weight, climate_weight = SCORE_WEIGHTS
+        scores = interest_weight * interest_scores + budget_weight * budget_scores + climate_weight * climate_scores ** 2
+        return scores, interest_scores, budget_scores, climate_scores, columns, daily_budget
+
+    def shortlist(self, interests, budget, dates, travelers, limit=DESTINATION_SHORTLIST):
+        """
+        Rank destinations for a request.
+
+        Returns:
+            list: Up to `limit` dicts, best match first, with the destination, its
+                  airport code, the overall score (0-100) and the matched interests
+        """
+        scores, interest_scores, budget_scores, climate_scores, columns, daily_budget = self.score(
+            interests, budget, dates, travelers
+        )
+        # A stable sort of the whole catalog, so equal scores keep catalog order; the
+        # order argpartition leaves ties in differs between numpy releases
+        top = np.argsort(-scores, kind='stable')[:limit]
+        return [{
+            'name': self.names[i],
+            'country': self.countries[i],
+            'airport_code': self.airports[i],
+            'score': round(float(scores[i]) * 100),
+            'matched_interests': [self.tags[column] for column in columns if self.tag_matrix[i, column]],
+            'daily_cost_usd': int(self.daily_cost[i]),
+            'within_budget': bool(budget_scores[i] >= 1) if daily_budget else None,
+            'climate': round(float(climate_scores[i]) * 10, 1),
+        } for i in top]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_destination_catalog():
+    """
+    Return the process-wide destination catalog, loading the bundled dataset on first use.
+
+    Returns:
+        DestinationCatalog: Shared catalog
+    """
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = DestinationCatalog.from_csv()
+    return _catalog
+
+
+def shortlist_destinations(interests, budget, dates, travelers, limit=DESTINATION_SHORTLIST):
+    """Rank the bundled destinations for a request (see DestinationCatalog.shortlist)"""
+    return get_destination_catalog().shortlist(interests, budget, dates, travelers, limit)
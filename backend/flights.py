@@ -0,0 +1,511 @@
+import os
+import re
+import json
+from dataclasses import dataclass
+
+# Typed flight model for the flights stage. The model is asked for JSON matching
+# FLIGHT_RESPONSE_SCHEMA (enforced through the model's structured-output mode where
+# the SDK supports it); the answer is validated into compact records in a single
+# pass, options that cannot be read are dropped instead of failing the whole
+# section, and complete options are recovered from truncated JSON. The Markdown
+# section is rendered from the records with module-level templates.
+
+FLIGHT_STRUCTURED_OUTPUT = os.getenv("FLIGHT_STRUCTURED_OUTPUT", "true").lower() not in ("0", "false", "no")
+
+_AIRPORT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "id": {"type": "STRING"},
+        "name": {"type": "STRING"},
+        "time": {"type": "STRING"},
+    },
+    "required": ["id", "time"],
+}
+
+# OpenAPI-style schema accepted as `response_schema` by Gemini's JSON mode
+FLIGHT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "best_flights": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "airline": {"type": "STRING"},
+                    "price": {"type": "STRING"},
+                    "total_duration": {"type": "INTEGER"},
+                    "flights": {
+                        "type": "ARRAY",
+                        "items": {
+                            "type": "OBJECT",
+                            "properties": {
+                                "departure_airport": _AIRPORT_SCHEMA,
+                                "arrival_airport": _AIRPORT_SCHEMA,
+                                "airline": {"type": "STRING"},
+                                "flight_number": {"type": "STRING"},
+                                "duration": {"type": "INTEGER"},
+                                "airplane": {"type": "STRING"},
+                                "overnight": {"type": "BOOLEAN"},
+                            },
+                            "required": ["departure_airport", "arrival_airport", "duration"],
+                        },
+                    },
+                    "layovers": {
+                        "type": "ARRAY",
+                        "items": {
+                            "type": "OBJECT",
+                            "properties": {
+                                "id": {"type": "STRING"},
+                                "name": {"type": "STRING"},
+                                "duration": {"type": "INTEGER"},
+                            },
+                        },
+                    },
+                },
+                "required": ["airline", "price", "flights"],
+            },
+        },
+    },
+    "required": ["best_flights"],
+}
+
+_DURATION_RE = re.compile(r'^\s*(?:(\d+)\s*h(?:ours?|rs?)?)?\s*(?:(\d+)\s*m(?:in(?:utes?)?)?)?\s*$', re.IGNORECASE)
+_PRICE_RE = re.compile(r'\d+(?:\.\d+)?')
+_FENCED_JSON_RE = re.compile(r'```(?:json)?\s*\n(.*?)\n\s*```', re.DOTALL)
+_URL_RE = re.compile(r'"google_flights_url"\s*:\s*"([^"]*)"')
+
+
+class FlightDataError(ValueError):
+    """Raised when a model response holds no readable flight data"""
+
+
+@dataclass
+class AirportTime:
+    __slots__ = ('id', 'name', 'time')
+    id: str
+    name: str
+    time: str
+
+
+@dataclass
+class Segment:
+    __slots__ = ('departure', 'arrival', 'airline', 'flight_number', 'duration', 'airplane', 'overnight')
+    departure: AirportTime
+    arrival: AirportTime
+    airline: str
+    flight_number: str
+    duration: int
+    airplane: str
+    overnight: bool
+
+
+@dataclass
+class Layover:
+    __slots__ = ('id', 'name', 'duration')
+    id: str
+    name: str
+    duration: int
+
+
+@dataclass
+class FlightOption:
+    __slots__ = ('airline', 'price', 'total_duration', 'segments', 'layovers', 'carbon_emissions')
+    airline: str
+    price: str
+    total_duration: int
+    segments: list
+    layovers: list
+    carbon_emissions: dict
+
+
+@dataclass
+class FlightResults:
+    """
+    Validated flight options for a route.
+
+    `partial` is set when some options had to be dropped or the response was cut off.
+    """
+
+    __slots__ = ('options', 'google_flights_url', 'partial')
+    options: list
+    google_flights_url: str
+    partial: bool
+
+    @classmethod
+    def from_dict(cls, data, partial=False):
+        """
+        Validate flight data (the JSON shape requested from the model) in one pass.
+
+        Unreadable options are dropped and flagged as partial rather than rejected.
+
+        Returns:
+            FlightResults: Validated flight options
+        """
+        if not isinstance(data, dict):
+            data = {}
+        raw_options = data.get('best_flights')
+        if not isinstance(raw_options, list):
+            raw_options = []
+
+        options = []
+        for raw_option in raw_options:
+            option = _option(raw_option)
+            if option is None:
+                partial = True
+            else:
+                options.append(option)
+
+        metadata = data.get('search_metadata')
+        url = _text(metadata.get('google_flights_url')) if isinstance(metadata, dict) else None
+        return cls(options, url, partial or bool(data.get('partial')))
+
+    def to_dict(self):
+        """Return the flight data as JSON-serializable dicts in the requested shape"""
+        data = {
+            'best_flights': [_option_dict(option) for option in self.options],
+            'search_metadata': {'google_flights_url': self.google_flights_url},
+        }
+        if self.partial:
+            data['partial'] = True
+        return data
+
+
+def _text(value, default=None):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or default
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return default
+
+
+def _minutes(value):
+    """Duration in minutes from 240, 240.0, "240" or "4h 0m"; None if unreadable"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if value >= 0 else None
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        match = _DURATION_RE.match(value)
+        if match and any(match.groups()):
+            hours, minutes = match.groups()
+            return int(hours or 0) * 60 + int(minutes or 0)
+    return None
+
+
+def _price(value):
+    """Price as a plain number string from 1234, "1234", "$1,234" or "1234 USD"; None if unreadable"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return str(int(value)) if float(value).is_integer() else str(value)
+    if isinstance(value, str):
+        match = _PRICE_RE.search(value.replace(',', ''))
+        return match.group(0) if match else None
+    return None
+
+
+def _airport(value):
+    if not isinstance(value, dict):
+        return None
+    airport_id = _text(value.get('id'))
+    if airport_id is None:
+        return None
+    return AirportTime(airport_id.upper(), _text(value.get('name')), _text(value.get('time'), ''))
+
+
+def _segment(value):
+    if not isinstance(value, dict):
+        return None
+    departure = _airport(value.get('departure_airport'))
+    arrival = _airport(value.get('arrival_airport'))
+    if departure is None or arrival is None:
+        return None
+    return Segment(
+        departure, arrival,
+        _text(value.get('airline')),
+        _text(value.get('flight_number'), ''),
+        _minutes(value.get('duration')) or 0,
+        _text(value.get('airplane')),
+        bool(value.get('overnight'))
+    )
+
+
+def _option(value):
+    if not isinstance(value, dict):
+        return None
+    raw_segments = value.get('flights')
+    if not isinstance(raw_segments, list) or not raw_segments:
+        return None
+    segments = []
+    for raw_segment in raw_segments:
+        segment = _segment(raw_segment)
+        if segment is None:
+            # A journey with a missing leg cannot be shown truthfully
+            return None
+        segments.append(segment)
+
+    layovers = []
+    for raw_layover in value.get('layovers') or ():
+        if isinstance(raw_layover, dict):
+            layovers.append(Layover(
+                _text(raw_layover.get('id')), _text(raw_layover.get('name')), _minutes(raw_layover.get('duration')) or 0
+            ))
+
+    total_duration = _minutes(value.get('total_duration'))
+    if total_duration is None:
+        total_duration = sum(segment.duration for segment in segments) + sum(layover.duration for layover in layovers)
+
+    carbon = value.get('carbon_emissions')
+    if isinstance(carbon, dict) and carbon:
+        this_flight, difference = carbon.get('this_flight', 0), carbon.get('difference_percent', 0)
+        readable = all(isinstance(number, (int, float)) and not isinstance(number, bool) for number in (this_flight, difference))
+        carbon = {'this_flight': this_flight, 'difference_percent': difference} if readable else None
+    else:
+        carbon = None
+
+    return FlightOption(
+        _text(value.get('airline'), 'Multiple'), _price(value.get('price')) or 'N/A',
+        total_duration, segments, layovers, carbon
+    )
+
+
+def _airport_dict(airport):
+    data = {'id': airport.id, 'time': airport.time}
+    if airport.name is not None:
+        data['name'] = airport.name
+    return data
+
+
+def _option_dict(option):
+    segments = []
+    for segment in option.segments:
+        data = {
+            'departure_airport': _airport_dict(segment.departure),
+            'arrival_airport': _airport_dict(segment.arrival),
+            'flight_number': segment.flight_number,
+            'duration': segment.duration,
+        }
+        if segment.airline is not None:
+            data['airline'] = segment.airline
+        if segment.airplane is not None:
+            data['airplane'] = segment.airplane
+        if segment.overnight:
+            data['overnight'] = True
+        segments.append(data)
+
+    data = {
+        'airline': option.airline,
+        'price': option.price,
+        'total_duration': option.total_duration,
+        'flights': segments,
+    }
+    if option.layovers:
+        data['layovers'] = [
+            {key: value for key, value in (('id', layover.id), ('name', layover.name), ('duration', layover.duration))
+             if value is not None}
+            for layover in option.layovers
+        ]
+    if option.carbon_emissions:
+        data['carbon_emissions'] = option.carbon_emissions
+    return data
+
+
+def parse_flight_results(text):
+    """
+    Read flight data from a model response.
+
+    Tries, in order: the whole response as JSON, a fenced ```json block, and
+    finally every complete option of a truncated "best_flights" array.
+
+    Returns:
+        FlightResults: Validated flight options
+
+    Raises:
+        FlightDataError: If no flight data could be read
+    """
+    candidates = [text]
+    fenced = _FENCED_JSON_RE.search(text)
+    if fenced:
+        candidates.append(fenced.group(1))
+
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            results = FlightResults.from_dict(data)
+            if results.options or not data.get('best_flights'):
+                return results
+            raise FlightDataError("Unable to parse flight data from Gemini response")
+
+    results = _salvage(text)
+    if results is None:
+        raise FlightDataError("Unable to retrieve flight data in the correct format")
+    return results
+
+
+def _salvage(text):
+    """Recover the complete options of a cut-off "best_flights" array"""
+    start = text.find('"best_flights"')
+    if start == -1:
+        return None
+    position = text.find('[', start)
+    if position == -1:
+        return None
+    position += 1
+
+    decoder = json.JSONDecoder()
+    raw_options = []
+    while True:
+        while position < len(text) and text[position] in ' \t\r\n,':
+            position += 1
+        if position >= len(text) or text[position] == ']':
+            break
+        try:
+            raw_option, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            break
+        raw_options.append(raw_option)
+
+    url = _URL_RE.search(text)
+    results = FlightResults.from_dict({
+        'best_flights': raw_options,
+        'search_metadata': {'google_flights_url': url.group(1) if url else None}
+    }, partial=True)
+    return results if results.options else None
+
+
+def google_flights_url(source_code, destination_code, date=None):
+    """Google Flights search link for a route (and date, if known)"""
+    url = f"https://www.google.com/travel/flights?hl=en&curr=USD&q=flights%20{source_code}%20to%20{destination_code}"
+    return f"{url}&dates={date}" if date else url
+
+
+# Templates for the flight section. Fixed parts are constants and the per-row
+# templates are f-string functions, compiled once at import.
+_TABLE_HEADER = (
+    "<div class='flight-table-container'>\n"
+    "<table class='flight-table'>\n"
+    "<thead>\n"
+    "<tr>\n"
+    "<th>Airline</th>\n"
+    "<th>Price</th>\n"
+    "<th>Duration</th>\n"
+    "<th>Departure</th>\n"
+    "<th>Arrival</th>\n"
+    "<th>Stops</th>\n"
+    "<th>Book</th>\n"
+    "</tr>\n"
+    "</thead>\n"
+    "<tbody>\n"
+)
+_TABLE_FOOTER = "</tbody>\n</table>\n</div>\n\n### Flight Details\n\n"
+_OVERNIGHT = "* **Overnight flight**\n"
+_PARTIAL_NOTE = "*Some flight options could not be read and were left out.*\n\n"
+_FOOTER = "*Flight data generated by Gemini AI. Click 'Book' to see actual flights on Google Flights.*\n\n"
+
+
+def _clock(time):
+    """Time of day from "14:00" or "2025-04-02 14:00\""""
+    if len(time) > 11 and time[10] in ' T' and time[4] == '-':
+        return time[11:]
+    return time
+
+
+def _hours(minutes):
+    return f"{minutes // 60}h {minutes % 60}m"
+
+
+def _stops(count):
+    return "Nonstop" if count == 0 else f"{count} stop{'s' if count > 1 else ''}"
+
+
+def _route_template(source, destination, sample):
+    if sample:
+        return (f"**Requested Route**: {source} to {destination}\n\n"
+                "*Note: Showing sample flight data for demonstration purposes.*\n\n")
+    return f"**From**: {source} to **{destination}**\n\n"
+
+
+def _row_template(option, url):
+    first, last = option.segments[0], option.segments[-1]
+    return (
+        "<tr>\n"
+        f"<td>{option.airline}</td>\n"
+        f"<td>${option.price}</td>\n"
+        f"<td>{_hours(option.total_duration)}</td>\n"
+        f"<td>{_clock(first.departure.time)} ({first.departure.id})</td>\n"
+        f"<td>{_clock(last.arrival.time)} ({last.arrival.id})</td>\n"
+        f"<td>{_stops(len(option.segments) - 1)}</td>\n"
+        f"<td><a href='{url}' target='_blank'>Book</a></td>\n"
+        "</tr>\n"
+    )
+
+
+def _segment_template(number, segment):
+    departure, arrival = segment.departure, segment.arrival
+    return (
+        f"**Segment {number}**: {departure.id} → {arrival.id}\n"
+        f"* {segment.airline or 'N/A'} {segment.flight_number}\n"
+        f"* Depart: {departure.name or 'N/A'} at {_clock(departure.time)}\n"
+        f"* Arrive: {arrival.name or 'N/A'} at {_clock(arrival.time)}\n"
+        f"* Duration: {_hours(segment.duration)}\n"
+        f"* Aircraft: {segment.airplane or 'N/A'}\n"
+        f"{_OVERNIGHT if segment.overnight else ''}"
+        "\n"
+    )
+
+
+def _layover_template(layover):
+    return f"* {layover.name or 'N/A'} ({layover.id or 'N/A'}): {_hours(layover.duration)}\n"
+
+
+def _carbon_template(carbon):
+    difference = carbon['difference_percent']
+    comparison = "lower than" if difference < 0 else "higher than"
+    return f"**Carbon Emissions**: {carbon['this_flight'] / 1000:.1f} kg ({abs(difference)}% {comparison} average)\n\n"
+
+
+def render_flight_markdown(results, source_code, destination_code, max_options=3):
+    """
+    Render validated flight options as the Markdown/HTML flight section.
+
+    Args:
+        results (FlightResults): Validated flight options (at least one)
+        source_code (str): Requested source airport code
+        destination_code (str): Requested destination airport code
+        max_options (int): Number of options to show
+
+    Returns:
+        str: Markdown formatted flight details
+    """
+    options = results.options[:max_options]
+    url = results.google_flights_url or google_flights_url(source_code, destination_code)
+
+    # The model sometimes answers for a different route; show the requested one with a note
+    sample = (options[0].segments[0].departure.id != source_code
+              or options[0].segments[-1].arrival.id != destination_code)
+    parts = ["## ✈️ Flight Options\n\n", _route_template(source_code, destination_code, sample), _TABLE_HEADER]
+    parts.extend(_row_template(option, url) for option in options)
+    parts.append(_TABLE_FOOTER)
+
+    for number, option in enumerate(options, 1):
+        parts.append(f"#### Option {number}: ${option.price}\n\n")
+        parts.extend(_segment_template(index, segment) for index, segment in enumerate(option.segments, 1))
+        if option.layovers:
+            parts.append("**Layovers**:\n")
+            parts.extend(_layover_template(layover) for layover in option.layovers)
+            parts.append("\n")
+        if option.carbon_emissions:
+            parts.append(_carbon_template(option.carbon_emissions))
+        parts.append("---\n\n")
+
+    if results.partial:
+        parts.append(_PARTIAL_NOTE)
+    parts.append(_FOOTER)
+    return "".join(parts)
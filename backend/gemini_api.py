@@ -1,27 +1,249 @@
 import os
 import re
 import json
-import requests
-import google.generativeai as genai
+import time
+import textwrap
+import threading
+import contextvars
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Configure the Gemini API with your API key
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("No Gemini API key found. Please set the GEMINI_API_KEY environment variable.")
+from airports import get_airport_index, normalize_location
+from cache import (
+    response_cache, plan_cache_key, multi_city_cache_key, recommendations_cache_key, flights_cache_key,
+    airport_cache_key, refreshing
+)
+from semantic_cache import semantic_cache, recommendation_features
+from destinations import shortlist_destinations, trip_days
+from travel_dates import parse_travel_dates
+from routing import plan_route
+from model_backends import LazyBackend, RateLimitError
+from scheduler import scheduler, ScheduledBackend, SchedulerOverloaded, PRIORITY_AIRPORT
+from resilience import stages
+from metrics import observe_stage, record_model_response, record_model_error
+from flights import (
+    FLIGHT_STRUCTURED_OUTPUT, FLIGHT_RESPONSE_SCHEMA, FlightResults, FlightDataError,
+    parse_flight_results, render_flight_markdown, google_flights_url
+)
+
+# Model backend selected by MODEL_BACKEND (Gemini by default, "stub" for offline runs).
+# It is built on first use, so importing this module stays fast and works without
+# an API key. All calls go through the quota-aware scheduler.
+model = ScheduledBackend(LazyBackend(), scheduler)
+
+# Startup warm-up: "off" (everything is built by the first request), "load" (load the
+# airport index and model client in the background) or "connect" (also open
+# connections to the model endpoint)
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "load").lower()
+
+# Batched airport lookups: locations per prompt, and how many times entries with an
+# invalid answer are asked about again
+AIRPORT_BATCH_SIZE = int(os.getenv("AIRPORT_BATCH_SIZE", 50))
+AIRPORT_BATCH_ATTEMPTS = int(os.getenv("AIRPORT_BATCH_ATTEMPTS", 2))
+# Shortlisted destinations the model writes up, and the output budget per destination
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", 3))
+RECOMMENDATION_TOKENS_PER_DESTINATION = int(os.getenv("RECOMMENDATION_TOKENS_PER_DESTINATION", 300))
+
+# Trips of at least this many days get a sectioned itinerary (0 turns it off): a
+# compact skeleton first, then the day blocks and the transport, food and tips
+# sections are generated concurrently, each with its own output cap
+SECTIONED_ITINERARY_MIN_DAYS = int(os.getenv("SECTIONED_ITINERARY_MIN_DAYS", 8))
+ITINERARY_DAYS_PER_SECTION = int(os.getenv("ITINERARY_DAYS_PER_SECTION", 4))
+ITINERARY_MAX_DAY_SECTIONS = int(os.getenv("ITINERARY_MAX_DAY_SECTIONS", 5))
+ITINERARY_TOKENS_PER_DAY = int(os.getenv("ITINERARY_TOKENS_PER_DAY", 220))
+ITINERARY_SECTION_TOKENS = int(os.getenv("ITINERARY_SECTION_TOKENS", 400))
+# Section calls of all requests share ITINERARY_SECTION_THREADS threads, and one
+# request keeps at most ITINERARY_SECTIONS_IN_FLIGHT of them running, so a few
+# long trips at once each still get their sections generated in parallel
+ITINERARY_SECTION_THREADS = int(os.getenv("ITINERARY_SECTION_THREADS", 24))
+ITINERARY_SECTIONS_IN_FLIGHT = int(os.getenv("ITINERARY_SECTIONS_IN_FLIGHT", 8))
+
+# Sections generated alongside the day blocks: (heading, what it covers)
+ITINERARY_SECTIONS = (
+    ("## Getting Around", "local transportation options, passes and typical fares"),
+    ("## Must-Try Food", "must-try local dishes and restaurants that fit the budget"),
+    ("## Tips", "tips for the destination considering the interests, and special considerations "
+                "for the travel dates (seasonal events, weather, etc.)"),
+)
+
+# Departure used for flight lookups when the travel dates do not say when the trip starts
+FLIGHT_DEFAULT_LEAD_DAYS = int(os.getenv("FLIGHT_DEFAULT_LEAD_DAYS", 30))
+
+# Most locations accepted by /api/get-airport-codes
+AIRPORT_CODES_MAX_LOCATIONS = int(os.getenv("AIRPORT_CODES_MAX_LOCATIONS", 100))
+
+AIRPORT_CODES_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "index": {"type": "INTEGER"},
+            "code": {"type": "STRING"},
+        },
+        "required": ["index", "code"],
+    },
+}
+
+# Worker threads for the airport lookups and flight section that run alongside a
+# plan's main generation. Work submitted from one of these threads runs inline (see
+# _submit()), so a task never waits on a queue it is itself holding a worker of.
+_executor_thread = threading.local()
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gemini",
+                               initializer=lambda: setattr(_executor_thread, 'active', True))
+# Worker threads for itinerary sections, multi-city stops and legs (see _fan_out())
+_section_executor = ThreadPoolExecutor(max_workers=ITINERARY_SECTION_THREADS, thread_name_prefix="section")
+
+def call_model(stage, prompt, **kwargs):
+    """
+    Call the model for one pipeline stage ("airport", "itinerary", "itinerary_skeleton",
+    "itinerary_section", "flights" or "recommendations") with that stage's deadline,
+    hedging and circuit breaker.
+
+    The call's wall time, token usage and response size are recorded in metrics.
+    """
+    with observe_stage(stage):
+        try:
+            response = stages[stage].call(model.generate_content, prompt, **kwargs)
+        except Exception as e:
+            record_model_error(stage, e)
+            raise
+    record_model_response(stage, prompt, response)
+    return response
+
+def stream_model(stage, prompt, **kwargs):
+    """
+    Stream the model's answer for one pipeline stage, with that stage's deadline for
+    the first chunk, STREAM_IDLE_TIMEOUT between chunks and its circuit breaker.
+
+    Yields:
+        str: Text of each chunk
+    """
+    try:
+        for chunk in stages[stage].stream(model.generate_content, prompt, stream=True, **kwargs):
+            yield chunk.text
+    except Exception as e:
+        record_model_error(stage, e)
+        raise
+
+def _submit(func, *args, **kwargs):
+    """
+    Submit work to the executor, carrying over context such as the scheduling priority.
+
+    Called from an executor thread, the work runs right away in that thread instead:
+    waiting there on a queued future could leave every worker blocked on work that
+    no free worker is left to run.
+
+    Returns:
+        Future: The work's future (already done when it ran inline)
+    """
+    if getattr(_executor_thread, 'active', False):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return _executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
 
-genai.configure(api_key=GEMINI_API_KEY)
+def _fan_out(calls, limit=ITINERARY_SECTIONS_IN_FLIGHT):
+    """
+    Run one request's section calls on the section pool, at most `limit` at a time
+    and starting them in the given order.
 
-# Use the Gemini 2.0 Flash model
-model = genai.GenerativeModel('gemini-1.5-flash')
+    Args:
+        calls (list): (func, args, kwargs) tuples
 
-def generate_travel_plan(source, destination, dates, budget, travelers, interests, include_flights=False):
+    Returns:
+        list: A future per call, in call order; cancelling one that has not started skips it
+    """
+    futures = [Future() for _ in calls]
+    work = deque(zip(futures, calls))
+
+    def drain():
+        while work:
+            try:
+                future, (func, args, kwargs) = work.popleft()
+            except IndexError:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+    for _ in range(min(limit, len(calls))):
+        _section_executor.submit(contextvars.copy_context().run, drain)
+    return futures
+
+_warm_up_lock = threading.Lock()
+_warm_up_status = {'state': 'cold', 'error': None, 'duration_ms': None}
+
+def warm_up(connect=False):
+    """
+    Load the airport index and the model client, and optionally open connections
+    to the model endpoint, so the first request does not pay for them.
+
+    Args:
+        connect (bool): Also make a cheap call to the model endpoint
+
+    Returns:
+        dict: Warm-up state ("ready" or "failed"), error and duration in milliseconds
+    """
+    with _warm_up_lock:
+        if _warm_up_status['state'] != 'ready':
+            _warm_up_status.update(state='warming', error=None)
+            start = time.perf_counter()
+            try:
+                get_airport_index()
+                model.backend.load()
+                if connect:
+                    model.backend.warm_up()
+                _warm_up_status['state'] = 'ready'
+            except Exception as e:
+                print(f"Error warming up: {e}")
+                _warm_up_status.update(state='failed', error=str(e))
+            _warm_up_status['duration_ms'] = elapsed_ms(start)
+        return dict(_warm_up_status)
+
+def start_warm_up(mode=MODEL_WARMUP):
+    """Run warm_up() in a background thread according to MODEL_WARMUP"""
+    if mode == 'off':
+        return None
+    thread = threading.Thread(target=warm_up, args=(mode == 'connect',), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def readiness():
+    """
+    Report whether requests can be served, warming up on demand if nothing has yet
+    (MODEL_WARMUP=off) or the last attempt failed.
+
+    Returns:
+        tuple: (ready, warm-up status dict)
+    """
+    status = dict(_warm_up_status)
+    if status['state'] in ('cold', 'failed'):
+        status = warm_up()
+    return status['state'] == 'ready', status
+
+# Heading used for flight sections that only carry an error message
+FLIGHT_ERROR_HEADING = "## ✈️ Flight Information"
+
+def generate_travel_plan(source, destination, dates, budget, travelers, interests, include_flights=False,
+                         airport_codes=None):
     """
     Generate a travel plan using Gemini 2.0 Flash model.
 
+    Requests that only differ in formatting (city name case, "$3000" vs "3000 USD",
+    interest order, ...) are served from the response cache, and concurrent
+    identical requests share a single generation.
+
     Args:
         source (str): Departure location
         destination (str): Travel destination
@@ -30,27 +252,437 @@ def generate_travel_plan(source, destination, dates, budget, travelers, interest
         travelers (str): Number of travelers
         interests (list): List of interests/preferences
         include_flights (bool): Whether to include flight details
+        airport_codes (dict): Already resolved location -> airport code mapping (e.g. for a batch)
+
+    Returns:
+        dict: Generated travel plan, airport codes and per-stage timings in milliseconds
+    """
+    start = time.perf_counter()
+    timings = {}
+
+    result = response_cache.get_or_compute(
+        plan_cache_key(source, destination, dates, budget, travelers, interests, include_flights),
+        lambda: _generate_travel_plan(
+            source, destination, dates, budget, travelers, interests, include_flights, compute_timings(timings),
+            airport_codes
+        ),
+        should_cache=lambda plan: is_complete_plan(plan, include_flights)
+    )
+
+    timings["total"] = elapsed_ms(start)
+    return dict(result, timings=timings)
+
+def _generate_travel_plan(source, destination, dates, budget, travelers, interests, include_flights, timings,
+                          airport_codes=None):
+    """
+    Generate a travel plan without consulting the cache.
+
+    Independent model calls run concurrently: both airport lookups run together,
+    then the itinerary and the flight section (which both need the codes) overlap.
 
     Returns:
         dict: Generated travel plan and airport codes
     """
     # Get airport codes for source and destination
-    source_code = get_airport_code(source)
-    destination_code = get_airport_code(destination)
+    source_code, destination_code = _resolve_airport_codes(source, destination, timings, airport_codes)
+
+    # Start the flight section if requested and airport codes are available
+    flight_future = None
+    if include_flights and source_code and destination_code:
+        flight_future = _submit(
+            _timed, timings, "flights", get_flight_section, source_code, destination_code, dates
+        )
+
+    # Generate the itinerary using Gemini while the flight section is being generated
+    travel_plan = _timed(
+        timings, "itinerary", generate_itinerary,
+        source, destination, dates, budget, travelers, interests, source_code, destination_code
+    )
+
+    flight_details = None
+    if flight_future:
+        flight_details = flight_future.result()
+
+        if flight_details:
+            # Combine flight details with travel plan
+            travel_plan = flight_details + "\n\n" + travel_plan
+
+    return {
+        "travel_plan": travel_plan,
+        "source_code": source_code,
+        "destination_code": destination_code,
+        "flight_details": flight_details if include_flights else None
+    }
+
+def is_complete_plan(plan, include_flights):
+    """Only cache plans whose requested flight sections were all generated successfully"""
+    if not include_flights:
+        return True
+    flight_details = plan.get("flight_details")
+    return bool(flight_details) and FLIGHT_ERROR_HEADING not in flight_details
+
+def stream_travel_plan(source, destination, dates, budget, travelers, interests, include_flights=False):
+    """
+    Generate a travel plan incrementally using Gemini's streaming generation.
 
+    Yields (event, data) tuples in this order:
+        ("codes", {...})    airport codes, as soon as they are resolved
+        ("chunk", {...})    each Markdown fragment of the itinerary as it is generated
+                            (each whole section, in order, for a sectioned itinerary)
+        ("flights", {...})  the flight section, as soon as it is ready (only if requested)
+        ("done", {...})     the complete plan, airport codes and flight section
+
+    A cached plan is replayed immediately as "codes", "flights" and "done" events
+    (a stale one is refreshed in the background).
+
+    Args:
+        source (str): Departure location
+        destination (str): Travel destination
+        dates (str): Travel dates
+        budget (str): Budget for the trip
+        travelers (str): Number of travelers
+        interests (list): List of interests/preferences
+        include_flights (bool): Whether to include flight details
+
+    Yields:
+        tuple: (event name, event payload dict)
+    """
+    cache_key = plan_cache_key(source, destination, dates, budget, travelers, interests, include_flights)
+    cached = response_cache.get(
+        cache_key,
+        refresh=lambda: _generate_travel_plan(
+            source, destination, dates, budget, travelers, interests, include_flights, {}
+        ),
+        should_cache=lambda plan: is_complete_plan(plan, include_flights)
+    )
+    if cached is not None:
+        yield "codes", {
+            "source_code": cached["source_code"],
+            "destination_code": cached["destination_code"]
+        }
+        if cached["flight_details"]:
+            yield "flights", {"flight_details": cached["flight_details"]}
+        yield "done", cached
+        return
+
+    source_code, destination_code = _resolve_airport_codes(source, destination)
+
+    yield "codes", {
+        "source_code": source_code,
+        "destination_code": destination_code
+    }
+
+    # Generate the flight section in the background while the itinerary streams
+    flight_future = None
+    if include_flights and source_code and destination_code:
+        flight_future = _submit(get_flight_section, source_code, destination_code, dates)
+
+    chunks = []
+    flight_details = None
+    flights_sent = False
+
+    # Timed until the last chunk, including the time the client takes to read each one
+    with observe_stage("itinerary_stream"):
+        for text in stream_itinerary(
+            source, destination, dates, budget, travelers, interests, source_code, destination_code
+        ):
+            chunks.append(text)
+            yield "chunk", {"text": text}
+
+            if flight_future and not flights_sent and flight_future.done():
+                flight_details = flight_future.result()
+                flights_sent = True
+                yield "flights", {"flight_details": flight_details}
+
+    if flight_future and not flights_sent:
+        flight_details = flight_future.result()
+        yield "flights", {"flight_details": flight_details}
+
+    travel_plan = "".join(chunks)
+    if flight_details:
+        travel_plan = flight_details + "\n\n" + travel_plan
+
+    result = {
+        "travel_plan": travel_plan,
+        "source_code": source_code,
+        "destination_code": destination_code,
+        "flight_details": flight_details if include_flights else None
+    }
+    if is_complete_plan(result, include_flights):
+        response_cache.set(cache_key, result)
+
+    yield "done", result
+
+def _resolve_airport_codes(source, destination, timings=None, airport_codes=None):
+    """
+    Look up the source and destination airport codes concurrently, skipping
+    locations already present in `airport_codes`.
+
+    Returns:
+        tuple: (source_code, destination_code)
+    """
+    timings = {} if timings is None else timings
+    airport_codes = airport_codes or {}
+    if source in airport_codes and destination in airport_codes:
+        return airport_codes[source], airport_codes[destination]
+    source_future = _submit(_timed, timings, "source_airport", _known_or_lookup, airport_codes, source)
+    destination_future = _submit(_timed, timings, "destination_airport", _known_or_lookup, airport_codes, destination)
+    return source_future.result(), destination_future.result()
+
+def _known_or_lookup(airport_codes, location):
+    if location in airport_codes:
+        return airport_codes[location]
+    return get_airport_code(location)
+
+def compute_timings(timings):
+    """
+    Where a response cache compute function records its stage timings: the
+    request's own dict, or a fresh one when a background refresh of a stale entry
+    runs it, since the request that scheduled the refresh is already returning
+    its timings.
+    """
+    return {} if refreshing() else timings
+
+def _timed(timings, stage, func, *args, **kwargs):
+    """Call func and record its wall time in milliseconds under timings[stage]"""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings[stage] = elapsed_ms(start)
+
+def elapsed_ms(start):
+    """Milliseconds elapsed since a time.perf_counter() reading"""
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def generate_itinerary(source, destination, dates, budget, travelers, interests, source_code, destination_code):
+    """
+    Generate the itinerary Markdown, in parallel sections for long trips.
+
+    Returns:
+        str: Itinerary in Markdown
+    """
+    days = sectioned_itinerary_days(dates)
+    if days:
+        return "".join(iter_sectioned_itinerary(
+            source, destination, dates, budget, travelers, interests, source_code, destination_code, days
+        )).strip()
+
+    prompt = build_travel_plan_prompt(
+        source, destination, dates, budget, travelers, interests, source_code, destination_code
+    )
+    return call_model("itinerary", prompt).text
+
+def stream_itinerary(source, destination, dates, budget, travelers, interests, source_code, destination_code):
+    """
+    Generate the itinerary Markdown incrementally.
+
+    Yields:
+        str: Streamed fragments of the itinerary, or whole sections (in document
+             order) of a sectioned itinerary
+    """
+    days = sectioned_itinerary_days(dates)
+    if days:
+        yield from iter_sectioned_itinerary(
+            source, destination, dates, budget, travelers, interests, source_code, destination_code, days
+        )
+        return
+
+    prompt = build_travel_plan_prompt(
+        source, destination, dates, budget, travelers, interests, source_code, destination_code
+    )
+    yield from stream_model("itinerary", prompt)
+
+def sectioned_itinerary_days(dates):
+    """Number of days if the trip is long enough for a sectioned itinerary, otherwise None"""
+    days = trip_days(dates)
+    if SECTIONED_ITINERARY_MIN_DAYS and days >= SECTIONED_ITINERARY_MIN_DAYS:
+        return days
+    return None
+
+def iter_sectioned_itinerary(source, destination, dates, budget, travelers, interests, source_code, destination_code,
+                             days):
+    """
+    Generate a long trip's itinerary in sections.
+
+    A compact skeleton (day-by-day outline, places to stay, cost estimate) is
+    generated first. Every block of days and each of ITINERARY_SECTIONS is then
+    generated concurrently from it with its own output cap, so the wall time
+    depends on the longest section rather than on the length of the trip.
+
+    Yields:
+        str: Markdown parts in document order, each as soon as it (and the parts
+             before it) are ready
+    """
+    details = build_trip_details(
+        source, destination, dates, budget, travelers, interests, source_code, destination_code
+    )
+    skeleton = call_model(
+        "itinerary_skeleton", build_itinerary_skeleton_prompt(details, days), **output_budget(skeleton_tokens(days))
+    ).text
+    title, outline, overview = parse_itinerary_skeleton(skeleton, destination)
+
+    day_calls, section_calls = sectioned_itinerary_calls(details, days, outline)
+    futures = _fan_out([
+        (call_model, ("itinerary_section", prompt), options) for prompt, options, _ in day_calls + section_calls
+    ])
+    day_futures, section_futures = futures[:len(day_calls)], futures[len(day_calls):]
+
+    try:
+        yield title + "\n\n## Day-by-Day Itinerary\n\n"
+        for future in day_futures:
+            yield format_itinerary_part(future.result().text)
+        if overview:
+            yield overview + "\n\n"
+        for future, (_, _, heading) in zip(section_futures, section_calls):
+            yield format_itinerary_part(future.result().text, heading)
+    finally:
+        # Stop sections that have not started if generation failed or the client went away
+        for future in day_futures + section_futures:
+            future.cancel()
+
+def output_budget(tokens):
+    """Model call options with an output size estimate and a cap slightly above it"""
+    return {'expected_output_tokens': tokens, 'max_output_tokens': tokens + 100}
+
+def skeleton_tokens(days):
+    """Output size of an itinerary skeleton: a line per day plus the stay and cost sections"""
+    return ITINERARY_SECTION_TOKENS + 25 * days
+
+def itinerary_day_blocks(days):
+    """
+    Split a trip into blocks of consecutive days, each generated by one call.
+
+    Blocks hold up to ITINERARY_DAYS_PER_SECTION days (more for very long trips, so
+    there are at most ITINERARY_MAX_DAY_SECTIONS of them) and are evened out, so no
+    block takes much longer than the others.
+
+    Returns:
+        list: (first day, last day) tuples, 1-based and inclusive
+    """
+    count = min(-(-days // max(ITINERARY_DAYS_PER_SECTION, 1)), max(ITINERARY_MAX_DAY_SECTIONS, 1))
+    bounds = [round(days * i / count) for i in range(count + 1)]
+    return [(bounds[i] + 1, bounds[i + 1]) for i in range(count)]
+
+def sectioned_itinerary_calls(details, days, outline):
+    """
+    Prompts and output options of the calls that run in parallel after the skeleton.
+
+    Returns:
+        tuple: ([(prompt, options, None)] for the day blocks,
+                [(prompt, options, heading)] for ITINERARY_SECTIONS)
+    """
+    day_calls = [
+        (build_itinerary_days_prompt(details, days, outline, first, last),
+         output_budget(ITINERARY_TOKENS_PER_DAY * (last - first + 1)), None)
+        for first, last in itinerary_day_blocks(days)
+    ]
+    section_calls = [
+        (build_itinerary_section_prompt(details, days, outline, heading, topic),
+         output_budget(ITINERARY_SECTION_TOKENS), heading)
+        for heading, topic in ITINERARY_SECTIONS
+    ]
+    return day_calls, section_calls
+
+def parse_itinerary_skeleton(text, destination):
+    """
+    Split an itinerary skeleton into the parts the final plan is stitched from.
+
+    Returns:
+        tuple: (title and summary, day-by-day outline, remaining "##" sections such
+               as where to stay and estimated costs). If the model left out the
+               outline heading, the whole skeleton is used as the outline.
+    """
+    parts = re.split(r'^(?=##\s)', text.strip(), flags=re.MULTILINE)
+    title = parts[0].strip() if not parts[0].startswith('##') else ""
+    sections = [part.strip() for part in parts if part.startswith('##')]
+    outline = next((section for section in sections if 'outline' in section.split('\n', 1)[0].lower()), None)
+    if outline is None:
+        return f"# Your Trip to {destination}", text.strip(), ""
+    overview = "\n\n".join(section for section in sections if section is not outline)
+    return title or f"# Your Trip to {destination}", outline.split('\n', 1)[-1].strip(), overview
+
+def format_itinerary_part(text, heading=None):
+    """Normalize a generated section for stitching, adding its heading if the model left it out"""
+    text = text.strip()
+    if heading and not text.startswith('#'):
+        text = f"{heading}\n\n{text}"
+    return text + "\n\n"
+
+def build_trip_details(source, destination, dates, budget, travelers, interests, source_code, destination_code):
+    """The trip's details as the bullet list shared by the itinerary prompts"""
     # Format interests as a comma-separated string
     interests_str = ", ".join(interests)
+    # Spell out the parsed dates so the model plans the right days and season
+    travel_dates = parse_travel_dates(dates)
 
-    # Create a prompt for the Gemini model
-    prompt = f"""
-    Act as an expert travel planner. Create a detailed travel itinerary with the following information:
-
-    - Source: {source} {f"({source_code})" if source_code else ""}
+    return f"""    - Source: {source} {f"({source_code})" if source_code else ""}
     - Destination: {destination} {f"({destination_code})" if destination_code else ""}
-    - Travel Dates: {dates}
+    - Travel Dates: {dates}{f" ({travel_dates.describe()})" if travel_dates else ""}
     - Budget: {budget}
     - Number of Travelers: {travelers}
-    - Interests: {interests_str}
+    - Interests: {interests_str}"""
+
+def build_itinerary_skeleton_prompt(details, days):
+    """Build the prompt for the compact outline of a sectioned itinerary"""
+    return f"""
+    Act as an expert travel planner. Write a compact outline of a {days}-day trip with the following information:
+
+{details}
+
+    Reply in Markdown with exactly these parts and nothing else:
+    1. A "# <trip title>" heading and one sentence summarizing the trip
+    2. A "## Trip Outline" section with one line per day, "- Day <n>: <area or theme>", for all {days} days
+    3. A "## Where to Stay" section recommending 2-3 places to stay within the budget
+    4. A "## Estimated Costs" section with bullet points for accommodations, food, transportation and activities
+
+    Keep each outline line under 12 words and each other section under 80 words.
+    """
+
+def build_itinerary_days_prompt(details, days, outline, first, last):
+    """Build the prompt for one block of days of a sectioned itinerary"""
+    return f"""
+    Act as an expert travel planner. Write the detailed plan for days {first}-{last} of this {days}-day trip:
+
+{details}
+
+    Trip outline:
+{textwrap.indent(outline, '    ')}
+
+    For each of days {first} to {last}, add a "### Day <n>" heading followed by Morning, Afternoon and Evening
+    bullet points with activities and attractions that follow the outline. Keep each day under 100 words and
+    do not add any other headings, introduction or summary.
+    """
+
+def build_itinerary_section_prompt(details, days, outline, heading, topic):
+    """Build the prompt for one topical section (food, transport, tips) of a sectioned itinerary"""
+    return f"""
+    Act as an expert travel planner. Write one section of the travel plan for this {days}-day trip:
+
+{details}
+
+    Trip outline:
+{textwrap.indent(outline, '    ')}
+
+    Write only a "{heading}" section covering {topic}, as Markdown bullet points.
+    Keep it under 150 words and do not add any other headings.
+    """
+
+def build_travel_plan_prompt(source, destination, dates, budget, travelers, interests, source_code, destination_code):
+    """
+    Build the itinerary prompt for the Gemini model.
+
+    Returns:
+        str: Prompt text
+    """
+    details = build_trip_details(
+        source, destination, dates, budget, travelers, interests, source_code, destination_code
+    )
+
+    return f"""
+    Act as an expert travel planner. Create a detailed travel itinerary with the following information:
+
+{details}
 
     Please include:
     1. A day-by-day itinerary with activities and attractions
@@ -65,50 +697,221 @@ def generate_travel_plan(source, destination, dates, budget, travelers, interest
     bullet points, and emphasis where appropriate. Make it visually structured and easy to read.
     """
 
-    # Generate content using Gemini
-    response = model.generate_content(prompt)
-    travel_plan = response.text
+def get_flight_section(source_code, destination_code, dates):
+    """
+    Generate the Markdown flight section for a route.
 
-    # Add flight details if requested and airport codes are available
-    flight_details = None
-    if include_flights and source_code and destination_code:
-        # Try to extract a date in YYYY-MM-DD format from the dates string
-        # This is a simple approach - in a production app, you would want more robust date parsing
-        travel_date = None
-
-        # Try to find a date in YYYY-MM-DD format
-        date_match = re.search(r'(\d{4}-\d{2}-\d{2})', dates)
-        if date_match:
-            travel_date = date_match.group(1)
-        else:
-            # Try to parse common date formats
-            # For simplicity, we will just use a default date if we can not parse
-            # In a real app, you would want to use a proper date parsing library
-            travel_date = "2025-04-02"  # Default date for testing
-
-        # Get flight details
-        flight_data = get_flight_details(source_code, destination_code, travel_date)
-
-        if flight_data:
-            # Check if there was an error
-            if 'error' in flight_data:
-                flight_details = f"## ✈️ Flight Information\n\n{flight_data['error']}\n\nPlease try again later or check your airport codes."
-            else:
-                flight_details = format_flight_details_markdown(flight_data, source_code, destination_code)
+    Args:
+        source_code (str): Source airport code
+        destination_code (str): Destination airport code
+        dates (str): Travel dates as entered by the user
 
-            # Combine flight details with travel plan
-            travel_plan = flight_details + "\n\n" + travel_plan
+    Returns:
+        str: Markdown flight section or None if no flight data was produced
+    """
+    # Get flight details
+    flight_data = get_flight_details(source_code, destination_code, extract_travel_date(dates))
+    return format_flight_section(flight_data, source_code, destination_code)
+
+def format_flight_section(flight_data, source_code, destination_code):
+    """
+    Turn flight data (or its error) into the Markdown flight section.
+
+    Returns:
+        str: Markdown flight section or None if there is no flight data
+    """
+    if not flight_data:
+        return None
+
+    # Check if there was an error
+    if 'error' in flight_data:
+        return f"{FLIGHT_ERROR_HEADING}\n\n{flight_data['error']}\n\nPlease try again later or check your airport codes."
+
+    return format_flight_details_markdown(flight_data, source_code, destination_code)
+
+def generate_multi_city_plan(source, cities, dates, budget, travelers, interests, include_flights=False,
+                             optimize_order=True, round_trip=False):
+    """
+    Generate a travel plan that visits several cities.
+
+    All locations are resolved in one batch and the cities are ordered for the
+    shortest route locally (see routing.py), without the model. Every city's part
+    of the itinerary and every leg's flight section are then generated concurrently.
+
+    Args:
+        source (str): Departure location
+        cities (list): Cities to visit
+        dates (str): Travel dates for the whole trip
+        budget (str): Budget for the trip
+        travelers (str): Number of travelers
+        interests (list): List of interests/preferences
+        include_flights (bool): Whether to include a flight section for every leg
+        optimize_order (bool): Whether to reorder the cities for the shortest route
+        round_trip (bool): Whether the trip ends back at the source
+
+    Returns:
+        dict: Generated travel plan, route (stops and legs), airport codes and per-stage timings in milliseconds
+    """
+    start = time.perf_counter()
+    timings = {}
+
+    result = response_cache.get_or_compute(
+        multi_city_cache_key(
+            source, cities, dates, budget, travelers, interests, include_flights, optimize_order, round_trip
+        ),
+        lambda: _generate_multi_city_plan(
+            source, cities, dates, budget, travelers, interests, include_flights, optimize_order, round_trip,
+            compute_timings(timings)
+        ),
+        should_cache=lambda plan: is_complete_plan(plan, include_flights)
+    )
+
+    timings["total"] = elapsed_ms(start)
+    return dict(result, timings=timings)
+
+def _generate_multi_city_plan(source, cities, dates, budget, travelers, interests, include_flights, optimize_order,
+                              round_trip, timings):
+    """Generate a multi-city travel plan without consulting the cache"""
+    codes = _timed(timings, "airports", get_airport_codes, [source, *cities])
+    route = _timed(timings, "routing", plan_multi_city_route, source, cities, codes, dates, optimize_order, round_trip)
+
+    start = time.perf_counter()
+    city_calls = [
+        (call_model, ("itinerary_section", prompt), options)
+        for prompt, options in multi_city_calls(route, budget, travelers, interests)
+    ]
+    flight_calls = [(get_leg_flight_section, (leg,), {}) for leg in route['legs']] if include_flights else []
+    futures = _fan_out(city_calls + flight_calls)
+    city_futures, flight_futures = futures[:len(city_calls)], futures[len(city_calls):]
+    try:
+        city_sections = [future.result().text for future in city_futures]
+        flight_sections = [future.result() for future in flight_futures]
+    finally:
+        # Stop sections that have not started if generation failed
+        for future in city_futures + flight_futures:
+            future.cancel()
+    timings["sections"] = elapsed_ms(start)
+
+    return assemble_multi_city_plan(source, route, city_sections, flight_sections, include_flights)
+
+def plan_multi_city_route(source, cities, codes, dates, optimize_order=True, round_trip=False):
+    """Order the stops of a multi-city trip and split its dates across them"""
+    travel_dates = parse_travel_dates(dates)
+    start_date = datetime.date.fromisoformat(extract_travel_date(dates))
+    return plan_route(
+        source, cities, codes, start_date, travel_dates.days if travel_dates else None, optimize_order, round_trip
+    )
+
+def get_leg_flight_section(leg):
+    """Markdown flight section for one leg of a multi-city route, or None if a code is unknown"""
+    if not leg['from_code'] or not leg['to_code']:
+        return None
+    flight_data = get_flight_details(leg['from_code'], leg['to_code'], leg['date'])
+    return format_flight_section(flight_data, leg['from_code'], leg['to_code'])
+
+def multi_city_calls(route, budget, travelers, interests):
+    """
+    Prompts and model options for every city of a multi-city route.
+
+    Returns:
+        list: (prompt, options) per stop, in route order
+    """
+    days = route['stops'][-1]['last_day']
+    path = " → ".join([route['legs'][0]['from']] + [leg['to'] for leg in route['legs']])
+    calls = []
+    for stop, leg in zip(route['stops'], route['legs']):
+        stay = stop['last_day'] - stop['first_day'] + 1
+        last_date = datetime.date.fromisoformat(stop['arrive']) + datetime.timedelta(days=stay - 1)
+        details = build_trip_details(
+            leg['from'], stop['city'], f"{stop['arrive']} to {last_date.isoformat()}",
+            budget, travelers, interests, leg['from_code'], stop['code']
+        )
+        prompt = build_city_stay_prompt(details, days, path, stop)
+        calls.append((prompt, output_budget(ITINERARY_TOKENS_PER_DAY * stay + ITINERARY_SECTION_TOKENS)))
+    return calls
+
+def multi_city_heading(stop):
+    """Heading of a city's part of a multi-city plan"""
+    if stop['first_day'] == stop['last_day']:
+        return f"## {stop['city']} (Day {stop['first_day']})"
+    return f"## {stop['city']} (Days {stop['first_day']}-{stop['last_day']})"
+
+def assemble_multi_city_plan(source, route, city_sections, flight_sections, include_flights):
+    """
+    Stitch the route overview, city sections and leg flight sections into one plan.
 
+    Returns:
+        dict: Travel plan, airport codes, flight sections and route
+    """
+    stops, legs = route['stops'], route['legs']
+    path = " → ".join([source] + [leg['to'] for leg in legs])
+    lines = [f"# Multi-City Trip: {path}", "", "## Route", "",
+             "| Stop | Days | Dates | Flight distance |", "|------|------|-------|-----------------|"]
+    for stop, leg in zip(stops, legs):
+        distance = f"{leg['distance_km']:,} km" if leg['distance_km'] is not None else "-"
+        code = f" ({stop['code']})" if stop['code'] else ""
+        lines.append(
+            f"| {stop['city']}{code} | {stop['first_day']}-{stop['last_day']} | {stop['arrive']} to {stop['depart']} | {distance} |"
+        )
+    if route['distance_km'] is not None:
+        lines += ["", f"**Total flight distance:** {route['distance_km']:,} km"]
+
+    parts = ["\n".join(lines) + "\n\n"]
+    flight_sections = flight_sections or [None] * len(legs)
+    for stop, city_section, flight_section in zip(stops, city_sections, flight_sections):
+        if flight_section:
+            parts.append(flight_section.strip() + "\n\n")
+        parts.append(format_itinerary_part(city_section, multi_city_heading(stop)))
+    if len(legs) > len(stops) and flight_sections[-1]:
+        # The flight home on a round trip
+        parts.append(flight_sections[-1].strip() + "\n\n")
+
+    flight_details = "\n\n".join(section.strip() for section in flight_sections if section)
     return {
-        "travel_plan": travel_plan,
-        "source_code": source_code,
-        "destination_code": destination_code,
-        "flight_details": flight_details if include_flights else None
+        "travel_plan": "".join(parts).strip(),
+        "source_code": legs[0]['from_code'],
+        "destination_code": stops[-1]['code'],
+        "flight_details": (flight_details or None) if include_flights else None,
+        "route": route
     }
 
+def build_city_stay_prompt(details, days, path, stop):
+    """Build the prompt for one city's part of a multi-city itinerary"""
+    first, last = stop['first_day'], stop['last_day']
+    return f"""
+    Act as an expert travel planner. Write the part of this {days}-day multi-city trip ({path})
+    covering the stay in {stop['city']}, days {first}-{last}:
+
+{details}
+
+    Start with a "{multi_city_heading(stop)}" heading. For each of days {first} to {last}, add a "### Day <n>"
+    heading followed by Morning, Afternoon and Evening bullet points with activities and attractions, then
+    "Where to stay" and "Must-try food" with at most three bullet points each. Keep each day under 100 words and
+    do not add an introduction or summary.
+    """
+
+def extract_travel_date(dates):
+    """
+    Extract the departure date used for flight lookups from the travel dates string.
+
+    Dates that do not say when the trip starts ("10 days", "flexible") get a
+    departure FLIGHT_DEFAULT_LEAD_DAYS from today.
+
+    Returns:
+        str: Date in YYYY-MM-DD format
+    """
+    travel_dates = parse_travel_dates(dates)
+    if travel_dates and travel_dates.start:
+        return travel_dates.start.isoformat()
+    return (datetime.date.today() + datetime.timedelta(days=FLIGHT_DEFAULT_LEAD_DAYS)).isoformat()
+
 def get_airport_code(location):
     """
-    Convert a location name to its corresponding airport code using Gemini API.
+    Convert a location name to its corresponding airport code.
+
+    The bundled airport index is consulted first; Gemini is only asked when the
+    index has no match. Its answer is written back into the index and the shared
+    response cache, so other worker processes don't ask again.
 
     Args:
         location (str): Name of the location (city, country, etc.)
@@ -116,7 +919,36 @@ def get_airport_code(location):
     Returns:
         str: 3-letter IATA airport code or None if not found
     """
-    prompt = f"""
+    airport_index = get_airport_index()
+    with observe_stage("airport_index"):
+        airport_code = airport_index.lookup(location)
+    if airport_code:
+        return airport_code
+
+    airport_code = response_cache.get_or_compute(
+        airport_cache_key(location), lambda: _generate_airport_code(location), should_cache=bool
+    )
+    if airport_code:
+        # Cache the answer so the next lookup for this location skips the model
+        airport_index.remember(location, airport_code)
+    return airport_code
+
+def _generate_airport_code(location):
+    """Ask Gemini for a location's airport code without consulting the caches"""
+    try:
+        response = call_model(
+            "airport", build_airport_code_prompt(location), priority=PRIORITY_AIRPORT, expected_output_tokens=16
+        )
+        return parse_airport_code(response.text)
+    except (SchedulerOverloaded, RateLimitError):
+        raise
+    except Exception as e:
+        print(f"Error getting airport code: {e}")
+        return None
+
+def build_airport_code_prompt(location):
+    """Build the prompt asking Gemini for a location's IATA code"""
+    return f"""
     Convert the following location to its primary international airport's IATA code:
     Location: {location}
 
@@ -125,26 +957,169 @@ def get_airport_code(location):
     with confidence, respond with "UNKNOWN".
     """
 
-    try:
-        response = model.generate_content(prompt)
-        airport_code = response.text.strip()
-
-        # Validate that the response is a 3-letter code
-        if re.match(r'^[A-Z]{3}$', airport_code):
-            return airport_code
-        else:
-            # If the response contains a 3-letter code, extract it
-            match = re.search(r'[A-Z]{3}', airport_code)
-            if match:
-                return match.group(0)
-            return None
-    except Exception as e:
-        print(f"Error getting airport code: {e}")
+def parse_airport_code(text):
+    """
+    Extract a 3-letter IATA code from a model response.
+
+    Returns:
+        str: Airport code or None if the model did not give one
+    """
+    airport_code = text.strip()
+
+    if "UNKNOWN" in airport_code:
         return None
 
+    # Validate that the response is a 3-letter code
+    if re.match(r'^[A-Z]{3}$', airport_code):
+        return airport_code
+
+    # If the response contains a 3-letter code, extract it
+    match = re.search(r'\b[A-Z]{3}\b', airport_code)
+    return match.group(0) if match else None
+
+def get_airport_codes(locations):
+    """
+    Convert many location names to airport codes with as few model calls as possible.
+
+    Locations are deduplicated and looked up in the airport index; the misses are
+    resolved together in one structured prompt (per AIRPORT_BATCH_SIZE locations).
+    Only the entries whose answer fails validation are asked about again.
+
+    Args:
+        locations (list): Location names
+
+    Returns:
+        dict: Each given location -> 3-letter IATA airport code, or None if not found
+    """
+    codes, pending = _index_airport_codes(locations)
+    for attempt in range(AIRPORT_BATCH_ATTEMPTS):
+        retry = {}
+        for batch in _airport_batches(pending):
+            try:
+                response = call_model(
+                    "airport", build_airport_codes_prompt(list(batch.values())), priority=PRIORITY_AIRPORT,
+                    expected_output_tokens=16 * len(batch), response_schema=AIRPORT_CODES_SCHEMA
+                )
+                answers = parse_airport_codes(response.text, len(batch))
+            except (SchedulerOverloaded, RateLimitError):
+                raise
+            except Exception as e:
+                print(f"Error getting airport codes: {e}")
+                answers = {}
+            retry.update(_apply_airport_codes(codes, batch, answers))
+        pending = retry
+    return {location: codes.get(normalize_location(location)) for location in locations}
+
+def _index_airport_codes(locations):
+    """
+    Resolve locations from the airport index, then from codes other worker
+    processes got from the model (in the shared response cache).
+
+    Returns:
+        tuple: ({normalized location: code}, {normalized location: location} still to ask the model about)
+    """
+    airport_index = get_airport_index()
+    codes = {}
+    pending = {}
+    with observe_stage("airport_index"):
+        for location in locations:
+            key = normalize_location(location)
+            if key in codes or key in pending:
+                continue
+            airport_code = airport_index.lookup(location)
+            if airport_code:
+                codes[key] = airport_code
+            else:
+                pending[key] = location
+    for key, location in list(pending.items()):
+        airport_code = response_cache.get(airport_cache_key(location))
+        if airport_code:
+            airport_index.remember(location, airport_code)
+            codes[key] = airport_code
+            del pending[key]
+    return codes, pending
+
+def _airport_batches(pending):
+    """Split pending locations into prompts of at most AIRPORT_BATCH_SIZE"""
+    items = list(pending.items())
+    return [dict(items[i:i + AIRPORT_BATCH_SIZE]) for i in range(0, len(items), AIRPORT_BATCH_SIZE)]
+
+def _apply_airport_codes(codes, batch, answers):
+    """
+    Record the valid answers for a batch (remembering codes in the airport index
+    and the shared response cache).
+
+    Returns:
+        dict: The batch entries without a valid answer, to be asked about again
+    """
+    airport_index = get_airport_index()
+    retry = {}
+    for number, (key, location) in enumerate(batch.items(), start=1):
+        if number not in answers:
+            retry[key] = location
+            continue
+        codes[key] = answers[number]
+        if answers[number]:
+            airport_index.remember(location, answers[number])
+            response_cache.set(airport_cache_key(location), answers[number])
+    return retry
+
+def build_airport_codes_prompt(locations):
+    """Build the prompt asking Gemini for the IATA codes of several locations"""
+    numbered = "\n".join(f"{number}. {location}" for number, location in enumerate(locations, start=1))
+    return f"""
+    Convert each of the following locations to its primary international airport's IATA code:
+    {numbered}
+
+    Respond with ONLY a JSON array containing one object per location, like:
+    [{{"index": 1, "code": "JFK"}}, {{"index": 2, "code": "UNKNOWN"}}]
+
+    "index" is the location's number in the list and "code" is the 3-letter IATA airport code in uppercase.
+    If there are multiple major airports, provide the code for the most commonly used international airport.
+    If you cannot determine a location's airport code with confidence, use "UNKNOWN" as its code.
+    """
+
+def parse_airport_codes(text, count):
+    """
+    Validate a model response to build_airport_codes_prompt().
+
+    Entries with a malformed code, an index outside 1..count or a duplicate index
+    are dropped, so the caller can ask about those locations again.
+
+    Returns:
+        dict: Location number (1-based) -> airport code, or None for "UNKNOWN"
+    """
+    text = text.strip()
+    match = re.search(r'\[.*\]', text, re.DOTALL)
+    try:
+        entries = json.loads(match.group(0) if match else text)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(entries, list):
+        return {}
+
+    answers = {}
+    seen = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        number, code = entry.get('index'), entry.get('code')
+        if isinstance(number, bool) or not isinstance(number, int) or not 1 <= number <= count:
+            continue
+        if number in seen:
+            # Conflicting answers for one location: trust neither
+            answers.pop(number, None)
+            continue
+        seen.add(number)
+        if code is None or (isinstance(code, str) and code.strip().upper() == "UNKNOWN"):
+            answers[number] = None
+        elif isinstance(code, str) and re.match(r'^[A-Z]{3}$', code.strip()):
+            answers[number] = code.strip()
+    return answers
+
 def get_flight_details(source_code, destination_code, date):
     """
-    Generate flight details using Gemini.
+    Generate flight details using Gemini, served from the response cache when possible.
 
     Args:
         source_code (str): Source airport code
@@ -154,23 +1129,55 @@ def get_flight_details(source_code, destination_code, date):
     Returns:
         dict: Flight details
     """
+    return response_cache.get_or_compute(
+        flights_cache_key(source_code, destination_code, date),
+        lambda: _generate_flight_details(source_code, destination_code, date),
+        should_cache=lambda flight_data: 'error' not in flight_data and not flight_data.get('partial')
+    )
+
+def _generate_flight_details(source_code, destination_code, date):
+    """
+    Generate flight details using Gemini without consulting the cache.
+
+    Returns:
+        dict: Flight details, or a dict with an 'error' key on failure
+    """
     try:
-        # Format the date if needed (assuming date might be in various formats)
-        # If date is not in YYYY-MM-DD format, we need to convert it
-        formatted_date = date
-        if not re.match(r'^\d{4}-\d{2}-\d{2}$', date):
-            # This is a simple conversion - in a real app, you would want more robust date parsing
-            # For now, we will just use a default date if the format doesn't match
-            formatted_date = "2025-04-02"  # Default date
-
-        # Instead of using an API, we'll create a direct link to Google Flights
-        # and generate some basic flight information using Gemini
-
-        # Create a Google Flights URL that users can visit
-        google_flights_url = f"https://www.google.com/travel/flights?hl=en&curr=USD&q=flights%20{source_code}%20to%20{destination_code}&dates={formatted_date}"
-
-        # Use Gemini to generate some basic flight information
-        prompt = f"""
+        # Generate flight data using Gemini
+        response = call_model(
+            "flights", build_flight_details_prompt(source_code, destination_code, date), **flight_output_options()
+        )
+        return parse_flight_details(response.text)
+
+    except Exception as e:
+        print(f"Error generating flight data: {e}")
+        return {
+            'error': f"Error generating flight data: {str(e)}"
+        }
+
+def build_flight_details_prompt(source_code, destination_code, date):
+    """
+    Build the prompt asking Gemini for flight options on a route.
+
+    Args:
+        source_code (str): Source airport code
+        destination_code (str): Destination airport code
+        date (str): Travel date in YYYY-MM-DD format
+
+    Returns:
+        str: Prompt text
+    """
+    # Dates in other formats ("June 10", "10/06/2025") are converted to YYYY-MM-DD
+    formatted_date = date
+    if not re.match(r'^\d{4}-\d{2}-\d{2}$', date):
+        formatted_date = extract_travel_date(date)
+
+    # Instead of using an API, we'll create a direct link to Google Flights
+    # and generate some basic flight information using Gemini
+    flights_url = google_flights_url(source_code, destination_code, formatted_date)
+
+    # Use Gemini to generate some basic flight information
+    return f"""
         Generate realistic flight information for a flight from {source_code} to {destination_code} on {formatted_date}.
 
         Include the following details for 3 flight options:
@@ -201,48 +1208,42 @@ def get_flight_details(source_code, destination_code, date):
             }}
           ],
           "search_metadata": {{
-            "google_flights_url": "{google_flights_url}"
+            "google_flights_url": "{flights_url}"
           }}
         }}
 
         Make the data realistic but varied between the 3 options. Include both direct and connecting flights.
         """
 
-        # Generate flight data using Gemini
-        response = model.generate_content(prompt)
+def flight_output_options():
+    """Model call options that constrain the flights stage to FLIGHT_RESPONSE_SCHEMA JSON"""
+    return {'response_schema': FLIGHT_RESPONSE_SCHEMA} if FLIGHT_STRUCTURED_OUTPUT else {}
 
-        try:
-            # Try to parse the response as JSON
-            flight_data = json.loads(response.text)
-            return flight_data
-        except json.JSONDecodeError:
-            # If the response is not valid JSON, extract it from the text
-            json_match = re.search(r'```json\n(.*?)\n```', response.text, re.DOTALL)
-            if json_match:
-                try:
-                    flight_data = json.loads(json_match.group(1))
-                    return flight_data
-                except json.JSONDecodeError:
-                    return {
-                        'error': "Unable to parse flight data from Gemini response"
-                    }
-            else:
-                return {
-                    'error': "Unable to retrieve flight data in the correct format"
-                }
+@observe_stage("json_parse")
+def parse_flight_details(text):
+    """
+    Parse and validate flight data from a model response.
 
-    except Exception as e:
-        print(f"Error generating flight data: {e}")
+    Options that cannot be read are dropped, and the complete options of a
+    truncated response are kept; either way the result is marked 'partial'.
+
+    Returns:
+        dict: Flight details, or a dict with an 'error' key if no flight data was found
+    """
+    try:
+        return parse_flight_results(text).to_dict()
+    except FlightDataError as e:
         return {
-            'error': f"Error generating flight data: {str(e)}"
+            'error': str(e)
         }
 
+@observe_stage("flight_markdown")
 def format_flight_details_markdown(flight_data, source_code, destination_code):
     """
     Format flight details as Markdown with table format.
 
     Args:
-        flight_data (dict): Flight data from SerpAPI
+        flight_data (dict | FlightResults): Flight data from get_flight_details()
         source_code (str): Source airport code
         destination_code (str): Destination airport code
 
@@ -252,196 +1253,115 @@ def format_flight_details_markdown(flight_data, source_code, destination_code):
     if not flight_data:
         return "## ✈️ Flight Information\n\nUnable to retrieve flight details at this time.\n\nPlease try again later."
 
-    if 'error' in flight_data:
-        return f"## ✈️ Flight Information\n\n{flight_data['error']}\n\nPlease check your airport codes and try again."
+    if isinstance(flight_data, dict):
+        if 'error' in flight_data:
+            return f"## ✈️ Flight Information\n\n{flight_data['error']}\n\nPlease check your airport codes and try again."
+        flight_data = FlightResults.from_dict(flight_data)
 
-    if 'best_flights' not in flight_data or not flight_data['best_flights']:
+    if not flight_data.options:
         return "## ✈️ Flight Information\n\nNo flights found for this route and date.\n\nPlease try different dates or destinations."
 
-    # Get up to 3 flight options
-    flights = flight_data['best_flights'][:3]
-
-    # Check if we're using mock data with different airport codes
-    # If so, we'll display the user's requested codes but note that we're showing sample data
-    actual_source = None
-    actual_destination = None
-
-    if flights and flights[0].get('flights'):
-        first_flight = flights[0]['flights'][0]
-        last_flight = flights[0]['flights'][-1]
-
-        if first_flight.get('departure_airport', {}).get('id'):
-            actual_source = first_flight['departure_airport']['id']
-
-        if last_flight.get('arrival_airport', {}).get('id'):
-            actual_destination = last_flight['arrival_airport']['id']
-
-    markdown = "## ✈️ Flight Options\n\n"
-
-    if actual_source and actual_destination and (actual_source != source_code or actual_destination != destination_code):
-        markdown += f"**Requested Route**: {source_code} to {destination_code}\n\n"
-        markdown += "*Note: Showing sample flight data for demonstration purposes.*\n\n"
-    else:
-        markdown += f"**From**: {source_code} to **{destination_code}**\n\n"
-
-    # Create a table for flight options with proper spacing
-    # Use HTML directly for better control over table formatting
-    markdown += "<div class='flight-table-container'>\n"
-    markdown += "<table class='flight-table'>\n"
-    markdown += "<thead>\n"
-    markdown += "<tr>\n"
-    markdown += "<th>Airline</th>\n"
-    markdown += "<th>Price</th>\n"
-    markdown += "<th>Duration</th>\n"
-    markdown += "<th>Departure</th>\n"
-    markdown += "<th>Arrival</th>\n"
-    markdown += "<th>Stops</th>\n"
-    markdown += "<th>Book</th>\n"
-    markdown += "</tr>\n"
-    markdown += "</thead>\n"
-    markdown += "<tbody>\n"
-
-    for flight in flights:
-        # Get basic flight info
-        airline = flight.get('airline', 'Multiple')
-        price = flight.get('price', 'N/A')
-
-        # Format duration
-        total_duration_min = flight.get('total_duration', 0)
-        total_duration_hr = total_duration_min // 60
-        total_duration_min_remainder = total_duration_min % 60
-        duration = f"{total_duration_hr}h {total_duration_min_remainder}m"
-
-        # Get first and last flight segments
-        flight_segments = flight.get('flights', [])
-        if flight_segments:
-            first_segment = flight_segments[0]
-            last_segment = flight_segments[-1]
-
-            # Departure info
-            departure = first_segment.get('departure_airport', {})
-            dep_time = departure.get('time', '').split(' ')[1] if ' ' in departure.get('time', '') else departure.get('time', '')
-            dep_info = f"{dep_time} ({departure.get('id', '')})"
-
-            # Arrival info
-            arrival = last_segment.get('arrival_airport', {})
-            arr_time = arrival.get('time', '').split(' ')[1] if ' ' in arrival.get('time', '') else arrival.get('time', '')
-            arr_info = f"{arr_time} ({arrival.get('id', '')})"
-
-            # Stops
-            stops = len(flight_segments) - 1
-            stops_text = "Nonstop" if stops == 0 else f"{stops} stop{'s' if stops > 1 else ''}"
-
-            # Booking link
-            booking_link = "[Book](" + flight_data['search_metadata']['google_flights_url'] + ")"
-
-            # Add row to table with HTML
-            markdown += "<tr>\n"
-            markdown += f"<td>{airline}</td>\n"
-            markdown += f"<td>${price}</td>\n"
-            markdown += f"<td>{duration}</td>\n"
-            markdown += f"<td>{dep_info}</td>\n"
-            markdown += f"<td>{arr_info}</td>\n"
-            markdown += f"<td>{stops_text}</td>\n"
-            markdown += f"<td><a href='{flight_data['search_metadata']['google_flights_url']}' target='_blank'>Book</a></td>\n"
-            markdown += "</tr>\n"
-
-    # Close the table
-    markdown += "</tbody>\n"
-    markdown += "</table>\n"
-    markdown += "</div>\n"
-
-    markdown += "\n### Flight Details\n\n"
-
-    # Add detailed information for each flight
-    for i, flight in enumerate(flights):
-        markdown += f"#### Option {i+1}: ${flight.get('price', 'N/A')}\n\n"
-
-        # Flight segments
-        flight_segments = flight.get('flights', [])
-        for j, segment in enumerate(flight_segments):
-            departure = segment.get('departure_airport', {})
-            arrival = segment.get('arrival_airport', {})
-
-            # Format times
-            dep_time = departure.get('time', '').split(' ')[1] if ' ' in departure.get('time', '') else departure.get('time', '')
-            arr_time = arrival.get('time', '').split(' ')[1] if ' ' in arrival.get('time', '') else arrival.get('time', '')
-
-            # Duration
-            duration_min = segment.get('duration', 0)
-            duration_hr = duration_min // 60
-            duration_min_remainder = duration_min % 60
-
-            markdown += f"**Segment {j+1}**: {departure.get('id', '')} → {arrival.get('id', '')}\n"
-            markdown += f"* {segment.get('airline', 'N/A')} {segment.get('flight_number', '')}\n"
-            markdown += f"* Depart: {departure.get('name', 'N/A')} at {dep_time}\n"
-            markdown += f"* Arrive: {arrival.get('name', 'N/A')} at {arr_time}\n"
-            markdown += f"* Duration: {duration_hr}h {duration_min_remainder}m\n"
-            markdown += f"* Aircraft: {segment.get('airplane', 'N/A')}\n"
-
-            if segment.get('overnight'):
-                markdown += "* **Overnight flight**\n"
-
-            markdown += "\n"
-
-        # Layovers
-        layovers = flight.get('layovers', [])
-        if layovers:
-            markdown += "**Layovers**:\n"
-            for layover in layovers:
-                duration_min = layover.get('duration', 0)
-                duration_hr = duration_min // 60
-                duration_min_remainder = duration_min % 60
-                markdown += f"* {layover.get('name', 'N/A')} ({layover.get('id', 'N/A')}): {duration_hr}h {duration_min_remainder}m\n"
-
-            markdown += "\n"
-
-        # Carbon emissions
-        carbon = flight.get('carbon_emissions', {})
-        if carbon:
-            diff = carbon.get('difference_percent', 0)
-            comparison = "lower than" if diff < 0 else "higher than"
-            markdown += f"**Carbon Emissions**: {carbon.get('this_flight', 0)/1000:.1f} kg ({abs(diff)}% {comparison} average)\n\n"
-
-        markdown += "---\n\n"
-
-    markdown += "*Flight data generated by Gemini AI. Click 'Book' to see actual flights on Google Flights.*\n\n"
-
-    return markdown
-
-def get_destination_recommendations(interests, budget, dates, travelers):
+    return render_flight_markdown(flight_data, source_code, destination_code)
+
+def get_destination_recommendations(interests, budget, dates, travelers, shortlist=None):
     """
     Get destination recommendations based on user preferences.
 
+    Destinations are ranked from the bundled catalog and the model only writes up
+    the top RECOMMENDATION_TOP_K. Exact repeats are served from the response cache
+    and near-identical requests whose shortlist still includes the destinations an
+    earlier answer wrote up from the similarity cache.
+
     Args:
         interests (list): List of interests/preferences
         budget (str): Budget for the trip
         dates (str): Travel dates
         travelers (str): Number of travelers
+        shortlist (list): Ranked shortlist from shortlist_destinations(), if already computed
 
     Returns:
         str: Destination recommendations
     """
+    if shortlist is None:
+        shortlist = shortlist_destinations(interests, budget, dates, travelers)
+    return response_cache.get_or_compute(
+        recommendations_cache_key(interests, budget, dates, travelers),
+        lambda: _similar_or_generate_recommendations(interests, budget, dates, travelers, shortlist)
+    )
+
+def stream_destination_recommendations(interests, budget, dates, travelers):
+    """
+    Recommend destinations as a sequence of events for Server-Sent Events.
+
+    Yields:
+        tuple: ("shortlist", {...}) as soon as the catalog is ranked, then
+               ("done", {...}) with the written recommendations
+    """
+    shortlist = shortlist_destinations(interests, budget, dates, travelers)
+    yield "shortlist", {'shortlist': shortlist}
+    recommendations = get_destination_recommendations(interests, budget, dates, travelers, shortlist)
+    yield "done", {'recommendations': recommendations, 'shortlist': shortlist}
+
+def _similar_or_generate_recommendations(interests, budget, dates, travelers, shortlist):
+    """
+    Reuse the recommendations of a near-identical earlier request that covers only
+    destinations in this request's shortlist, or write up its top candidates
+    """
+    candidates = shortlist[:RECOMMENDATION_TOP_K]
+    features = recommendation_features(interests, budget, dates, travelers, candidates)
+    shown = [destination['name'] for destination in shortlist]
+    with observe_stage("semantic_lookup"):
+        recommendations = semantic_cache.lookup(features, shown)
+    if recommendations is None:
+        recommendations = _generate_destination_recommendations(interests, budget, dates, travelers, candidates)
+        semantic_cache.add(features, recommendations)
+    return recommendations
+
+def _generate_destination_recommendations(interests, budget, dates, travelers, candidates):
+    """
+    Generate destination recommendations using Gemini without consulting the cache.
+
+    Returns:
+        str: Destination recommendations
+    """
+    response = call_model(
+        "recommendations", build_recommendations_prompt(interests, budget, dates, travelers, candidates),
+        **recommendation_output_options(candidates)
+    )
+
+    return response.text
+
+def recommendation_output_options(candidates):
+    """Output size estimate and cap for writing up the shortlisted destinations"""
+    return output_budget(RECOMMENDATION_TOKENS_PER_DESTINATION * max(len(candidates), 1))
+
+def build_recommendations_prompt(interests, budget, dates, travelers, candidates):
+    """Build the prompt asking Gemini to write up the shortlisted destinations"""
     interests_str = ", ".join(interests)
+    destinations = "\n".join(
+        f"    {i}. {candidate['name']}, {candidate['country']} ({candidate['airport_code']}) - "
+        f"about ${candidate['daily_cost_usd']} per person per day"
+        for i, candidate in enumerate(candidates, start=1)
+    )
 
-    prompt = f"""
-    Act as a travel destination expert. Recommend 5 destinations that would be perfect for a traveler with the following preferences:
+    return f"""
+    Act as a travel destination expert. Write short recommendations for these destinations, in this order,
+    for a traveler with the following preferences:
 
     - Interests: {interests_str}
     - Budget: {budget}
     - Travel Dates: {dates}
     - Number of Travelers: {travelers}
 
-    For each destination, provide:
-    1. Why it's a good match for the interests
-    2. Typical costs and how they align with the budget
-    3. Weather and conditions during the specified dates
-    4. Top 3 attractions or activities related to the interests
+    Destinations:
+{destinations}
 
-    Format your response in Markdown with proper headings (using # for main headings, ## for subheadings),
-    bullet points, and emphasis where appropriate. Make it visually structured and easy to read.
-    """
+    Start with a "# Recommended Destinations" heading. For each destination, add a "## <number>. <destination>"
+    heading followed by:
+    1. Why it's a good match for the interests (one or two sentences)
+    2. Typical costs and how they align with the budget (one sentence)
+    3. Weather and conditions during the specified dates (one sentence)
+    4. Top 3 attractions or activities related to the interests, as bullet points
 
-    response = model.generate_content(prompt)
-
-    return response.text
\ No newline at end of file
+    Keep each destination under 120 words. Use Markdown bullet points and emphasis where appropriate.
+    """
@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables (this module can run as a standalone worker)
+load_dotenv()
+
+from cache import plan_cache_key
+from model_backends import RateLimitError
+from scheduler import SchedulerOverloaded, priority_scope, PRIORITY_BULK
+from resilience import CircuitOpenError
+
+# Background jobs. Plans can be submitted as jobs that a pool of worker threads
+# generates from a persistent SQLite queue, so a client that disconnects does not
+# throw away a generation that is already paid for. Jobs survive restarts: workers
+# hold a lease on their job and renew it while they run, so a job whose worker
+# died is picked up again once the lease expires. Identical
+# submissions (after the same normalization as the response cache) share one job.
+#
+# Workers can also run in a separate process against the same database:
+#
+#     python jobs.py
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(os.path.dirname(__file__), 'jobs', 'jobs.sqlite3'))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 24 * 60 * 60))
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", 30))
+
+# How often idle workers look for jobs queued by other processes or whose lease expired
+_IDLE_POLL_SECONDS = 1.0
+
+# Errors that say "try again later" rather than "this job cannot succeed"
+TRANSIENT_ERRORS = (SchedulerOverloaded, RateLimitError, CircuitOpenError)
+
+FINISHED = ('done', 'failed')
+
+
+def _run_plan(payload):
+    from gemini_api import generate_travel_plan
+    from plans import with_plan_id
+    return with_plan_id(generate_travel_plan(**payload))
+
+
+# Job kind -> function called with the job payload; its return value is the job result
+HANDLERS = {
+    'plan': _run_plan,
+}
+
+
+def plan_job_id(source, destination, dates, budget, travelers, interests, include_flights=False):
+    """Job id for a plan request; requests that share a response cache entry share a job"""
+    key = plan_cache_key(source, destination, dates, budget, travelers, interests, include_flights)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+class JobQueue:
+    """Persistent job queue with leased claims and an in-process worker pool"""
+
+    def __init__(self, path=JOB_QUEUE_PATH, workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS,
+                 lease_seconds=JOB_LEASE_SECONDS, retention_seconds=JOB_RETENTION_SECONDS):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._conn = None
+        self._threads = []
+        self._running = set()
+        self._stopping = threading.Event()
+        self._last_purge = 0.0
+
+    def _connect(self):
+        """Open the database on first use. Caller must hold the lock."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "available_at REAL NOT NULL, lease_until REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)")
+        return self._conn
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def submit(self, job_id, kind, payload):
+        """
+        Queue a job unless one with the same id is queued, running or done.
+
+        A failed job, or a finished one older than the retention period, is queued again.
+
+        Returns:
+            dict: The job (see get())
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT status, updated_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    conn.execute(
+                        "INSERT INTO jobs (id, kind, payload, status, available_at, created_at, updated_at) "
+                        "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                        (job_id, kind, json.dumps(payload), now, now, now)
+                    )
+                elif row[0] == 'failed' or (row[0] == 'done' and row[1] + self.retention_seconds < now):
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', result = NULL, error = NULL, attempts = 0, "
+                        "available_at = ?, lease_until = NULL, created_at = ?, updated_at = ? WHERE id = ?",
+                        (now, now, now, job_id)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._notify()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """
+        Return a job's public state, or None if there is no such job.
+
+        Returns:
+            dict: job_id, kind, status ("queued", "running", "done" or "failed"),
+                  attempts, timestamps, and the result or error once finished
+        """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT id, kind, status, result, error, attempts, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, kind, status, result, error, attempts, created_at, updated_at = row
+        return {
+            'job_id': job_id,
+            'kind': kind,
+            'status': status,
+            'result': json.loads(result) if result is not None else None,
+            'error': error,
+            'attempts': attempts,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+
+    def wait(self, job_id, timeout):
+        """
+        Long-poll: return the job once it has finished or `timeout` seconds have passed.
+
+        Returns:
+            dict: The job, or None if there is no such job
+        """
+        deadline = time.monotonic() + min(timeout, JOB_MAX_WAIT_SECONDS)
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in FINISHED or remaining <= 0:
+                return job
+            # Woken by local workers; the timeout also catches workers in other processes
+            with self._changed:
+                self._changed.wait(min(remaining, _IDLE_POLL_SECONDS))
+
+    def _claim(self):
+        """
+        Lease the oldest runnable job: queued, or running under an expired lease
+        (its worker died, e.g. in a restart).
+
+        Returns:
+            tuple: (job_id, kind, payload, attempts) or None
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs "
+                    "WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                        "WHERE id = ?",
+                        (now + self.lease_seconds, now, row[0])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, kind, payload, attempts = row
+        return job_id, kind, json.loads(payload), attempts + 1
+
+    def _finish(self, job_id, status, result=None, error=None, retry_after=None):
+        now = time.time()
+        if retry_after is not None:
+            update = ("UPDATE jobs SET status = 'queued', error = ?, available_at = ?, lease_until = NULL, "
+                      "updated_at = ? WHERE id = ?", (error, now + retry_after, now, job_id))
+        else:
+            update = ("UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? "
+                      "WHERE id = ?", (status, json.dumps(result) if result is not None else None, error, now, job_id))
+        with self._lock:
+            self._connect().execute(*update)
+        self._notify()
+
+    def run_one(self):
+        """
+        Claim and run a single job.
+
+        Returns:
+            bool: True if a job was run
+        """
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        job_id, kind, payload, attempts = claimed
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            self._run(job_id, kind, payload, attempts)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+        return True
+
+    def _run(self, job_id, kind, payload, attempts):
+        """Run a claimed job and record its result, a retry or the failure"""
+        if attempts > self.max_attempts:
+            # Its workers kept dying before finishing it
+            self._finish(job_id, 'failed', error=f"Job abandoned after {self.max_attempts} attempts")
+            return
+
+        try:
+            with priority_scope(PRIORITY_BULK):
+                result = HANDLERS[kind](payload)
+        except TRANSIENT_ERRORS as e:
+            if attempts < self.max_attempts:
+                self._finish(job_id, 'queued', error=str(e), retry_after=getattr(e, 'retry_after', None) or 5)
+            else:
+                self._finish(job_id, 'failed', error=str(e))
+        except Exception as e:
+            print(f"Error running job {job_id}: {e}")
+            self._finish(job_id, 'failed', error=str(e))
+        else:
+            self._finish(job_id, 'done', result=result)
+
+    def _renew_leases(self):
+        """Keep extending the leases of the jobs this process is running"""
+        while not self._stopping.wait(self.lease_seconds / 3):
+            now = time.time()
+            with self._lock:
+                for job_id in self._running:
+                    self._connect().execute(
+                        "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                        (now + self.lease_seconds, job_id)
+                    )
+
+    def purge(self):
+        """Delete finished jobs older than the retention period"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)
+            )
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_one():
+                    continue
+                if time.time() - self._last_purge > 600:
+                    self._last_purge = time.time()
+                    self.purge()
+            except Exception as e:
+                print(f"Error in job worker: {e}")
+            with self._changed:
+                self._changed.wait(_IDLE_POLL_SECONDS)
+
+    def start(self):
+        """Start the worker threads (once); with workers=0 this process only queues jobs"""
+        if self._threads or not self.workers:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            if not self.workers:
+                return
+            targets = [(self._renew_leases, "job-leases")]
+            targets += [(self._work, f"job-worker-{i}") for i in range(self.workers)]
+            for target, name in targets:
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        self._notify()
+
+    def stats(self):
+        """Number of jobs in each status"""
+        with self._lock:
+            rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+# Shared job queue for this process
+job_queue = JobQueue()
+
+
+def submit_plan_job(source, destination, dates, budget, travelers, interests, include_flights=False):
+    """
+    Queue a travel plan for background generation.
+
+    Returns:
+        dict: The job; submitting the same trip again returns the same job
+    """
+    payload = {
+        'source': source,
+        'destination': destination,
+        'dates': dates,
+        'budget': budget,
+        'travelers': travelers,
+        'interests': interests,
+        'include_flights': include_flights,
+    }
+    job_id = plan_job_id(source, destination, dates, budget, travelers, interests, include_flights)
+    return job_queue.submit(job_id, 'plan', payload)
+
+
+if __name__ == '__main__':
+    # Standalone worker process for the shared queue
+    job_queue.start()
+    print(f"Processing jobs from {job_queue.path} with {job_queue.workers} workers")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        job_queue.stop()
@@ -0,0 +1,287 @@
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Lightweight in-process instrumentation exposed in the Prometheus text format.
+# Observations are a bisect and a few dict updates under a lock, cheap enough to
+# leave on in production. Stage timings are also collected per request for the
+# Server-Timing response header.
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    type = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative histogram with labels"""
+
+    type = "histogram"
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self._values = {}  # label key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        samples = []
+        for key, counts in values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts[:-1]):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key + (("le", bound),), cumulative))
+            samples.append((f"{self.name}_count", key, cumulative))
+            samples.append((f"{self.name}_sum", key, round(counts[-1], 6)))
+        return samples
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors and renders them for /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Add a function called at scrape time that returns a list of
+        (name, type, help, [(labels dict, value), ...]) tuples.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for collector in self._collectors:
+            for name, metric_type, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    "travel_planner_stage_seconds", "Wall time of each pipeline stage",
+    TIME_BUCKETS, ("stage",)))
+model_tokens = registry.register(Histogram(
+    "travel_planner_model_tokens", "Prompt and response token counts per model call",
+    TOKEN_BUCKETS, ("stage", "kind")))
+model_response_bytes = registry.register(Histogram(
+    "travel_planner_model_response_bytes", "Size of model responses",
+    BYTE_BUCKETS, ("stage",)))
+model_errors = registry.register(Counter(
+    "travel_planner_model_errors_total", "Failed model calls",
+    ("stage", "error")))
+http_request_seconds = registry.register(Histogram(
+    "travel_planner_http_request_seconds", "Wall time of HTTP requests (until the response starts)",
+    TIME_BUCKETS, ("endpoint", "status")))
+
+# Stage timings of the request being handled, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def observe_stage(stage):
+    """Time a block as a pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def record_model_response(stage, prompt, response):
+    """
+    Record token usage and response size for a completed model call.
+
+    Token counts come from the response's usage_metadata; SDK versions that do not
+    report usage fall back to the scheduler's ~4 characters per token estimate.
+    """
+    try:
+        text = response.text
+    except Exception:
+        text = ""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+        response_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    else:
+        prompt_tokens, response_tokens = len(prompt) // 4, len(text) // 4
+    model_tokens.observe(prompt_tokens, stage=stage, kind="prompt")
+    model_tokens.observe(response_tokens, stage=stage, kind="response")
+    model_response_bytes.observe(len(text.encode('utf-8')), stage=stage)
+
+
+def record_model_error(stage, error):
+    model_errors.inc(stage=stage, error=type(error).__name__)
+
+
+def begin_request():
+    """
+    Start collecting stage timings for the current request.
+
+    Returns:
+        float: Request start time, to pass to finish_request()
+    """
+    _request_timings.set([])
+    return time.perf_counter()
+
+
+def finish_request(start, endpoint, status):
+    """
+    Record the request duration and build its Server-Timing header value.
+
+    Returns:
+        str: Server-Timing header value
+    """
+    elapsed = time.perf_counter() - start
+    http_request_seconds.observe(elapsed, endpoint=endpoint, status=status)
+    timings = _request_timings.get() or []
+    entries = [f"{stage};dur={duration * 1000:.1f}" for stage, duration in timings]
+    entries.append(f"total;dur={elapsed * 1000:.1f}")
+    return ", ".join(entries)
+
+
+_startup_phases = {}
+
+
+def mark_startup(phase, started):
+    """
+    Record, once, the seconds from `started` (a perf_counter() reading taken when
+    the app module began importing) to a startup phase such as "imported" or
+    "first_request".
+    """
+    if phase not in _startup_phases:
+        _startup_phases[phase] = round(time.perf_counter() - started, 4)
+
+
+def startup_phases():
+    return dict(_startup_phases)
+
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format"""
+    return registry.render()
+
+
+def _cache_collector():
+    from cache import response_cache
+    stats = response_cache.stats()
+    return [
+        ("travel_planner_cache_lookups_total", "counter", "Response cache lookups by result",
+         [({"result": result}, stats[result])
+          for result in ('memory_hits', 'disk_hits', 'stale_hits', 'misses', 'coalesced', 'shared_waits')]),
+        ("travel_planner_cache_refreshes_total", "counter", "Stale response cache entries refreshed in the background",
+         [({}, stats['refreshes'])]),
+        ("travel_planner_cache_entries", "gauge", "Entries in the in-memory response cache",
+         [({}, stats['memory_entries'])]),
+    ]
+
+
+def _semantic_cache_collector():
+    from semantic_cache import semantic_cache
+    stats = semantic_cache.stats()
+    return [
+        ("travel_planner_semantic_cache_lookups_total", "counter", "Similarity cache lookups by result",
+         [({"result": result}, stats[result]) for result in ('hits', 'misses')]),
+        ("travel_planner_semantic_cache_evictions_total", "counter", "Similarity cache entries evicted when full",
+         [({}, stats['evictions'])]),
+        ("travel_planner_semantic_cache_entries", "gauge", "Entries in the similarity cache",
+         [({}, stats['entries'])]),
+    ]
+
+
+def _scheduler_collector():
+    from scheduler import scheduler
+    stats = scheduler.stats()
+    return [
+        ("travel_planner_scheduler_events_total", "counter", "Model call scheduler events",
+         [({"event": event}, stats[event]) for event in ('admitted', 'rejected', 'retries', 'rate_limited')]),
+        ("travel_planner_scheduler_waiting", "gauge", "Model calls waiting for quota",
+         [({}, stats['waiting'])]),
+    ]
+
+
+def _resilience_collector():
+    from resilience import resilience_stats
+    stats = resilience_stats()
+    events = ('calls', 'successes', 'failures', 'timeouts', 'hedges', 'hedge_wins', 'short_circuited', 'overloaded')
+    return [
+        ("travel_planner_stage_events_total", "counter", "Model stage calls, failures, timeouts and hedges",
+         [({"stage": stage, "event": event}, values[event]) for stage, values in stats.items() for event in events]),
+        ("travel_planner_breaker_open", "gauge", "1 if the stage's circuit breaker is not closed",
+         [({"stage": stage}, int(values['breaker_state'] != 'closed')) for stage, values in stats.items()]),
+    ]
+
+
+def _startup_collector():
+    return [
+        ("travel_planner_startup_seconds", "gauge", "Seconds from app import to each startup phase",
+         [({"phase": phase}, seconds) for phase, seconds in startup_phases().items()]),
+    ]
+
+
+registry.add_collector(_startup_collector)
+registry.add_collector(_cache_collector)
+registry.add_collector(_semantic_cache_collector)
+registry.add_collector(_scheduler_collector)
+registry.add_collector(_resilience_collector)
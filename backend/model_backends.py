@@ -0,0 +1,174 @@
+import os
+import threading
+import dataclasses
+
+# Model backends. Everything in gemini_api/async_api calls the model through
+# generate_content()/generate_content_async(), the same interface as
+# google.generativeai.GenerativeModel, so backends can be swapped without touching
+# the callers. Select one with the MODEL_BACKEND environment variable.
+
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash")
+
+
+class ModelBackendError(Exception):
+    """Raised by a backend when the upstream model call fails"""
+
+
+class RateLimitError(ModelBackendError):
+    """Raised by a backend when the upstream model rejects a call because of quota limits"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ModelBackend:
+    """
+    Interface for text generation backends.
+
+    Responses expose the generated text as `.text`; streaming calls return an
+    iterable (or async iterable) of such chunks.
+
+    Backends accept `response_schema=` (an OpenAPI-style dict) to ask for JSON of
+    that shape; those without a structured-output mode ignore it and rely on the
+    prompt's instructions.
+    `max_output_tokens=` caps the length of the answer.
+    """
+
+    name = None
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        raise NotImplementedError
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Open connections to the model endpoint ahead of the first call (optional)"""
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini via the google-generativeai SDK"""
+
+    name = "gemini"
+
+    def __init__(self, model_name=GEMINI_MODEL_NAME, api_key=None):
+        import google.generativeai as genai
+
+        # Configure the Gemini API with your API key
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("No Gemini API key found. Please set the GEMINI_API_KEY environment variable.")
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self._model = genai.GenerativeModel(model_name)
+        # JSON mode (response_mime_type/response_schema) needs google-generativeai >= 0.5
+        config_fields = {field.name for field in dataclasses.fields(genai.types.GenerationConfig)}
+        self.supports_json_mode = 'response_schema' in config_fields
+
+    def _call_options(self, kwargs):
+        """Translate backend-neutral options into google-generativeai arguments"""
+        response_schema = kwargs.pop('response_schema', None)
+        if response_schema is not None and self.supports_json_mode:
+            kwargs['generation_config'] = dict(
+                kwargs.get('generation_config') or {},
+                response_mime_type="application/json",
+                response_schema=response_schema
+            )
+        max_output_tokens = kwargs.pop('max_output_tokens', None)
+        if max_output_tokens is not None:
+            kwargs['generation_config'] = dict(kwargs.get('generation_config') or {}, max_output_tokens=max_output_tokens)
+        return kwargs
+
+    def warm_up(self):
+        """
+        Make a cheap count_tokens call so DNS, TLS and the SDK's pooled channel are
+        set up before the first real request reuses them.
+        """
+        self._model.count_tokens("warm-up")
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        from google.api_core import exceptions as google_exceptions
+        try:
+            return self._model.generate_content(prompt, stream=stream, **self._call_options(kwargs))
+        except google_exceptions.ResourceExhausted as e:
+            raise RateLimitError(str(e)) from e
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        from google.api_core import exceptions as google_exceptions
+        try:
+            return await self._model.generate_content_async(prompt, stream=stream, **self._call_options(kwargs))
+        except google_exceptions.ResourceExhausted as e:
+            raise RateLimitError(str(e)) from e
+
+
+class LazyBackend(ModelBackend):
+    """
+    Builds the configured backend on first use.
+
+    Importing the app therefore neither imports the model SDK nor needs
+    credentials; a missing API key surfaces as an error on the first model call
+    (and in /readyz) instead of at startup.
+    """
+
+    def __init__(self, name=None):
+        self.name = (name or MODEL_BACKEND).lower()
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._backend is not None
+
+    def load(self):
+        """Return the real backend, creating it if needed"""
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = create_backend(self.name)
+        return self._backend
+
+    def warm_up(self):
+        self.load().warm_up()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        return self.load().generate_content(prompt, stream=stream, **kwargs)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        return await self.load().generate_content_async(prompt, stream=stream, **kwargs)
+
+
+def create_backend(name=None):
+    """
+    Create the configured model backend.
+
+    With MODEL_CASSETTE_MODE=record the backend's calls are recorded to cassettes;
+    with MODEL_CASSETTE_MODE=replay they are answered from them instead (see
+    cassette_backend).
+
+    Args:
+        name (str): Backend name ("gemini" or "stub"); defaults to MODEL_BACKEND
+
+    Returns:
+        ModelBackend: Backend instance
+    """
+    name = (name or MODEL_BACKEND).lower()
+    from cassette_backend import MODEL_CASSETTE_MODE, RecordingBackend, ReplayBackend
+    if MODEL_CASSETTE_MODE == "replay":
+        return ReplayBackend.from_env(name, live=lambda: _create_live_backend(name))
+    if MODEL_CASSETTE_MODE == "record":
+        return RecordingBackend.from_env(_create_live_backend(name))
+    if MODEL_CASSETTE_MODE:
+        raise ValueError(f"Unknown MODEL_CASSETTE_MODE: {MODEL_CASSETTE_MODE}")
+    return _create_live_backend(name)
+
+
+def _create_live_backend(name):
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "stub":
+        from stub_backend import StubBackend
+        return StubBackend.from_env()
+    raise ValueError(f"Unknown model backend: {name}")
@@ -0,0 +1,326 @@
+import os
+import re
+import gzip
+import asyncio
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from cache import CACHE_DIR, LRUCache
+
+try:
+    import brotli
+except ImportError:  # optional: responses fall back to gzip
+    brotli = None
+
+# Content-addressed plan storage. Every generated plan is stored under a hash of
+# its content, so sharing or reloading a plan fetches it with GET /api/plans/<id>
+# instead of generating it again, and identical plans are stored once. A stored
+# plan never changes, so responses carry a strong ETag (answered with 304 when the
+# client already has it) and can be cached by browsers and proxies indefinitely.
+# Clients can fetch single sections ("flights", "day-3", "tips", ...) instead of
+# the whole document, and large bodies are compressed with brotli or gzip as the
+# client accepts.
+
+PLAN_STORE_PATH = os.getenv("PLAN_STORE_PATH", os.path.join(CACHE_DIR, 'plans.sqlite3'))
+PLAN_RETENTION_SECONDS = float(os.getenv("PLAN_RETENTION_SECONDS", 30 * 24 * 60 * 60))
+# Smaller bodies are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+
+PLAN_FIELDS = ('travel_plan', 'source_code', 'destination_code', 'flight_details')
+PLAN_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# Encodings we can produce, most preferred first
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+_DAY_RE = re.compile(r'^#{2,4}\s*\**\s*Day\s+(\d+)\b', re.IGNORECASE)
+_HEADING_RE = re.compile(r'^(#{1,4})\s+(.*)$')
+
+
+def plan_document(result):
+    """The stored part of a generate_travel_plan() result (timings are per request)"""
+    return {field: result.get(field) for field in PLAN_FIELDS}
+
+
+def plan_id(document):
+    """Content hash of a plan document"""
+    payload = json.dumps(document, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def section_name(heading):
+    """Section name for a Markdown heading ("## Must-Try Food" -> "must-try-food")"""
+    return re.sub(r'[^a-z0-9]+', '-', heading.lower()).strip('-')
+
+
+def plan_sections(document):
+    """
+    Split a plan into named sections.
+
+    Returns:
+        dict: "flights" (if the plan has a flight section), "day-<n>" for each day of
+              the itinerary and one entry per other "##" heading, in document order,
+              each mapped to its Markdown
+    """
+    sections = {}
+    flight_details = document.get('flight_details')
+    travel_plan = document.get('travel_plan') or ''
+    if flight_details:
+        sections['flights'] = flight_details
+        if travel_plan.startswith(flight_details):
+            travel_plan = travel_plan[len(flight_details):]
+
+    name, level, lines = None, 0, []
+    for line in travel_plan.splitlines():
+        day = _DAY_RE.match(line)
+        heading = _HEADING_RE.match(line)
+        # A section runs until the next day or a heading at its own level or above
+        if day or (heading and name and len(heading.group(1)) <= level):
+            _add_section(sections, name, lines)
+            name, lines = None, []
+        if day:
+            name, level = f"day-{int(day.group(1))}", len(line) - len(line.lstrip('#'))
+        elif heading and name is None and len(heading.group(1)) == 2:
+            name, level = section_name(heading.group(2)), 2
+        if name:
+            lines.append(line)
+    _add_section(sections, name, lines)
+    return sections
+
+
+def _add_section(sections, name, lines):
+    """Keep the first section of each name, skipping headings with nothing under them"""
+    if name and name not in sections and any(line.strip() for line in lines[1:]):
+        sections[name] = "\n".join(lines).strip()
+
+
+class PlanStore:
+    """Content-addressed plan documents in SQLite, gzip-compressed at rest"""
+
+    def __init__(self, path=PLAN_STORE_PATH, retention_seconds=PLAN_RETENTION_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        # Recently read plans, and their encoded response bodies
+        self._documents = LRUCache(max_entries=256, ttl=retention_seconds)
+        self._bodies = LRUCache(max_entries=512, ttl=retention_seconds)
+        self._last_purge = 0.0
+
+    def _connect(self):
+        """Open the database on first use. Caller must hold the lock."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                "id TEXT PRIMARY KEY, body BLOB NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    def save(self, result):
+        """
+        Store a plan unless an identical one is already stored.
+
+        Args:
+            result (dict): generate_travel_plan() result or plan document
+
+        Returns:
+            str: The plan id, or None if the plan could not be stored
+        """
+        document = plan_document(result)
+        key = plan_id(document)
+        if not self.path:
+            self._documents.set(key, document)
+            return key
+        body = gzip.compress(json.dumps(document, ensure_ascii=False).encode('utf-8'), mtime=0)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                # A plan saved again is kept for another retention period
+                conn.execute(
+                    "INSERT INTO plans (id, body, created_at, accessed_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET accessed_at = excluded.accessed_at",
+                    (key, body, now, now)
+                )
+                self._purge(conn, now)
+        except sqlite3.Error as e:
+            print(f"Error saving plan: {e}")
+            return None
+        self._documents.set(key, document)
+        return key
+
+    def _purge(self, conn, now):
+        """Delete plans not saved or read within the retention period, at most once a minute"""
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            conn.execute("DELETE FROM plans WHERE accessed_at < ?", (now - self.retention_seconds,))
+
+    def get(self, key):
+        """
+        Return a stored plan document, or None if there is no such plan.
+        """
+        document = self._documents.get(key)
+        if document is not None or not self.path or not PLAN_ID_RE.match(key):
+            return document
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT body FROM plans WHERE id = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE plans SET accessed_at = ? WHERE id = ?", (time.time(), key))
+        document = json.loads(gzip.decompress(row[0]))
+        self._documents.set(key, document)
+        return document
+
+    def response(self, key, sections=None, if_none_match=None, accept_encoding=None):
+        """
+        Build the HTTP response for GET /api/plans/<id>.
+
+        Args:
+            key (str): Plan id
+            sections (list): Section names to return instead of the whole plan
+            if_none_match (str): If-None-Match request header
+            accept_encoding (str): Accept-Encoding request header
+
+        Returns:
+            tuple: (status code, body bytes, headers dict)
+        """
+        document = self.get(key)
+        if document is None:
+            return _json_response(404, {'success': False, 'error': 'Unknown plan'})
+
+        if sections:
+            available = plan_sections(document)
+            missing = [name for name in sections if name not in available]
+            if missing:
+                return _json_response(404, {
+                    'success': False,
+                    'error': f"Unknown section: {', '.join(missing)}",
+                    'sections': list(available)
+                })
+            payload = {'success': True, 'plan_id': key, 'sections': {name: available[name] for name in sections}}
+            # Section names never contain ".", so each list of sections gets its own tag
+            tag = '.'.join([key, *sections])
+        else:
+            payload = dict(document, success=True, plan_id=key, sections=list(plan_sections(document)))
+            tag = key
+
+        cache_key = (tag, negotiate_encoding(accept_encoding))
+        encoded = self._bodies.get(cache_key)
+        if encoded is None:
+            encoded = compress_response_body(json.dumps(payload, ensure_ascii=False).encode('utf-8'), accept_encoding)
+            self._bodies.set(cache_key, encoded)
+        body, encoding = encoded
+
+        headers = {
+            'Cache-Control': 'public, max-age=31536000, immutable',
+            'Vary': 'Accept-Encoding',
+            # Each encoding is a different representation, so it gets its own strong ETag,
+            # sent the same way on 200 and 304 responses
+            'ETag': f'"{tag}-{encoding}"' if encoding else f'"{tag}"',
+        }
+        if etag_matches(if_none_match, tag):
+            return 304, b'', headers
+
+        headers['Content-Type'] = 'application/json'
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return 200, body, headers
+
+
+def _json_response(status, payload):
+    return status, json.dumps(payload).encode('utf-8'), {'Content-Type': 'application/json'}
+
+
+def etag_matches(if_none_match, tag):
+    """
+    Whether an If-None-Match header names this plan representation.
+
+    Any content coding of the same content matches: the decoded bodies are identical.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    representations = {tag, *(f"{tag}-{encoding}" for encoding in ENCODINGS)}
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"') in representations:
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the content coding for a response from an Accept-Encoding header.
+
+    Returns:
+        str: "br", "gzip" or None for no compression
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                weight = float(match.group(1))
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best = None
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > 0 and (best is None or weight > best[1]):
+            best = (encoding, weight)
+    return best[0] if best else None
+
+
+def encode_body(body, encoding):
+    """Compress a response body with the given content coding (None leaves it as is)"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    return body
+
+
+def compress_response_body(body, accept_encoding):
+    """
+    Compress a response body if it is large enough and the client accepts it.
+
+    Returns:
+        tuple: (body, content coding or None)
+    """
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+    return encode_body(body, encoding), encoding
+
+
+def with_plan_id(result):
+    """A generate_travel_plan() result with the id it is stored under"""
+    return dict(result, plan_id=plan_store.save(result))
+
+
+def store_plan_events(events):
+    """Pass through stream_travel_plan() events, storing the finished plan and adding its id to the done event"""
+    for event, data in events:
+        yield event, with_plan_id(data) if event == 'done' else data
+
+
+async def store_plan_events_async(events):
+    """Async version of store_plan_events()"""
+    async for event, data in events:
+        if event == 'done':
+            data = await asyncio.to_thread(with_plan_id, data)
+        yield event, data
+
+
+plan_store = PlanStore()
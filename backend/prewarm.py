@@ -0,0 +1,261 @@
+"""
+Pre-generate popular travel plans (with their flight sections) and destination
+recommendations into the shared response cache, so the most requested trips
+are served from the cache instead of at full generation latency.
+
+Requests are read from JSONL files, one request per line with its "kind"
+("plan" or "recommend") and the endpoint's payload. The app writes such a log
+when REQUEST_LOG_PATH is set. The most frequent N distinct requests (after the
+response cache's normalization) are generated, and entries that are still fresh
+are skipped. Run it from cron during off-peak hours:
+
+    python prewarm.py logs/requests.jsonl --top 50
+    python prewarm.py logs/requests.jsonl --window 01:00-06:00 --concurrency 2
+
+Model calls run at bulk priority, so the scheduler keeps its reserve of the
+quota for interactive users. The run stops early when the quota is exhausted or
+the window ends.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables (this module runs as a standalone command)
+load_dotenv()
+
+from cache import response_cache, plan_cache_key, recommendations_cache_key
+from model_backends import RateLimitError
+from scheduler import SchedulerOverloaded, priority_scope, PRIORITY_BULK
+from resilience import CircuitOpenError
+
+# Where the app appends the plan and recommendation requests it serves (empty disables the log)
+REQUEST_LOG_PATH = os.getenv("REQUEST_LOG_PATH", "")
+PREWARM_TOP_N = int(os.getenv("PREWARM_TOP_N", 50))
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", 2))
+# Entries expiring within this many seconds are regenerated, so they don't go stale before the next run
+PREWARM_REFRESH_MARGIN_SECONDS = float(os.getenv("PREWARM_REFRESH_MARGIN_SECONDS", 6 * 60 * 60))
+
+PLAN_FIELDS = ('source', 'destination', 'dates', 'budget', 'travelers', 'interests', 'include_flights')
+RECOMMEND_FIELDS = ('interests', 'budget', 'dates', 'travelers')
+
+# Errors that mean the model quota is used up for now
+QUOTA_ERRORS = (SchedulerOverloaded, RateLimitError, CircuitOpenError)
+
+_log_lock = threading.Lock()
+
+
+def log_request(kind, payload):
+    """
+    Append a served request to REQUEST_LOG_PATH, for mining popular requests later.
+
+    Args:
+        kind (str): "plan" or "recommend"
+        payload (dict): The request payload
+    """
+    if not REQUEST_LOG_PATH:
+        return
+    fields = PLAN_FIELDS if kind == 'plan' else RECOMMEND_FIELDS
+    line = json.dumps({'kind': kind, 'time': round(time.time()), **{field: payload.get(field) for field in fields}})
+    try:
+        with _log_lock, open(REQUEST_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"Error writing request log: {e}")
+
+
+def request_kind(entry):
+    """The kind of a logged request; lines without a "kind" are told apart by their fields"""
+    kind = entry.get('kind')
+    if kind in ('plan', 'recommend'):
+        return kind
+    if kind is None and entry.get('source') and entry.get('destination'):
+        return 'plan'
+    if kind is None and entry.get('interests') and not entry.get('destination'):
+        return 'recommend'
+    return None
+
+
+def request_key(kind, payload):
+    """The response cache key a request is served from"""
+    if kind == 'plan':
+        return plan_cache_key(**{field: payload.get(field) or '' for field in PLAN_FIELDS[:-1]},
+                              include_flights=bool(payload.get('include_flights')))
+    return recommendations_cache_key(**{field: payload.get(field) or '' for field in RECOMMEND_FIELDS})
+
+
+def load_requests(paths):
+    """
+    Read requests from JSONL files, skipping lines that aren't complete requests.
+
+    Returns:
+        list: (kind, payload) tuples in file order
+    """
+    requests = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    print(f"Skipping {path}:{number}: not JSON")
+                    continue
+                kind = request_kind(entry) if isinstance(entry, dict) else None
+                fields = PLAN_FIELDS[:-1] if kind == 'plan' else RECOMMEND_FIELDS
+                if kind is None or not all(entry.get(field) for field in fields):
+                    continue
+                requests.append((kind, {field: entry.get(field) for field in PLAN_FIELDS + RECOMMEND_FIELDS
+                                        if field in entry}))
+    return requests
+
+
+def top_requests(requests, top=PREWARM_TOP_N):
+    """
+    The most frequent distinct requests, most frequent first (ties in first-seen order).
+
+    Returns:
+        list: (kind, payload, count) tuples
+    """
+    counts = Counter()
+    latest = {}
+    for kind, payload in requests:
+        key = request_key(kind, payload)
+        counts[key] += 1
+        latest[key] = (kind, payload)
+    return [(*latest[key], count) for key, count in counts.most_common(top)]
+
+
+def parse_window(window):
+    """Parse "HH:MM-HH:MM" into a (start, end) pair of datetime.time"""
+    start, end = window.split('-')
+    return datetime.time.fromisoformat(start.strip()), datetime.time.fromisoformat(end.strip())
+
+
+def in_window(window, now=None):
+    """Whether the local time is inside a (start, end) window, which may wrap past midnight"""
+    if window is None:
+        return True
+    now = (now or datetime.datetime.now()).time()
+    start, end = window
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+def describe(kind, payload):
+    if kind == 'plan':
+        return f"plan {payload['source']} -> {payload['destination']} ({payload['dates']})"
+    return f"recommendations for {', '.join(payload['interests'])} ({payload['dates']})"
+
+
+def warm(kind, payload):
+    """Generate one request into the cache (a no-op for fresh entries)"""
+    from gemini_api import generate_travel_plan, get_destination_recommendations
+    with priority_scope(PRIORITY_BULK):
+        if kind == 'plan':
+            generate_travel_plan(**{field: payload.get(field) for field in PLAN_FIELDS[:-1]},
+                                 include_flights=bool(payload.get('include_flights')))
+        else:
+            get_destination_recommendations(*(payload.get(field) for field in RECOMMEND_FIELDS))
+
+
+def prewarm(requests, top=PREWARM_TOP_N, concurrency=PREWARM_CONCURRENCY, window=None,
+            refresh_margin=PREWARM_REFRESH_MARGIN_SECONDS):
+    """
+    Generate the most frequent requests into the response cache.
+
+    Args:
+        requests (list): (kind, payload) tuples, as from load_requests()
+        top (int): Number of distinct requests to warm
+        concurrency (int): Requests generated at a time
+        window (tuple): (start, end) local times to run in, or None for any time
+        refresh_margin (float): Regenerate entries that expire within this many seconds
+
+    Returns:
+        dict: Counts of warmed, failed and skipped requests and the cache's counters
+    """
+    # Regenerate stale and soon-to-expire entries here instead of serving them
+    response_cache.serve_stale = False
+    response_cache.refresh_margin = refresh_margin
+
+    selected = top_requests(requests, top)
+    summary = {'selected': len(selected), 'warmed': 0, 'failed': 0, 'skipped': 0}
+    stop = threading.Event()
+    lock = threading.Lock()
+
+    def run(item):
+        kind, payload, count = item
+        if stop.is_set() or not in_window(window):
+            stop.set()
+            with lock:
+                summary['skipped'] += 1
+            return
+        start = time.perf_counter()
+        try:
+            warm(kind, payload)
+        except QUOTA_ERRORS as e:
+            print(f"Stopping: model quota exhausted ({e})")
+            stop.set()
+            with lock:
+                summary['failed'] += 1
+            return
+        except Exception as e:
+            print(f"Error warming {describe(kind, payload)}: {e}")
+            with lock:
+                summary['failed'] += 1
+            return
+        with lock:
+            summary['warmed'] += 1
+        print(f"{describe(kind, payload)} x{count}: {time.perf_counter() - start:.2f}s")
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="prewarm") as pool:
+        list(pool.map(run, selected))
+
+    stats = response_cache.stats()
+    summary['cache'] = {key: stats[key] for key in ('memory_hits', 'disk_hits', 'stale_hits', 'misses')}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('logs', nargs='*', help="JSONL request logs (default: REQUEST_LOG_PATH)")
+    parser.add_argument('--top', type=int, default=PREWARM_TOP_N, help="Number of distinct requests to warm")
+    parser.add_argument('--concurrency', type=int, default=PREWARM_CONCURRENCY)
+    parser.add_argument('--window', help="Only run between these local times, e.g. 01:00-06:00")
+    parser.add_argument('--refresh-margin', type=float, default=PREWARM_REFRESH_MARGIN_SECONDS,
+                        help="Regenerate entries expiring within this many seconds")
+    parser.add_argument('--dry-run', action='store_true', help="List the selected requests without generating them")
+    args = parser.parse_args(argv)
+
+    paths = args.logs or ([REQUEST_LOG_PATH] if REQUEST_LOG_PATH else [])
+    if not paths:
+        parser.error("no request logs given and REQUEST_LOG_PATH is not set")
+    if response_cache.disk is None and not args.dry_run:
+        print("RESPONSE_CACHE_PATH is empty: warmed entries would not be shared with the app")
+        return 1
+    window = parse_window(args.window) if args.window else None
+
+    requests = load_requests(paths)
+    if args.dry_run:
+        for kind, payload, count in top_requests(requests, args.top):
+            print(f"{count:6d}  {describe(kind, payload)}")
+        return 0
+    if not in_window(window):
+        print(f"Outside the {args.window} window; nothing to do")
+        return 0
+
+    summary = prewarm(requests, args.top, args.concurrency, window, args.refresh_margin)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,496 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from scheduler import SchedulerOverloaded, AdmissionTicket, ticket_scope
+
+# Per-stage deadlines, request hedging and circuit breaking for model calls.
+#
+# Each stage (airport lookup, itinerary and its sections, flights, recommendations)
+# has its own deadline, latency history and circuit breaker. When a call runs longer than the
+# stage's HEDGE_PERCENTILE latency, a duplicate is fired and whichever answers
+# first wins. A stage whose recent error rate spikes fails fast until a cool-down
+# has passed, so callers can degrade (e.g. return a plan without flights).
+# Deadlines and hedge delays run from the scheduler's admission of a call, and
+# calls the scheduler rejects don't count against the breaker: waiting for our
+# own quota says nothing about the model's health. The same goes for waiting for
+# a free thread to run the call on. Streamed calls get the stage's deadline for
+# their first chunk and STREAM_IDLE_TIMEOUT between chunks.
+
+STAGE_DEADLINES = {
+    'airport': float(os.getenv("DEADLINE_AIRPORT_SECONDS", 10)),
+    'itinerary': float(os.getenv("DEADLINE_ITINERARY_SECONDS", 90)),
+    'itinerary_skeleton': float(os.getenv("DEADLINE_ITINERARY_SKELETON_SECONDS", 30)),
+    'itinerary_section': float(os.getenv("DEADLINE_ITINERARY_SECTION_SECONDS", 45)),
+    'flights': float(os.getenv("DEADLINE_FLIGHTS_SECONDS", 45)),
+    'recommendations': float(os.getenv("DEADLINE_RECOMMENDATIONS_SECONDS", 60)),
+}
+STREAM_IDLE_TIMEOUT = float(os.getenv("STREAM_IDLE_TIMEOUT_SECONDS", 30))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", 0.1))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 10))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN_SECONDS", 30))
+
+# Threads that run (possibly duplicated) model calls so the caller can stop waiting.
+# Calls come from request threads and gemini_api's lookup and section pools.
+HEDGE_THREADS = int(os.getenv("HEDGE_THREADS", 64))
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="hedge")
+
+
+class StageTimeout(Exception):
+    """Raised when a stage does not answer within its deadline"""
+
+    def __init__(self, stage, deadline):
+        super().__init__(f"{stage} generation timed out after {deadline:g}s")
+        self.stage = stage
+
+
+class StageOverloaded(SchedulerOverloaded):
+    """Raised when no thread was free to start a call within the stage's deadline"""
+
+    def __init__(self, stage, deadline):
+        super().__init__(f"{stage} generation could not start within {deadline:g}s, try again later",
+                         retry_after=1)
+        self.stage = stage
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the model while a stage's circuit breaker is open"""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"{stage} generation is temporarily unavailable, try again later")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker.
+
+    closed: calls flow; opens when the error rate over the last `window` calls
+            reaches `error_rate` (after at least `min_calls`)
+    open: calls fail fast for `cooldown` seconds
+    half_open: a single trial call decides between closed and open
+    """
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 error_rate=BREAKER_ERROR_RATE, cooldown=BREAKER_COOLDOWN):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may proceed"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return True
+
+    def retry_after(self):
+        """Seconds until the breaker lets a trial call through"""
+        return max(1, int(self.cooldown - (time.monotonic() - self.opened_at) + 0.999))
+
+    def record(self, success):
+        with self._lock:
+            if self.state == 'half_open':
+                self._trial_running = False
+                if success:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self.state == 'closed' and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate):
+                self._open()
+
+    def release_trial(self):
+        """Give up a half-open trial slot without recording an outcome"""
+        with self._lock:
+            self._trial_running = False
+
+    def _open(self):
+        """Caller must hold the lock"""
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._outcomes.clear()
+
+
+class Stage:
+    """Deadline, hedging policy, latency history and breaker for one kind of model call"""
+
+    def __init__(self, name, deadline, idle_timeout=STREAM_IDLE_TIMEOUT):
+        self.name = name
+        self.deadline = deadline
+        self.idle_timeout = idle_timeout
+        self.breaker = CircuitBreaker()
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0,
+                       'hedges': 0, 'hedge_wins': 0, 'short_circuited': 0, 'overloaded': 0}
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _percentile(self, pct):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+    def hedge_delay(self):
+        """
+        Seconds after which a duplicate call is fired, or None to not hedge.
+
+        Hedging needs enough latency samples and is capped at HEDGE_MAX_RATE of calls.
+        """
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            if self._stats['hedges'] >= HEDGE_MAX_RATE * max(1, self._stats['calls']):
+                return None
+        delay = self._percentile(HEDGE_PERCENTILE)
+        return delay if delay < self.deadline else None
+
+    def _start(self):
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+        self._count('calls')
+        return time.perf_counter()
+
+    def _succeeded(self, start, hedged_win):
+        """Record a success; `start` is None for streams, whose duration is not a call latency"""
+        with self._lock:
+            if start is not None:
+                self._latencies.append(time.perf_counter() - start)
+            self._stats['successes'] += 1
+            if hedged_win:
+                self._stats['hedge_wins'] += 1
+        self.breaker.record(True)
+
+    def _failed(self, error=None):
+        # Calls our own scheduler or thread pool could not take say nothing about upstream health
+        if isinstance(error, SchedulerOverloaded):
+            self._count('overloaded')
+            self.breaker.release_trial()
+            return
+        self._count('timeouts' if isinstance(error, StageTimeout) else 'failures')
+        self.breaker.record(False)
+
+    def _attempt(self, context, func, args, kwargs):
+        """Start one attempt in a thread, with its own admission ticket"""
+        ticket = AdmissionTicket()
+        future = _hedge_executor.submit(context.copy().run, _run_with_ticket, ticket, func, *args, **kwargs)
+        # An attempt that ends before it starts or is admitted (e.g. rejected) stops those waits too
+        future.add_done_callback(lambda _: (ticket.started.set(), ticket.admitted.set()))
+        return future, ticket
+
+    def _admitted_at(self, ticket):
+        """
+        Wait until an attempt has a thread and has left the scheduler's queue, which
+        bounds that wait itself.
+
+        Returns:
+            float: perf_counter() time the stage's deadline and hedge delay run from,
+                   or None if no thread was free within the deadline
+        """
+        if not ticket.started.wait(timeout=self.deadline):
+            return None
+        while not ticket.admitted.wait(timeout=self.deadline):
+            if not ticket.queued:
+                # The call doesn't go through the scheduler: it has been running since it started
+                return ticket.started_at
+        return ticket.admitted_at or ticket.started_at or time.perf_counter()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) with this stage's deadline, hedging and breaker.
+
+        The deadline and hedge delay start when the scheduler admits the call, so
+        waiting for a thread or for our own quota neither times a call out nor
+        triggers a hedge. A call that gets no thread within the deadline raises
+        StageOverloaded. Attempts still queued when the call ends are abandoned; those already
+        calling the model keep running in the background (threads cannot be
+        cancelled) and their results are discarded.
+
+        Returns:
+            The first successful result
+        """
+        self._start()
+        context = contextvars.copy_context()
+        primary, ticket = self._attempt(context, func, args, kwargs)
+        tickets = {primary: ticket}
+        pending = {primary}
+        hedge = None
+
+        try:
+            admitted_at = self._admitted_at(ticket)
+            if admitted_at is None:
+                error = StageOverloaded(self.name, self.deadline)
+                self._failed(error)
+                raise error
+            deadline_at = admitted_at + self.deadline
+
+            hedge_delay = self.hedge_delay()
+            if hedge_delay is not None:
+                done, pending = wait(pending, timeout=max(0.0, admitted_at + hedge_delay - time.perf_counter()))
+                if not done:
+                    hedge, tickets[hedge] = self._attempt(context, func, args, kwargs)
+                    pending.add(hedge)
+                    self._count('hedges')
+                else:
+                    pending = done
+
+            error = None
+            while pending:
+                remaining = deadline_at - time.perf_counter()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        self._succeeded(admitted_at, future is hedge)
+                        return future.result()
+                    error = future.exception()
+
+            if pending:
+                error = StageTimeout(self.name, self.deadline)
+            self._failed(error)
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+                tickets[future].abandoned.set()
+
+    def stream(self, func, *args, **kwargs):
+        """
+        Run a streaming call, func(*args, **kwargs) returning an iterable of chunks,
+        with this stage's breaker.
+
+        The first chunk must arrive within the deadline (from the scheduler's
+        admission) and each later one within the idle timeout; otherwise StageTimeout
+        is raised. Streams are not hedged, since the caller is already reading one.
+        The stream is read in its own thread, which stops at the next chunk once the
+        caller stops reading.
+
+        Yields:
+            The stream's chunks
+        """
+        self._start()
+        ticket = AdmissionTicket()
+        chunks = queue.Queue()
+        stop = threading.Event()
+        end = object()
+
+        def read():
+            try:
+                for chunk in _run_with_ticket(ticket, func, *args, **kwargs):
+                    if stop.is_set():
+                        return
+                    chunks.put((chunk, None))
+                chunks.put((end, None))
+            except Exception as e:
+                chunks.put((end, e))
+            finally:
+                ticket.admitted.set()
+
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(read,), name="stream", daemon=True).start()
+        finished = False
+        try:
+            admitted_at = self._admitted_at(ticket)
+            if admitted_at is None:
+                raise StageOverloaded(self.name, self.deadline)
+            limit, timeout = self.deadline, admitted_at + self.deadline - time.perf_counter()
+            while True:
+                try:
+                    chunk, error = chunks.get(timeout=max(0.0, timeout))
+                except queue.Empty:
+                    error = StageTimeout(self.name, limit)
+                if error is not None:
+                    finished = True
+                    self._failed(error)
+                    raise error
+                if chunk is end:
+                    break
+                yield chunk
+                limit = timeout = self.idle_timeout
+            finished = True
+            self._succeeded(None, False)
+        finally:
+            if not finished:
+                # The caller stopped reading: no outcome to record
+                self.breaker.release_trial()
+            stop.set()
+            ticket.abandoned.set()
+
+    def _attempt_async(self, make_awaitable):
+        """Start one attempt as a task, with its own admission ticket"""
+        ticket = AdmissionTicket()
+        ticket.admitted_async = asyncio.Event()
+
+        async def attempt():
+            with ticket_scope(ticket):
+                return await make_awaitable()
+
+        task = asyncio.ensure_future(attempt())
+        task.add_done_callback(lambda _: ticket.admitted_async.set())
+        return task, ticket
+
+    async def _admitted_at_async(self, ticket, start):
+        """Async variant of _admitted_at()"""
+        while True:
+            try:
+                await asyncio.wait_for(ticket.admitted_async.wait(), timeout=self.deadline)
+                return ticket.admitted_at or start
+            except asyncio.TimeoutError:
+                if not ticket.queued:
+                    return start
+
+    async def call_async(self, make_awaitable):
+        """
+        Async variant of call(). `make_awaitable` is called once per attempt.
+
+        The losing or overrunning attempt is cancelled.
+
+        Returns:
+            The first successful result
+        """
+        start = self._start()
+        primary, ticket = self._attempt_async(make_awaitable)
+        pending = {primary}
+        hedge = None
+
+        try:
+            admitted_at = await self._admitted_at_async(ticket, start)
+            deadline_at = admitted_at + self.deadline
+
+            hedge_delay = self.hedge_delay()
+            if hedge_delay is not None:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, admitted_at + hedge_delay - time.perf_counter())
+                )
+                if not done:
+                    hedge, _ = self._attempt_async(make_awaitable)
+                    pending.add(hedge)
+                    self._count('hedges')
+                else:
+                    pending = done
+
+            error = None
+            while pending:
+                remaining = deadline_at - time.perf_counter()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._succeeded(admitted_at, task is hedge)
+                        return task.result()
+                    error = task.exception()
+
+            if pending:
+                error = StageTimeout(self.name, self.deadline)
+            self._failed(error)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream_async(self, make_awaitable):
+        """
+        Async variant of stream(). `make_awaitable` opens the stream, e.g.
+        lambda: model.generate_content_async(prompt, stream=True).
+
+        Yields:
+            The stream's chunks
+        """
+        start = self._start()
+        opening, ticket = self._attempt_async(make_awaitable)
+        chunks = None
+        finished = False
+        try:
+            admitted_at = await self._admitted_at_async(ticket, start)
+            first_chunk_by = admitted_at + self.deadline
+            limit = self.deadline
+            try:
+                response = await asyncio.wait_for(opening, timeout=max(0.0, first_chunk_by - time.perf_counter()))
+                chunks = response.__aiter__()
+                timeout = first_chunk_by - time.perf_counter()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, timeout))
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+                    limit = timeout = self.idle_timeout
+            except asyncio.TimeoutError:
+                error = StageTimeout(self.name, limit)
+                finished = True
+                self._failed(error)
+                raise error
+            except Exception as e:
+                finished = True
+                self._failed(e)
+                raise
+            finished = True
+            self._succeeded(None, False)
+        finally:
+            if not finished:
+                self.breaker.release_trial()
+            opening.cancel()
+            if chunks is not None and hasattr(chunks, 'aclose'):
+                await chunks.aclose()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['hedge_rate'] = round(stats['hedges'] / stats['calls'], 4) if stats['calls'] else 0.0
+        stats['hedge_win_rate'] = round(stats['hedge_wins'] / stats['hedges'], 4) if stats['hedges'] else 0.0
+        stats['breaker_state'] = self.breaker.state
+        stats['breaker_opened'] = self.breaker.times_opened
+        stats['deadline_seconds'] = self.deadline
+        p50, p95 = self._percentile(50), self._percentile(95)
+        stats['p50_ms'] = round(p50 * 1000, 2) if p50 is not None else None
+        stats['p95_ms'] = round(p95 * 1000, 2) if p95 is not None else None
+        return stats
+
+
+def _run_with_ticket(ticket, func, *args, **kwargs):
+    ticket.start()
+    with ticket_scope(ticket):
+        return func(*args, **kwargs)
+
+
+stages = {name: Stage(name, deadline) for name, deadline in STAGE_DEADLINES.items()}
+
+
+def resilience_stats():
+    """Return hedging, timeout and breaker statistics for every stage"""
+    return {name: stage.stats() for name, stage in stages.items()}
@@ -0,0 +1,249 @@
+import os
+import datetime
+import numpy as np
+from airports import get_airport_index
+
+# Local route planning for multi-city trips. Stops are ordered with a
+# nearest-neighbour tour improved by 2-opt and Or-opt over great-circle distances between
+# the bundled airports' coordinates, so routing never involves the model and
+# takes milliseconds even for a dozen cities. The trip's days are then split
+# across the stops and every leg gets its travel date.
+
+EARTH_RADIUS_KM = 6371.0
+
+MULTI_CITY_MAX_STOPS = int(os.getenv("MULTI_CITY_MAX_STOPS", 12))
+# Nights per stop when the travel dates don't say how long the trip is
+MULTI_CITY_DEFAULT_STAY_DAYS = int(os.getenv("MULTI_CITY_DEFAULT_STAY_DAYS", 3))
+
+
+def airport_coordinates(code):
+    """(latitude, longitude) of an airport in the bundled index, or None"""
+    airport = get_airport_index().get_airport(code)
+    if not airport or airport['latitude'] is None or airport['longitude'] is None:
+        return None
+    return airport['latitude'], airport['longitude']
+
+
+def distance_matrix(points):
+    """
+    Great-circle distances between all pairs of points.
+
+    Args:
+        points (list): (latitude, longitude) pairs in degrees
+
+    Returns:
+        numpy.ndarray: Symmetric matrix of distances in kilometres
+    """
+    coordinates = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    lat, lon = coordinates[:, 0:1], coordinates[:, 1:2]
+    a = np.sin((lat - lat.T) / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin((lon - lon.T) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def route_length(route, distances):
+    """Total length of a route (a list of point indices) in kilometres"""
+    return sum(distances[a][b] for a, b in zip(route, route[1:]))
+
+
+def nearest_neighbour_route(distances, round_trip=False):
+    """
+    Greedy route from point 0 that always moves on to the closest unvisited point.
+
+    Args:
+        distances (list): Distance matrix as nested lists
+        round_trip (bool): Whether the route returns to point 0
+
+    Returns:
+        list: Point indices, starting with 0 (and ending with it for a round trip)
+    """
+    unvisited = set(range(1, len(distances)))
+    route = [0]
+    while unvisited:
+        here = distances[route[-1]]
+        route.append(min(unvisited, key=lambda point: (here[point], point)))
+        unvisited.remove(route[-1])
+    return route + [0] if round_trip and len(route) > 1 else route
+
+
+def two_opt(route, distances, round_trip=False):
+    """
+    Shorten a route by reversing segments until no reversal helps.
+
+    The first point stays fixed. An open route's last point is free; a round
+    trip's final return to the start is kept.
+
+    Returns:
+        list: Improved route
+    """
+    route = list(route)
+    last = len(route) - 2 if round_trip else len(route) - 1
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, last):
+            before = distances[route[i - 1]]
+            for j in range(i + 1, last + 1):
+                # Reversing route[i..j] replaces edges (i-1, i) and (j, j+1) with (i-1, j) and (i, j+1)
+                after = route[j + 1] if j + 1 < len(route) else None
+                delta = before[route[j]] - before[route[i]]
+                if after is not None:
+                    delta += distances[route[i]][after] - distances[route[j]][after]
+                if delta < -1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+    return route
+
+
+def or_opt(route, distances, round_trip=False):
+    """
+    Shorten a route by moving runs of one to three points (possibly reversed)
+    elsewhere in it, which fixes detours 2-opt cannot.
+
+    Returns:
+        list: Improved route
+    """
+    route = list(route)
+    end = len(route) - 1 if round_trip else len(route)
+
+    def cost(a, b):
+        return distances[a][b] if b is not None else 0.0
+
+    improved = True
+    while improved:
+        improved = False
+        for length in (1, 2, 3):
+            for i in range(1, end - length + 1):
+                segment = route[i:i + length]
+                after = route[i + length] if i + length < len(route) else None
+                removed = cost(route[i - 1], segment[0]) + cost(segment[-1], after) - cost(route[i - 1], after)
+                rest = route[:i] + route[i + length:]
+                best = None
+                for p in range(len(rest) - 1 if round_trip else len(rest)):
+                    if p == i - 1:
+                        continue
+                    a, b = rest[p], rest[p + 1] if p + 1 < len(rest) else None
+                    for candidate in (segment, segment[::-1]):
+                        delta = cost(a, candidate[0]) + cost(candidate[-1], b) - cost(a, b) - removed
+                        if delta < -1e-9 and (best is None or delta < best[0]):
+                            best = (delta, p, candidate)
+                if best:
+                    _, p, candidate = best
+                    route = rest[:p + 1] + candidate + rest[p + 1:]
+                    improved = True
+                    break
+            if improved:
+                break
+    return route
+
+
+def order_stops(origin, stops, round_trip=False):
+    """
+    Order stops for a short trip from an origin through every stop.
+
+    Args:
+        origin (tuple): (latitude, longitude) of the starting point
+        stops (list): (latitude, longitude) of each stop
+        round_trip (bool): Whether the trip ends back at the origin
+
+    Returns:
+        list: Indices into stops in visiting order
+    """
+    if len(stops) < 2:
+        return list(range(len(stops)))
+    distances = distance_matrix([origin, *stops]).tolist()
+    route = nearest_neighbour_route(distances, round_trip)
+    length = float('inf')
+    # Alternate the two improvements until neither shortens the route
+    while route_length(route, distances) < length - 1e-9:
+        length = route_length(route, distances)
+        route = or_opt(two_opt(route, distances, round_trip), distances, round_trip)
+    return [point - 1 for point in route if point]
+
+
+def split_days(days, count):
+    """
+    Split a trip's days across its stops as evenly as possible, earlier stops
+    getting the extra days. Every stop gets at least one day.
+
+    Returns:
+        list: (first day, last day) of each stop, numbered from 1
+    """
+    base, extra = divmod(max(days, count), count)
+    spans, first = [], 1
+    for index in range(count):
+        length = base + (1 if index < extra else 0)
+        spans.append((first, first + length - 1))
+        first += length
+    return spans
+
+
+def plan_route(source, cities, codes, start_date, days=None, optimize=True, round_trip=False):
+    """
+    Plan the stops and legs of a multi-city trip.
+
+    Cities with known coordinates are reordered for the shortest route unless
+    optimize is False; cities the airport index has no coordinates for keep
+    their given order at the end of the trip.
+
+    Args:
+        source (str): Departure location
+        cities (list): Cities to visit
+        codes (dict): Location -> airport code (or None), as from get_airport_codes()
+        start_date (datetime.date): Departure date
+        days (int): Length of the trip in days, or None for MULTI_CITY_DEFAULT_STAY_DAYS per stop
+        optimize (bool): Whether to reorder the cities
+        round_trip (bool): Whether the trip ends back at the source
+
+    Returns:
+        dict: "stops" (city, code, first/last day and dates of each stay), "legs"
+              (from, to, codes, date and great-circle distance of each flight),
+              "distance_km" (total, None if any leg's distance is unknown) and "optimized"
+    """
+    order = list(range(len(cities)))
+    origin = airport_coordinates(codes.get(source))
+    optimized = False
+    if optimize and origin:
+        located = [index for index in order if airport_coordinates(codes.get(cities[index]))]
+        if len(located) > 1:
+            visit = order_stops(origin, [airport_coordinates(codes.get(cities[index])) for index in located], round_trip)
+            unlocated = [index for index in order if index not in set(located)]
+            order = [located[index] for index in visit] + unlocated
+            optimized = True
+
+    spans = split_days(days or MULTI_CITY_DEFAULT_STAY_DAYS * len(cities), len(cities))
+    stops = []
+    for number, (index, (first, last)) in enumerate(zip(order, spans), start=1):
+        # Stops are left the morning after their last day, except the last stop, whose
+        # last day is the end of the trip (and the day of a round trip's flight home)
+        depart = last - 1 if number == len(spans) else last
+        stops.append({
+            'city': cities[index],
+            'code': codes.get(cities[index]),
+            'first_day': first,
+            'last_day': last,
+            'arrive': (start_date + datetime.timedelta(days=first - 1)).isoformat(),
+            'depart': (start_date + datetime.timedelta(days=depart)).isoformat(),
+        })
+
+    places = [{'city': source, 'code': codes.get(source), 'arrive': start_date.isoformat()}] + stops
+    if round_trip:
+        places.append({'city': source, 'code': codes.get(source), 'arrive': stops[-1]['depart']})
+    legs = []
+    for here, there in zip(places, places[1:]):
+        a, b = airport_coordinates(here['code']), airport_coordinates(there['code'])
+        legs.append({
+            'from': here['city'],
+            'to': there['city'],
+            'from_code': here['code'],
+            'to_code': there['code'],
+            'date': there['arrive'],
+            'distance_km': round(float(distance_matrix([a, b])[0][1])) if a and b else None,
+        })
+
+    distances = [leg['distance_km'] for leg in legs]
+    return {
+        'stops': stops,
+        'legs': legs,
+        'distance_km': None if None in distances else sum(distances),
+        'optimized': optimized,
+    }
@@ -0,0 +1,311 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from model_backends import ModelBackend, RateLimitError
+
+# Quota-aware scheduling for model calls. Every call is admitted against
+# token buckets for requests per minute and estimated tokens per minute, with
+# part of the budget held back for higher priority classes. Calls that would
+# wait too long are rejected immediately (SchedulerOverloaded) so the API can
+# answer 503 with Retry-After, and upstream rate-limit errors are retried with
+# jittered exponential backoff.
+
+MODEL_RPM = float(os.getenv("MODEL_RPM", 300))
+MODEL_TPM = float(os.getenv("MODEL_TPM", 1_000_000))
+SCHEDULER_MAX_WAITING = int(os.getenv("SCHEDULER_MAX_WAITING", 256))
+SCHEDULER_MAX_RETRIES = int(os.getenv("SCHEDULER_MAX_RETRIES", 4))
+SCHEDULER_BACKOFF_BASE = float(os.getenv("SCHEDULER_BACKOFF_BASE", 1.0))
+SCHEDULER_BACKOFF_MAX = float(os.getenv("SCHEDULER_BACKOFF_MAX", 30.0))
+OUTPUT_TOKENS_ESTIMATE = int(os.getenv("SCHEDULER_OUTPUT_TOKENS_ESTIMATE", 1500))
+
+# Priority classes, highest first
+PRIORITY_AIRPORT = 0      # cheap airport code lookups
+PRIORITY_INTERACTIVE = 1  # plans and recommendations a user is waiting for
+PRIORITY_BULK = 2         # batch and background work
+
+# Fraction of each bucket a priority class must leave untouched for the classes above it
+PRIORITY_RESERVE = {
+    PRIORITY_AIRPORT: 0.0,
+    PRIORITY_INTERACTIVE: 0.1,
+    PRIORITY_BULK: 0.4,
+}
+
+# Longest a call of each class may wait for quota before it is rejected (seconds)
+PRIORITY_MAX_WAIT = {
+    PRIORITY_AIRPORT: float(os.getenv("SCHEDULER_MAX_WAIT_AIRPORT", 5)),
+    PRIORITY_INTERACTIVE: float(os.getenv("SCHEDULER_MAX_WAIT_INTERACTIVE", 15)),
+    PRIORITY_BULK: float(os.getenv("SCHEDULER_MAX_WAIT_BULK", 120)),
+}
+
+_current_priority = contextvars.ContextVar("model_call_priority", default=PRIORITY_INTERACTIVE)
+# Admission ticket of the model call being made, set by callers that time it (resilience.Stage)
+_current_ticket = contextvars.ContextVar("model_call_ticket", default=None)
+
+
+@contextmanager
+def priority_scope(priority):
+    """Run the model calls made inside the block at the given priority"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a call cannot be admitted within its priority's wait budget"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CallAbandoned(SchedulerOverloaded):
+    """Raised in a queued call whose caller has stopped waiting for it"""
+
+    def __init__(self):
+        super().__init__("Model call abandoned while queued", retry_after=1)
+
+
+class AdmissionTicket:
+    """
+    Tells whoever times a model call when the scheduler admitted it, so time
+    spent in our own queue is not counted as model latency, and lets them
+    abandon the call while it is still queued.
+    """
+
+    def __init__(self):
+        self.started_at = None
+        self.started = threading.Event()
+        self.queued = False
+        self.admitted_at = None
+        self.admitted = threading.Event()
+        # Set by async callers; the scheduler sets it from the caller's event loop
+        self.admitted_async = None
+        self.abandoned = threading.Event()
+
+    def start(self):
+        """Mark the call started: its thread is running and about to ask for admission"""
+        self.started_at = time.perf_counter()
+        self.started.set()
+
+    def admit(self):
+        """Mark the call admitted (only its first admission counts)"""
+        if self.admitted_at is None:
+            self.admitted_at = time.perf_counter()
+        self.admitted.set()
+        if self.admitted_async is not None:
+            self.admitted_async.set()
+
+
+@contextmanager
+def ticket_scope(ticket):
+    """Report the admission of the model call made inside the block to `ticket`"""
+    token = _current_ticket.set(ticket)
+    try:
+        yield
+    finally:
+        _current_ticket.reset(token)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, reserve):
+        """Seconds until `amount` tokens are available above the reserved fraction"""
+        needed = amount + self.capacity * reserve - self.tokens
+        return max(0.0, needed / self.rate)
+
+
+class Scheduler:
+    """Admission control, priority reserves and retry policy for model calls"""
+
+    def __init__(self, rpm=MODEL_RPM, tpm=MODEL_TPM, max_waiting=SCHEDULER_MAX_WAITING,
+                 max_retries=SCHEDULER_MAX_RETRIES, backoff_base=SCHEDULER_BACKOFF_BASE,
+                 backoff_max=SCHEDULER_BACKOFF_MAX):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_waiting = max_waiting
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._stats = {'admitted': 0, 'rejected': 0, 'retries': 0, 'rate_limited': 0}
+
+    def _try_acquire(self, priority, tokens):
+        """
+        Take one request and `tokens` tokens if available.
+
+        Returns:
+            float: 0 if acquired, otherwise the seconds to wait before trying again
+        """
+        reserve = PRIORITY_RESERVE[priority]
+        # A single call larger than the reserve-adjusted bucket could never be admitted
+        tokens = min(tokens, self.tokens.capacity * (1 - reserve))
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_time(1, reserve), self.tokens.wait_time(tokens, reserve))
+            if wait == 0:
+                self.requests.tokens -= 1
+                self.tokens.tokens -= tokens
+                self._stats['admitted'] += 1
+            return wait
+
+    def _reject(self, message, retry_after):
+        with self._lock:
+            self._stats['rejected'] += 1
+        return SchedulerOverloaded(message, retry_after=max(1, int(retry_after + 0.999)))
+
+    def _admission_plan(self, priority, tokens):
+        """Yield successive wait times until admitted, raising if the wait budget is exceeded"""
+        deadline = time.monotonic() + PRIORITY_MAX_WAIT[priority]
+        while True:
+            wait = self._try_acquire(priority, tokens)
+            if wait == 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise self._reject("Model quota exhausted, try again later", wait)
+            yield min(wait, 1.0)
+
+    def _enter_queue(self):
+        with self._lock:
+            if self._waiting >= self.max_waiting:
+                self._stats['rejected'] += 1
+                raise SchedulerOverloaded("Too many queued model calls, try again later", retry_after=1)
+            self._waiting += 1
+
+    def _leave_queue(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def acquire(self, priority, tokens, ticket=None):
+        """
+        Block until a call is admitted, or raise SchedulerOverloaded.
+
+        A call whose ticket is abandoned while it waits raises CallAbandoned
+        instead of taking quota nobody is waiting for.
+        """
+        self._enter_queue()
+        try:
+            for wait in self._admission_plan(priority, tokens):
+                if ticket is None:
+                    time.sleep(wait)
+                elif ticket.abandoned.wait(wait):
+                    raise CallAbandoned()
+        finally:
+            self._leave_queue()
+
+    async def acquire_async(self, priority, tokens):
+        """
+        Await admission without blocking the event loop, or raise SchedulerOverloaded.
+
+        (Async callers abandon a queued call by cancelling it.)
+        """
+        self._enter_queue()
+        try:
+            for wait in self._admission_plan(priority, tokens):
+                await asyncio.sleep(wait)
+        finally:
+            self._leave_queue()
+
+    def backoff(self, attempt, error):
+        """Full-jitter exponential backoff, never shorter than the upstream Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if getattr(error, 'retry_after', None):
+            delay = max(delay, float(error.retry_after))
+        with self._lock:
+            self._stats['retries'] += 1
+        return delay
+
+    def record_rate_limited(self):
+        with self._lock:
+            self._stats['rate_limited'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['waiting'] = self._waiting
+            stats['request_tokens'] = round(self.requests.tokens, 2)
+            stats['model_tokens'] = round(self.tokens.tokens, 2)
+        return stats
+
+
+def estimate_tokens(prompt, expected_output_tokens=None):
+    """Rough token estimate for a call: ~4 characters per prompt token plus expected output"""
+    if expected_output_tokens is None:
+        expected_output_tokens = OUTPUT_TOKENS_ESTIMATE
+    return len(prompt) // 4 + expected_output_tokens
+
+
+class ScheduledBackend(ModelBackend):
+    """
+    Wraps a model backend so every call goes through the scheduler.
+
+    Extra keyword arguments accepted by generate_content()/generate_content_async():
+        priority: priority class (defaults to the enclosing priority_scope())
+        expected_output_tokens: output size used for the tokens-per-minute estimate
+    """
+
+    def __init__(self, backend, scheduler):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.name = backend.name
+
+    def generate_content(self, prompt, stream=False, priority=None, expected_output_tokens=None, **kwargs):
+        priority = _current_priority.get() if priority is None else priority
+        tokens = estimate_tokens(prompt, expected_output_tokens)
+        ticket = _current_ticket.get()
+        if ticket is not None:
+            ticket.queued = True
+
+        for attempt in range(self.scheduler.max_retries + 1):
+            self.scheduler.acquire(priority, tokens, ticket)
+            if ticket is not None:
+                ticket.admit()
+            try:
+                return self.backend.generate_content(prompt, stream=stream, **kwargs)
+            except RateLimitError as e:
+                self.scheduler.record_rate_limited()
+                if attempt == self.scheduler.max_retries:
+                    raise
+                time.sleep(self.scheduler.backoff(attempt, e))
+
+    async def generate_content_async(self, prompt, stream=False, priority=None, expected_output_tokens=None, **kwargs):
+        priority = _current_priority.get() if priority is None else priority
+        tokens = estimate_tokens(prompt, expected_output_tokens)
+        ticket = _current_ticket.get()
+        if ticket is not None:
+            ticket.queued = True
+
+        for attempt in range(self.scheduler.max_retries + 1):
+            await self.scheduler.acquire_async(priority, tokens)
+            if ticket is not None:
+                ticket.admit()
+            try:
+                return await self.backend.generate_content_async(prompt, stream=stream, **kwargs)
+            except RateLimitError as e:
+                self.scheduler.record_rate_limited()
+                if attempt == self.scheduler.max_retries:
+                    raise
+                await asyncio.sleep(self.scheduler.backoff(attempt, e))
+
+
+# Shared scheduler for all model calls in this process
+scheduler = Scheduler()
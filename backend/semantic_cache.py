@@ -0,0 +1,376 @@
+import os
+import json
+import time
+import zlib
+import itertools
+import threading
+from collections import OrderedDict
+import numpy as np
+from travel_dates import parse_travel_dates
+from cache import CACHE_DIR, CACHE_TTL, normalize_text, normalize_interests, parse_budget, traveler_count
+
+# Similarity cache for destination recommendations. Near-identical requests
+# ("beach, food, $2000, August" vs "food, beaches, $2200, mid-August") are served
+# the recommendations generated for an earlier request instead of a new generation.
+#
+# Each request becomes a unit feature vector of weighted blocks (interests, budget,
+# party size), so the dot product of two vectors is the weighted sum of per-block
+# cosine similarities. The travel month and budget currency are not blended in:
+# they select a partition, so a December trip is never answered with August
+# recommendations. Each partition is a float32 matrix searched with one
+# matrix-vector product. Among the entries similar enough, only one whose
+# destinations are all in the request's own shortlist is reused, so a reused
+# answer never writes up a destination that isn't shown next to it.
+
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", os.path.join(CACHE_DIR, 'recommendations_index.npz'))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.96))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 20000))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", CACHE_TTL))
+SEMANTIC_CACHE_SAVE_EVERY = int(os.getenv("SEMANTIC_CACHE_SAVE_EVERY", 20))
+
+# Feature layout: hashed interest terms, then Gaussian bumps over log2(budget) and
+# log2(travelers). Weights sum to 1; a block that cannot be read is all zeros.
+INTEREST_DIMS = 32
+BUDGET_CENTERS = np.arange(9, 17, dtype=np.float32)               # 512 .. 65536
+TRAVELER_CENTERS = np.arange(0, 4, 0.5, dtype=np.float32)        # 1 .. ~11 travelers
+BUDGET_SIGMA = 0.6
+TRAVELER_SIGMA = 0.35
+BLOCK_WEIGHTS = {'interests': 0.45, 'budget': 0.3, 'travelers': 0.25}
+FEATURE_DIMS = INTEREST_DIMS + len(BUDGET_CENTERS) + len(TRAVELER_CENTERS)
+
+# Singular interest -> canonical interest
+INTEREST_SYNONYMS = {
+    'seaside': 'beach', 'coast': 'beach', 'sea': 'beach',
+    'cuisine': 'food', 'culinary': 'food', 'gastronomy': 'food', 'foodie': 'food', 'eating': 'food',
+    'museum': 'art', 'gallery': 'art',
+    'hike': 'hiking', 'trekking': 'hiking',
+    'urban': 'city',
+    'relax': 'relaxation', 'spa': 'relaxation',
+    'nightclub': 'nightlife', 'bar': 'nightlife', 'clubbing': 'nightlife', 'party': 'nightlife',
+    'ski': 'skiing', 'snowboarding': 'skiing', 'scuba': 'diving', 'snorkeling': 'diving',
+    'safari': 'wildlife', 'animal': 'wildlife', 'winery': 'wine', 'wine tasting': 'wine',
+    'historical': 'history', 'ruin': 'history', 'outdoor': 'nature',
+}
+
+
+# ---------------------------------------------------------------------------
+# Features
+# ---------------------------------------------------------------------------
+
+def canonical_interest(interest):
+    """Canonical singular form of one interest ("Beaches" -> "beach", "Cuisine" -> "food")"""
+    term = normalize_text(interest)
+    if term.endswith('ies') and len(term) > 4:
+        term = term[:-3] + 'y'
+    elif term.endswith(('ches', 'shes', 'sses', 'xes')):
+        term = term[:-2]
+    elif term.endswith('s') and not term.endswith('ss') and len(term) > 3:
+        term = term[:-1]
+    return INTEREST_SYNONYMS.get(term, term)
+
+
+def _bumps(value, centers, sigma):
+    """Gaussian bumps around a scalar; the cosine of two such vectors falls off smoothly with distance"""
+    return np.exp(-((centers - value) ** 2) / (2 * sigma ** 2))
+
+
+def travel_month(dates):
+    """
+    Month (1-12) of the start of the trip, or 0 if the dates do not say.
+    """
+    travel_dates = parse_travel_dates(dates)
+    return travel_dates.start.month if travel_dates and travel_dates.start else 0
+
+
+def recommendation_features(interests, budget, dates, travelers, candidates=()):
+    """
+    Embed a recommendations request.
+
+    Args:
+        candidates (list): Shortlisted destinations the answer covers
+
+    Returns:
+        tuple: (partition key, unit float32 feature vector, names of the candidates). Only
+               entries with the same partition key (travel month and budget currency) are compared.
+    """
+    vector = np.zeros(FEATURE_DIMS, dtype=np.float32)
+
+    interest_block = vector[:INTEREST_DIMS]
+    for term in {canonical_interest(interest) for interest in normalize_interests(interests)}:
+        interest_block[zlib.crc32(term.encode('utf-8')) % INTEREST_DIMS] += 1.0
+
+    count = traveler_count(travelers)
+
+    budget_block = vector[INTEREST_DIMS:INTEREST_DIMS + len(BUDGET_CENTERS)]
+    parsed = parse_budget(budget)
+    if parsed:
+        amount, currency, per_person = parsed
+        # Compare budgets for the whole party
+        if per_person and count:
+            amount *= count
+        budget_block[:] = _bumps(np.log2(max(amount, 1.0)), BUDGET_CENTERS, BUDGET_SIGMA)
+    else:
+        currency = normalize_text(budget)
+
+    traveler_block = vector[INTEREST_DIMS + len(BUDGET_CENTERS):]
+    if count:
+        traveler_block[:] = _bumps(np.log2(count), TRAVELER_CENTERS, TRAVELER_SIGMA)
+
+    for block, weight in ((interest_block, BLOCK_WEIGHTS['interests']),
+                          (budget_block, BLOCK_WEIGHTS['budget']),
+                          (traveler_block, BLOCK_WEIGHTS['travelers'])):
+        norm = np.linalg.norm(block)
+        if norm:
+            block *= np.sqrt(weight) / norm
+
+    return f"{travel_month(dates)}:{currency}", vector, tuple(candidate['name'] for candidate in candidates)
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class _Partition:
+    """Rows of the index that share a partition key"""
+
+    def __init__(self, capacity=64):
+        self.vectors = np.zeros((capacity, FEATURE_DIMS), dtype=np.float32)
+        self.created = np.zeros(capacity)
+        self.last_used = np.zeros(capacity)
+        self.values = []
+        self.covers = []
+        self.ids = []
+        self._rows = {}
+        self._scores = np.zeros(capacity, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, entry_id, vector, value, covers, created, last_used):
+        size = len(self.values)
+        if size == len(self.vectors):
+            capacity = size * 2
+            self.vectors = np.resize(self.vectors, (capacity, FEATURE_DIMS))
+            self.created = np.resize(self.created, capacity)
+            self.last_used = np.resize(self.last_used, capacity)
+            self._scores = np.zeros(capacity, dtype=np.float32)
+        self.vectors[size] = vector
+        self.created[size] = created
+        self.last_used[size] = last_used
+        self.values.append(value)
+        self.covers.append(tuple(covers))
+        self.ids.append(entry_id)
+        self._rows[entry_id] = size
+
+    def row(self, entry_id):
+        return self._rows[entry_id]
+
+    def nearest(self, vector, shown, threshold):
+        """
+        Returns:
+            int: Row of the most similar entry with a cosine similarity of at least
+                 `threshold` whose destinations are all in `shown`, or None
+        """
+        size = len(self.values)
+        scores = self._scores[:size]
+        np.dot(self.vectors[:size], vector, out=scores)
+        rows = np.flatnonzero(scores >= threshold)
+        for row in rows[np.argsort(-scores[rows], kind='stable')]:
+            if shown.issuperset(self.covers[row]):
+                return int(row)
+        return None
+
+    def remove(self, row):
+        """Remove a row by moving the last row into its place"""
+        del self._rows[self.ids[row]]
+        last = len(self.values) - 1
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.created[row] = self.created[last]
+            self.last_used[row] = self.last_used[last]
+            self.values[row] = self.values[last]
+            self.covers[row] = self.covers[last]
+            self.ids[row] = self.ids[last]
+            self._rows[self.ids[row]] = row
+        self.values.pop()
+        self.covers.pop()
+        self.ids.pop()
+
+
+class SemanticCache:
+    """
+    Bounded nearest-neighbour cache of model responses keyed by feature vectors.
+
+    The least recently used entry is evicted when the cache is full, and the index
+    is saved to an .npz file every `save_every` insertions. A `max_entries` of 0 or
+    less disables the cache.
+    """
+
+    def __init__(self, path=SEMANTIC_CACHE_PATH, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=SEMANTIC_CACHE_TTL, save_every=SEMANTIC_CACHE_SAVE_EVERY):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.save_every = save_every
+        self._partitions = {}
+        # Entry id -> partition key, least recently used first
+        self._lru = OrderedDict()
+        self._ids = itertools.count()
+        self._unsaved = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _load(self):
+        """Load the saved index on first use. Caller must hold the lock."""
+        self._loaded = True
+        if not self.enabled or not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                keys = json.loads(data['keys'].tobytes().decode('utf-8'))
+                if 'covers' not in data.files:
+                    return  # saved with the shortlist in the partition key
+                values = json.loads(data['values'].tobytes().decode('utf-8'))
+                covers = json.loads(data['covers'].tobytes().decode('utf-8'))
+                vectors, partitions = data['vectors'], data['partitions']
+                created, last_used = data['created'], data['last_used']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading semantic cache: {e}")
+            return
+        if vectors.shape[1:] != (FEATURE_DIMS,):
+            return  # saved with a different feature layout
+        now = time.time()
+        # Least recently used first, so the LRU order survives a restart
+        for i in np.argsort(last_used, kind='stable')[-self.max_entries:]:
+            if created[i] + self.ttl >= now:
+                self._append(keys[partitions[i]], vectors[i], values[i], covers[i], created[i], last_used[i])
+
+    def _append(self, key, vector, value, covers, created, last_used):
+        """Add an entry as the most recently used one. Caller must hold the lock."""
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition()
+        entry_id = next(self._ids)
+        partition.append(entry_id, vector, value, covers, created, last_used)
+        self._lru[entry_id] = key
+
+    def _remove(self, key, row):
+        """Remove an entry, and its partition once empty. Caller must hold the lock."""
+        partition = self._partitions[key]
+        del self._lru[partition.ids[row]]
+        partition.remove(row)
+        if not len(partition):
+            del self._partitions[key]
+
+    def lookup(self, features, shown=()):
+        """
+        Find the response of the most similar earlier request.
+
+        Args:
+            features (tuple): (partition key, vector, candidates) from recommendation_features()
+            shown (list): Names of every destination shown with the response; an earlier
+                          response is only reused if it covers no others. The request's
+                          own candidates always count as shown.
+
+        Returns:
+            The cached response, or None if nothing is similar enough
+        """
+        if not self.enabled:
+            return None
+        key, vector, candidates = features
+        shown = set(shown).union(candidates)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            partition = self._partitions.get(key)
+            if partition:
+                row = partition.nearest(vector, shown, self.threshold)
+                if row is not None:
+                    now = time.time()
+                    if partition.created[row] + self.ttl >= now:
+                        partition.last_used[row] = now
+                        self._lru.move_to_end(partition.ids[row])
+                        self._stats['hits'] += 1
+                        return partition.values[row]
+                    self._remove(key, row)
+            self._stats['misses'] += 1
+            return None
+
+    def add(self, features, value):
+        """Store a response for a request's features, evicting the least recently used entry when full"""
+        if not self.enabled:
+            return
+        key, vector, candidates = features
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            while len(self._lru) >= self.max_entries:
+                self._evict()
+            now = time.time()
+            self._append(key, vector, value, candidates, now, now)
+            self._unsaved += 1
+            save = self.path and self._unsaved >= self.save_every
+        if save:
+            self.save()
+
+    def _evict(self):
+        """Drop the least recently used entry. Caller must hold the lock."""
+        entry_id, key = next(iter(self._lru.items()))
+        self._remove(key, self._partitions[key].row(entry_id))
+        self._stats['evictions'] += 1
+
+    def save(self):
+        """Write the index to disk atomically (a temporary file replaced in one step)"""
+        if not self.path:
+            return
+        with self._lock:
+            keys = list(self._partitions)
+            partitions = [(index, self._partitions[key]) for index, key in enumerate(keys)]
+            snapshot = dict(
+                vectors=np.concatenate([p.vectors[:len(p)] for _, p in partitions] or [np.zeros((0, FEATURE_DIMS))]),
+                partitions=np.concatenate([np.full(len(p), i) for i, p in partitions] or [np.zeros(0, dtype=int)]),
+                created=np.concatenate([p.created[:len(p)] for _, p in partitions] or [np.zeros(0)]),
+                last_used=np.concatenate([p.last_used[:len(p)] for _, p in partitions] or [np.zeros(0)]),
+            )
+            values = [value for _, p in partitions for value in p.values]
+            covers = [list(names) for _, p in partitions for names in p.covers]
+            self._unsaved = 0
+        # Strings are stored as UTF-8 JSON bytes so the file loads without pickle
+        snapshot['keys'] = np.frombuffer(json.dumps(keys).encode('utf-8'), dtype=np.uint8)
+        snapshot['values'] = np.frombuffer(json.dumps(values).encode('utf-8'), dtype=np.uint8)
+        snapshot['covers'] = np.frombuffer(json.dumps(covers).encode('utf-8'), dtype=np.uint8)
+        with self._save_lock:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                temp_path = f"{self.path}.tmp.npz"
+                np.savez(temp_path, **snapshot)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"Error saving semantic cache: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._lru), partitions=len(self._partitions))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+            self._lru.clear()
+            self._unsaved = 0
+            self._loaded = True
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Shared similarity cache for destination recommendations
+semantic_cache = SemanticCache()
@@ -0,0 +1,347 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+from model_backends import ModelBackend, ModelBackendError, RateLimitError
+
+# Deterministic offline stand-in for Gemini. It recognises the prompts built in
+# gemini_api and answers with canned airport codes, flight JSON, itineraries and
+# recommendations, after a configurable latency and with configurable error rates.
+# Enable it with MODEL_BACKEND=stub.
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", 0))
+STUB_LATENCY_SIGMA = float(os.getenv("STUB_LATENCY_SIGMA", 0.3))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", 0))
+STUB_RATE_LIMIT_RATE = float(os.getenv("STUB_RATE_LIMIT_RATE", 0))
+STUB_SEED = int(os.getenv("STUB_SEED", 42))
+
+# Median latency of each kind of call, relative to STUB_LATENCY_MS (the itinerary)
+LATENCY_SCALE = {
+    'airport': 0.1,
+    'flights': 0.5,
+    'recommendations': 0.8,
+    'itinerary': 1.0,
+    'itinerary_skeleton': 0.3,
+    'itinerary_section': 0.35,
+}
+
+AIRLINES = [
+    ("Delta", "DL"), ("United", "UA"), ("American Airlines", "AA"), ("Air France", "AF"),
+    ("Lufthansa", "LH"), ("British Airways", "BA"), ("Emirates", "EK"), ("KLM", "KL"),
+    ("Qatar Airways", "QR"), ("Singapore Airlines", "SQ"),
+]
+HUBS = ["ATL", "ORD", "LHR", "FRA", "AMS", "DXB", "DOH", "IST", "SIN", "CDG"]
+AIRCRAFT = ["Boeing 737", "Airbus A320", "Boeing 787", "Airbus A350", "Boeing 777"]
+DESTINATIONS = [
+    "Lisbon, Portugal", "Kyoto, Japan", "Cape Town, South Africa", "Bali, Indonesia",
+    "Mexico City, Mexico", "Reykjavik, Iceland", "Marrakech, Morocco", "Vancouver, Canada",
+    "Hanoi, Vietnam", "Cusco, Peru", "Dubrovnik, Croatia", "Queenstown, New Zealand",
+]
+ACTIVITIES = [
+    "Guided walking tour of the old town", "Visit the main history museum",
+    "Street food tasting at the central market", "Sunset viewpoint hike",
+    "Half-day boat trip", "Local cooking class", "Afternoon at the botanical gardens",
+    "Evening at a traditional music venue", "Day trip to a nearby village",
+]
+
+
+class StubResponse:
+    """Minimal stand-in for a Gemini response or stream chunk"""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def stub_usage(prompt, text):
+    """Token usage in the shape of Gemini's usage_metadata, at ~4 characters per token"""
+    return SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+
+
+class StubBackend(ModelBackend):
+    """Canned, deterministic responses with simulated latency and failures"""
+
+    name = "stub"
+
+    def __init__(self, latency_ms=STUB_LATENCY_MS, latency_sigma=STUB_LATENCY_SIGMA,
+                 error_rate=STUB_ERROR_RATE, rate_limit_rate=STUB_RATE_LIMIT_RATE, seed=STUB_SEED):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls()
+
+    def _draw(self, kind):
+        """Draw a latency (seconds) and an outcome for one call"""
+        with self._lock:
+            roll = self._rng.random()
+            median = self.latency_ms * LATENCY_SCALE[kind] / 1000
+            latency = median * self._rng.lognormvariate(0, self.latency_sigma) if median > 0 else 0
+        if roll < self.rate_limit_rate:
+            return latency, RateLimitError("429 Resource has been exhausted (stub)", retry_after=1)
+        if roll < self.rate_limit_rate + self.error_rate:
+            return latency, ModelBackendError("503 The model is overloaded (stub)")
+        return latency, None
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        kind, text = render_response(prompt)
+        latency, error = self._draw(kind)
+        if not stream:
+            time.sleep(latency)
+            if error:
+                raise error
+            return StubResponse(text, stub_usage(prompt, text))
+        return self._stream(text, latency, error)
+
+    def _stream(self, text, latency, error):
+        chunks = split_chunks(text)
+        for chunk in chunks:
+            time.sleep(latency / len(chunks))
+            if error:
+                raise error
+            yield StubResponse(chunk)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        kind, text = render_response(prompt)
+        latency, error = self._draw(kind)
+        if not stream:
+            await asyncio.sleep(latency)
+            if error:
+                raise error
+            return StubResponse(text, stub_usage(prompt, text))
+        return self._stream_async(text, latency, error)
+
+    async def _stream_async(self, text, latency, error):
+        chunks = split_chunks(text)
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            if error:
+                raise error
+            yield StubResponse(chunk)
+
+
+def split_chunks(text, size=200):
+    """Split text into stream chunks"""
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _rng_for(prompt):
+    """Random generator seeded by the prompt, so identical prompts get identical answers"""
+    return random.Random(int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16], 16))
+
+
+def _field(prompt, label, default=""):
+    """Extract "- Label: value" / "Label: value" from a prompt"""
+    match = re.search(rf'{label}:\s*(.*)', prompt)
+    return match.group(1).strip() if match else default
+
+
+def render_response(prompt):
+    """
+    Classify a prompt and render its canned response.
+
+    Returns:
+        tuple: (kind, response text)
+    """
+    if "Convert each of the following locations" in prompt:
+        return 'airport', render_airport_codes(prompt)
+    if "IATA code" in prompt:
+        return 'airport', render_airport_code(prompt)
+    if "Generate realistic flight information" in prompt:
+        return 'flights', render_flights(prompt)
+    if "travel destination expert" in prompt:
+        return 'recommendations', render_recommendations(prompt)
+    if "Write a compact outline" in prompt:
+        return 'itinerary_skeleton', render_itinerary_skeleton(prompt)
+    if "covering the stay in" in prompt:
+        return 'itinerary_section', render_city_stay(prompt)
+    if "Write the detailed plan for days" in prompt or "Write only a" in prompt:
+        return 'itinerary_section', render_itinerary_section(prompt)
+    return 'itinerary', render_itinerary(prompt)
+
+
+def render_airport_code(prompt):
+    from airports import get_airport_index
+
+    location = _field(prompt, "Location")
+    if not location:
+        return "UNKNOWN"
+    code = get_airport_index().lookup(location)
+    if code:
+        return code
+    rng = _rng_for(location)
+    return "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(3))
+
+
+def render_airport_codes(prompt):
+    from airports import get_airport_index
+
+    entries = []
+    for number, location in re.findall(r'^\s*(\d+)\. (.+)$', prompt, re.MULTILINE):
+        code = get_airport_index().lookup(location)
+        if not code:
+            rng = _rng_for(location)
+            code = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(3))
+        entries.append({"index": int(number), "code": code})
+    return json.dumps(entries)
+
+
+def render_flights(prompt):
+    match = re.search(r'from (\w{3}) to (\w{3}) on (\S+?)\.', prompt)
+    source, destination, date = match.groups() if match else ("AAA", "BBB", "2025-04-02")
+    url_match = re.search(r'"google_flights_url": "([^"]*)"', prompt)
+    url = url_match.group(1) if url_match else "https://www.google.com/travel/flights"
+    rng = _rng_for(prompt)
+
+    options = []
+    for stops in (0, 1, 1):
+        airline, code = rng.choice(AIRLINES)
+        points = [source] + [rng.choice([h for h in HUBS if h not in (source, destination)]) for _ in range(stops)] + [destination]
+        departure_minutes = rng.randrange(6 * 60, 22 * 60, 5)
+        segments = []
+        layovers = []
+        clock = departure_minutes
+        for i in range(len(points) - 1):
+            duration = rng.randrange(90, 720, 5)
+            segments.append({
+                "departure_airport": {"id": points[i], "name": f"{points[i]} Airport", "time": _clock(clock)},
+                "arrival_airport": {"id": points[i + 1], "name": f"{points[i + 1]} Airport", "time": _clock(clock + duration)},
+                "airline": airline,
+                "flight_number": f"{code}{rng.randrange(100, 9999)}",
+                "duration": duration,
+                "airplane": rng.choice(AIRCRAFT),
+            })
+            clock += duration
+            if i < len(points) - 2:
+                layover = rng.randrange(60, 240, 5)
+                layovers.append({"id": points[i + 1], "name": f"{points[i + 1]} Airport", "duration": layover})
+                clock += layover
+        option = {
+            "airline": airline,
+            "price": str(rng.randrange(250, 1800, 10)),
+            "total_duration": clock - departure_minutes,
+            "flights": segments,
+        }
+        if layovers:
+            option["layovers"] = layovers
+        options.append(option)
+
+    return json.dumps({"best_flights": options, "search_metadata": {"google_flights_url": url}}, indent=2)
+
+
+def _clock(minutes):
+    minutes %= 24 * 60
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def render_itinerary(prompt):
+    rng = _rng_for(prompt)
+    destination = re.sub(r'\s*\(\w{3}\)\s*$', '', _field(prompt, "- Destination", "your destination")) or "your destination"
+    interests = _field(prompt, "- Interests", "sightseeing")
+    budget = _field(prompt, "- Budget", "your budget")
+    days = rng.randint(4, 7)
+
+    lines = [f"# Your Trip to {destination}", "", f"*Tailored for: {interests}. Budget: {budget}.*", "",
+             "## Day-by-Day Itinerary", ""]
+    for day in range(1, days + 1):
+        lines.append(f"### Day {day}")
+        for slot in ("Morning", "Afternoon", "Evening"):
+            lines.append(f"* **{slot}:** {rng.choice(ACTIVITIES)}")
+        lines.append("")
+    lines += [
+        "## Estimated Costs", "",
+        f"* **Accommodation:** ${rng.randrange(80, 300)} per night",
+        f"* **Food:** ${rng.randrange(30, 120)} per day",
+        f"* **Transportation:** ${rng.randrange(10, 60)} per day",
+        f"* **Activities:** ${rng.randrange(20, 150)} per day", "",
+        "## Where to Stay", "",
+        "* Central boutique hotel close to the old town",
+        "* Budget-friendly guesthouse near public transport", "",
+        "## Getting Around", "",
+        "* Public transit day passes", "* Walking and bike rentals", "",
+        "## Must-Try Food", "",
+        "* Local specialties at the central market", "* A family-run neighbourhood restaurant", "",
+        "## Tips", "",
+        "* Book popular attractions in advance", "* Carry some local currency", "",
+    ]
+    return "\n".join(lines)
+
+
+def render_itinerary_skeleton(prompt):
+    rng = _rng_for(prompt)
+    destination = re.sub(r'\s*\(\w{3}\)\s*$', '', _field(prompt, "- Destination", "your destination")) or "your destination"
+    interests = _field(prompt, "- Interests", "sightseeing")
+    days = int(re.search(r'(\d+)-day trip', prompt).group(1))
+
+    lines = [f"# Your Trip to {destination}", "", f"*{days} days tailored for: {interests}.*", "",
+             "## Trip Outline", ""]
+    lines += [f"- Day {day}: {rng.choice(ACTIVITIES)}" for day in range(1, days + 1)]
+    lines += [
+        "", "## Where to Stay", "",
+        "* Central boutique hotel close to the old town",
+        "* Budget-friendly guesthouse near public transport", "",
+        "## Estimated Costs", "",
+        f"* **Accommodation:** ${rng.randrange(80, 300)} per night",
+        f"* **Food:** ${rng.randrange(30, 120)} per day",
+        f"* **Transportation:** ${rng.randrange(10, 60)} per day",
+        f"* **Activities:** ${rng.randrange(20, 150)} per day", "",
+    ]
+    return "\n".join(lines)
+
+
+def render_itinerary_section(prompt):
+    rng = _rng_for(prompt)
+    heading = re.search(r'Write only a "(.+?)" section', prompt)
+    if heading:
+        return "\n".join([heading.group(1), ""] + [f"* {item}" for item in rng.sample(ACTIVITIES, 3)])
+
+    first, last = map(int, re.search(r'plan for days (\d+)-(\d+)', prompt).groups())
+    lines = []
+    for day in range(first, last + 1):
+        lines.append(f"### Day {day}")
+        for slot in ("Morning", "Afternoon", "Evening"):
+            lines.append(f"* **{slot}:** {rng.choice(ACTIVITIES)}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def render_city_stay(prompt):
+    rng = _rng_for(prompt)
+    heading = re.search(r'Start with a "(.+?)" heading', prompt).group(1)
+    first, last = map(int, re.search(r'covering the stay in .+?, days (\d+)-(\d+)', prompt).groups())
+    lines = [heading, ""]
+    for day in range(first, last + 1):
+        lines.append(f"### Day {day}")
+        for slot in ("Morning", "Afternoon", "Evening"):
+            lines.append(f"* **{slot}:** {rng.choice(ACTIVITIES)}")
+        lines.append("")
+    lines += ["**Where to stay**", "", "* Central boutique hotel close to the old town", "",
+              "**Must-try food**", "", "* Local specialties at the central market", ""]
+    return "\n".join(lines)
+
+
+def render_recommendations(prompt):
+    rng = _rng_for(prompt)
+    interests = _field(prompt, "- Interests", "travel")
+    # Write up the shortlisted destinations listed in the prompt, if any
+    destinations = re.findall(r'^\s*\d+\. (.+?) \([A-Z]{3}\)', prompt, re.MULTILINE) or rng.sample(DESTINATIONS, 5)
+    lines = ["# Recommended Destinations", ""]
+    for i, destination in enumerate(destinations, start=1):
+        lines += [
+            f"## {i}. {destination}", "",
+            f"* **Why it matches:** Great for {interests}",
+            f"* **Typical costs:** around ${rng.randrange(80, 250)} per person per day",
+            "* **Weather:** Pleasant during your dates",
+            f"* **Top picks:** {', '.join(rng.sample(ACTIVITIES, 3))}", "",
+        ]
+    return "\n".join(lines)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Keep the module-level caches and stores off disk, and import the backend modules the way the app does
+os.environ.setdefault("RESPONSE_CACHE_PATH", "")
+os.environ.setdefault("SEMANTIC_CACHE_PATH", "")
+os.environ.setdefault("PLAN_STORE_PATH", "")
+os.environ.setdefault("JOB_WORKERS", "0")
+os.environ.setdefault("MODEL_BACKEND", "stub")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,90 @@
+import airports
+from airports import AirportIndex
+
+
+def test_qualifier_must_match_country_or_region():
+    index = AirportIndex.from_csv()
+    assert index.lookup("Paris, France") == "CDG"
+    assert index.lookup("Portland, OR, USA") == "PDX"
+    assert index.lookup("Chicago, IL") == "ORD"
+    for location in ("Paris, Texas", "Portland, Maine", "London, Ontario", "Athens, GA", "Melbourne, Florida"):
+        assert index.lookup(location) is None, location
+
+
+def test_learned_locations_are_bounded(monkeypatch):
+    monkeypatch.setattr(airports, "AIRPORT_LEARNED_MAX_ENTRIES", 2)
+    index = AirportIndex.from_csv()
+    index.remember("Paris, Texas", "PRX")
+    index.remember("Rome, NY", "RME")
+    index.remember("Moscow, Idaho", "PUW")
+    assert index.lookup("Paris, Texas") is None
+    assert index.lookup("Rome, NY") == "RME"
+    assert index.lookup("Moscow, Idaho") == "PUW"
+
+
+def test_lookup_by_code_name_alias_prefix_and_typo():
+    index = AirportIndex.from_csv()
+    assert index.lookup(" lhr ") == "LHR"
+    assert index.lookup("Zürich") == index.lookup("ZURICH") == "ZRH"
+    assert index.lookup("New York City") == "JFK"
+    assert index.lookup("San Fran") == "SFO"
+    assert index.lookup("Barcelonna") == "BCN"
+    assert index.lookup("Atlantis") is None
+    assert index.lookup("  ") is None
+
+
+def test_model_is_only_asked_for_locations_the_index_does_not_know(monkeypatch):
+    import gemini_api
+    asked = []
+
+    def generate(location):
+        asked.append(location)
+        return "XYZ"
+
+    index = AirportIndex.from_csv()
+    monkeypatch.setattr(gemini_api, "get_airport_index", lambda: index)
+    monkeypatch.setattr(gemini_api, "_generate_airport_code", generate)
+    assert gemini_api.get_airport_code("Tokyo, Japan") in ("HND", "NRT")
+    assert gemini_api.get_airport_code("Smallville, Kansas") == "XYZ"
+    assert index.lookup("Smallville, Kansas") == "XYZ"
+    assert asked == ["Smallville, Kansas"]
+
+
+def test_batched_answers_with_bad_codes_or_indexes_are_dropped():
+    from gemini_api import parse_airport_codes
+
+    text = ('```json\n[{"index": 1, "code": "SMV"}, {"index": 2, "code": "UNKNOWN"}, {"index": 3, "code": "xy"}, '
+            '{"index": 4, "code": "AAA"}, {"index": 4, "code": "BBB"}, {"index": 9, "code": "CCC"}, '
+            '{"index": true, "code": "DDD"}]\n```')
+    assert parse_airport_codes(text, 5) == {1: "SMV", 2: None}
+    assert parse_airport_codes("no idea", 5) == {}
+
+
+def test_unknown_locations_are_resolved_in_one_prompt_and_only_bad_answers_asked_again(monkeypatch):
+    import gemini_api
+    from cache import ResponseCache
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    prompts = []
+    answers = ['[{"index": 1, "code": "SMV"}, {"index": 2, "code": "??"}, {"index": 3, "code": "UNKNOWN"}]',
+               '[{"index": 1, "code": "GTM"}]']
+
+    def call_model(stage, prompt, **kwargs):
+        prompts.append(prompt)
+        return Response(answers[len(prompts) - 1])
+
+    monkeypatch.setattr(gemini_api, "get_airport_index", lambda index=AirportIndex.from_csv(): index)
+    monkeypatch.setattr(gemini_api, "response_cache", ResponseCache())
+    monkeypatch.setattr(gemini_api, "call_model", call_model)
+    locations = ["Paris", "Smallville", "Gotham", "paris", "Atlantis", "Smallville"]
+    assert gemini_api.get_airport_codes(locations) == {
+        "Paris": "CDG", "paris": "CDG", "Smallville": "SMV", "Gotham": "GTM", "Atlantis": None
+    }
+    assert len(prompts) == 2
+    assert "1. Smallville\n2. Gotham\n3. Atlantis" in prompts[0] and "Paris" not in prompts[0]
+    assert "1. Gotham" in prompts[1] and "Smallville" not in prompts[1]
+    assert gemini_api.get_airport_codes(["Smallville", "Gotham"]) == {"Smallville": "SMV", "Gotham": "GTM"}
+    assert len(prompts) == 2
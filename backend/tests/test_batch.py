@@ -0,0 +1,91 @@
+import time
+import asyncio
+import threading
+import pytest
+import batch
+from batch import _group_trips
+
+TRIP = {"source": "Boston", "destination": "Rome", "dates": "June 10-20, 2025", "budget": "$3000",
+        "travelers": "2", "interests": ["food"]}
+
+
+def test_bad_trip_gets_its_own_error():
+    trips = [TRIP, dict(TRIP, source=123), dict(TRIP, interests=[1]), dict(TRIP, travelers=2)]
+    invalid, groups, locations = _group_trips(trips)
+    assert invalid == {1: "'source' must be a string", 2: "'interests' must be a list of strings"}
+    assert sorted(index for _, indices in groups.values() for index in indices) == [0, 3]
+
+
+class FakePlans:
+    """Stands in for plan generation, recording calls and how many ran at once"""
+
+    def __init__(self):
+        self.calls = []
+        self.running = 0
+        self.most = 0
+        self._lock = threading.Lock()
+
+    def generate(self, airport_codes=None, **args):
+        with self._lock:
+            self.calls.append(args['destination'])
+            self.running += 1
+            self.most = max(self.most, self.running)
+        time.sleep(0.02)
+        with self._lock:
+            self.running -= 1
+        if args['destination'] == "Atlantis":
+            raise ValueError("no such place")
+        return {"travel_plan": f"Plan for {args['destination']}", "source_code": airport_codes.get(args['source'])}
+
+    async def generate_async(self, airport_codes=None, **args):
+        return await asyncio.to_thread(self.generate, airport_codes, **args)
+
+
+@pytest.fixture
+def plans(monkeypatch):
+    plans = FakePlans()
+    codes = lambda locations: {location: location[:3].upper() for location in locations}
+
+    async def codes_async(locations):
+        return codes(locations)
+
+    monkeypatch.setattr(batch, "generate_travel_plan", plans.generate)
+    monkeypatch.setattr(batch, "generate_travel_plan_async", plans.generate_async)
+    monkeypatch.setattr(batch, "get_airport_codes", codes)
+    monkeypatch.setattr(batch, "get_airport_codes_async", codes_async)
+    monkeypatch.setattr(batch, "with_plan_id", lambda result: dict(result, plan_id=result["travel_plan"]))
+    return plans
+
+
+def batch_trips():
+    destinations = ["Rome", "Paris", "Rome", "Atlantis", "Lisbon", "Oslo", "Vienna", "Prague"]
+    return [dict(TRIP, destination=destination, id=f"trip-{n}") for n, destination in enumerate(destinations)]
+
+
+def check_items(items, plans):
+    items = sorted(items, key=lambda item: item['index'])
+    assert [item['id'] for item in items] == [f"trip-{n}" for n in range(8)]
+    assert items[0]['plan_id'] == items[2]['plan_id'] == "Plan for Rome"
+    assert items[0]['source_code'] == "BOS"
+    assert items[3] == {'index': 3, 'id': "trip-3", 'success': False, 'error': "no such place"}
+    assert all(item['success'] for item in items if item['index'] != 3)
+    assert sorted(plans.calls) == sorted(set(plans.calls)) and len(plans.calls) == 7
+    assert plans.most == 2
+
+
+def test_batch_generates_each_distinct_trip_once_within_its_concurrency(plans):
+    check_items(list(batch.generate_travel_plans(batch_trips(), concurrency=2)), plans)
+
+
+def test_async_batch_generates_each_distinct_trip_once_within_its_concurrency(plans):
+    async def run():
+        return [item async for item in batch.generate_travel_plans_async(batch_trips(), concurrency=2)]
+
+    check_items(asyncio.run(run()), plans)
+
+
+@pytest.mark.parametrize('trips, concurrency', [([], 1), ({"trips": []}, 1), ([TRIP] * 101, 1), ([TRIP], 0),
+                                                ([TRIP], True)])
+def test_invalid_batches_are_rejected_whole(trips, concurrency):
+    with pytest.raises(batch.BatchError):
+        batch.generate_travel_plans(trips, concurrency)
@@ -0,0 +1,189 @@
+import asyncio
+from cache import ResponseCache
+
+
+def test_cancelled_leader_hands_over_to_waiting_request():
+    cache = ResponseCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05 if len(calls) > 1 else 10)
+        return "plan"
+
+    async def run():
+        leader = asyncio.create_task(cache.get_or_compute_async("key", compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get_or_compute_async("key", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        value = await asyncio.wait_for(follower, timeout=2)
+        return leader, value
+
+    leader, value = asyncio.run(run())
+    assert leader.cancelled()
+    assert value == "plan"
+    assert len(calls) == 2
+    assert not cache._async_in_flight
+
+
+def test_refresh_records_timings_into_its_own_dict():
+    import contextvars
+    from cache import _refreshing
+    from gemini_api import compute_timings
+
+    timings = {}
+    assert compute_timings(timings) is timings
+    refresh = contextvars.copy_context()
+    refresh.run(_refreshing.set, True)
+    assert refresh.run(compute_timings, timings) is not timings
+
+
+def test_budgets_with_different_meanings_get_different_keys():
+    from cache import normalize_budget
+
+    assert normalize_budget("$3000") == normalize_budget("3,000 USD") == normalize_budget("3k") == "3000 USD"
+    assert normalize_budget("EUR 2k") == normalize_budget("2000 euros")
+    assert normalize_budget("$3000 per person") != normalize_budget("$3000 total")
+    assert normalize_budget("$2000-3000") != normalize_budget("$2000")
+    assert normalize_budget("  $3000   Per  Person ") == "$3000 per person"
+
+
+def test_party_descriptions_keep_their_wording():
+    from cache import normalize_travelers, traveler_count
+
+    assert normalize_travelers("2") == normalize_travelers("2 people") == normalize_travelers("2 Travelers") == 2
+    assert normalize_travelers("2 adults, 2 kids") != normalize_travelers("2 adults + 1 infant")
+    assert normalize_travelers("2 adults, 2 kids") != normalize_travelers("2")
+    assert traveler_count("2 adults + 1 infant") == 3
+
+
+def test_per_person_and_total_budgets_get_different_plans():
+    from cache import plan_cache_key
+
+    args = ("Boston", "Rome", "June 10-20")
+    family = plan_cache_key(*args, "$3000 per person", "2 adults, 2 kids", ["food"])
+    couple = plan_cache_key(*args, "$3000 total", "2 adults, 2 kids", ["food"])
+    assert family != couple
+    assert plan_cache_key(*args, "$3000", "2", ["food"]) == plan_cache_key(*args, "3k", "2 people", ["Food"])
+
+
+def test_equivalent_requests_share_a_plan_key():
+    from cache import plan_cache_key
+
+    assert plan_cache_key("New York", "Zürich", "June 10-20 2027", "$3000", "2", ["Food", "art"]) == \
+        plan_cache_key(" new york ", "ZURICH", "10-20 June 2027", "3k", "2 people", ["art", "food"])
+    assert plan_cache_key("New York", "Zurich", "June 10-20 2027", "$3000", "2", ["food"]) != \
+        plan_cache_key("New York", "Zurich", "June 10-20 2027", "$3000", "2", ["food"], include_flights=True)
+
+
+def test_concurrent_identical_requests_compute_once():
+    import threading
+    import time
+
+    cache = ResponseCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"plan": "text"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [{"plan": "text"}] * 8
+    assert len(calls) == 1
+    assert cache.stats()['coalesced'] == 7
+
+
+def test_rejected_values_are_returned_but_not_cached():
+    cache = ResponseCache()
+    assert cache.get_or_compute("key", lambda: "error", should_cache=lambda value: value != "error") == "error"
+    assert cache.get_or_compute("key", lambda: "plan", should_cache=lambda value: value != "error") == "plan"
+    assert cache.get("key") == "plan"
+
+
+def test_memory_tier_is_bounded_and_expires():
+    import time
+    from cache import LRUCache
+
+    memory = LRUCache(max_entries=2, ttl=0.05)
+    memory.set("a", 1)
+    memory.set("b", 2)
+    memory.get("a")
+    memory.set("c", 3)
+    assert (memory.get("a"), memory.get("b"), memory.get("c")) == (1, None, 3)
+    time.sleep(0.06)
+    assert memory.get("a") is None
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    from cache import LRUCache, SQLiteStore
+
+    path = str(tmp_path / "responses.sqlite3")
+    ResponseCache(LRUCache(), SQLiteStore(path)).set("key", {"plan": "text"})
+    restarted = ResponseCache(LRUCache(), SQLiteStore(path))
+    assert restarted.get_or_compute("key", lambda: {"plan": "new"}) == {"plan": "text"}
+    assert restarted.stats()['disk_hits'] == 1
+
+
+def generate_in_process(path, log_path):
+    """One worker process asking the shared cache for the same plan"""
+    import os
+    import time
+    from cache import LRUCache, SQLiteStore
+
+    def compute():
+        with open(log_path, 'a') as log:
+            log.write(f"{os.getpid()}\n")
+        time.sleep(0.5)
+        return {"plan": os.getpid()}
+
+    return ResponseCache(LRUCache(), SQLiteStore(path)).get_or_compute("key", compute)
+
+
+def test_worker_processes_share_one_generation(tmp_path):
+    import multiprocessing
+
+    path, log_path = str(tmp_path / "responses.sqlite3"), str(tmp_path / "generations.log")
+    with multiprocessing.get_context('spawn').Pool(3) as pool:
+        results = pool.starmap(generate_in_process, [(path, log_path)] * 3)
+    with open(log_path) as log:
+        generations = log.read().split()
+    assert len(generations) == 1
+    assert results == [{"plan": int(generations[0])}] * 3
+
+
+def test_lease_of_a_crashed_process_expires(tmp_path):
+    import time
+    from cache import SQLiteStore
+
+    store = SQLiteStore(str(tmp_path / "responses.sqlite3"))
+    assert store.acquire_lease("key", "crashed", seconds=0.05)
+    assert not store.acquire_lease("key", "other")
+    time.sleep(0.06)
+    assert store.acquire_lease("key", "other")
+    store.release_lease("key", "crashed")
+    assert not store.acquire_lease("key", "third")
+    store.release_lease("key", "other")
+    assert store.acquire_lease("key", "third")
+
+
+def test_disk_tier_evicts_least_recently_used_entries_over_its_size(tmp_path):
+    from cache import SQLiteStore
+
+    store = SQLiteStore(str(tmp_path / "responses.sqlite3"), max_bytes=2000)
+    store.TOUCH_SECONDS = 0
+    for n in range(SQLiteStore.EVICT_EVERY):
+        store.set(f"key{n}", "x" * 100)
+    store.get("key0")
+    store.set("last", "x" * 100)
+    entries, size = store.size()
+    assert size <= 1800 and entries < SQLiteStore.EVICT_EVERY
+    assert store.get("key0") is not None and store.get("last") is not None
+    assert store.get("key1") is None
@@ -0,0 +1,79 @@
+import gzip
+import asyncio
+from types import SimpleNamespace
+import pytest
+from cassette_backend import (CassetteWriter, RecordingBackend, ReplayBackend, CassetteMiss, load_cassettes,
+                              prompt_key)
+from model_backends import ModelBackend, RateLimitError
+
+
+class ScriptedBackend(ModelBackend):
+    """Answers "busy" prompts with a rate limit and others with their reversed text"""
+
+    name = "scripted"
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if prompt == "busy":
+            raise RateLimitError("429 Resource has been exhausted")
+        usage = SimpleNamespace(prompt_token_count=len(prompt), candidates_token_count=3)
+        if stream:
+            return iter([SimpleNamespace(text=prompt[::-1][:2]), SimpleNamespace(text=prompt[::-1][2:])])
+        return SimpleNamespace(text=prompt[::-1], usage_metadata=usage)
+
+
+def record(tmp_path):
+    writer = CassetteWriter(str(tmp_path), prompts=True)
+    recorder = RecordingBackend(ScriptedBackend(), writer)
+    assert recorder.generate_content("hello").text == "olleh"
+    assert [chunk.text for chunk in recorder.generate_content("stream me", stream=True)] == ["em", " maerts"]
+    with pytest.raises(RateLimitError):
+        recorder.generate_content("busy")
+    writer.close()
+    return writer.path
+
+
+def test_recorded_calls_replay_the_same_answers(tmp_path):
+    record(tmp_path)
+    replay = ReplayBackend(load_cassettes(str(tmp_path)), latency=0)
+    response = replay.generate_content("hello")
+    assert response.text == "olleh"
+    assert (response.usage_metadata.prompt_token_count, response.usage_metadata.candidates_token_count) == (5, 3)
+    assert [chunk.text for chunk in replay.generate_content("stream me", stream=True)] == ["em", " maerts"]
+    with pytest.raises(RateLimitError):
+        replay.generate_content("busy")
+    with pytest.raises(CassetteMiss):
+        replay.generate_content("never recorded")
+    assert asyncio.run(replay.generate_content_async("hello")).text == "olleh"
+
+
+def test_replay_misses_go_to_the_live_backend_when_configured(tmp_path):
+    record(tmp_path)
+    replay = ReplayBackend(load_cassettes(str(tmp_path)), latency=0, fallback=ScriptedBackend())
+    assert replay.generate_content("never recorded").text == "dedrocer reven"
+
+
+def test_cassette_cut_off_by_a_crash_keeps_its_complete_calls(tmp_path):
+    path = record(tmp_path)
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(gzip.compress(data.encode('utf-8'))[:-12])
+    entries = load_cassettes(path)
+    assert entries[prompt_key("hello")]['text'] == "olleh"
+
+
+def test_recorded_plan_replays_identically(tmp_path, monkeypatch):
+    import gemini_api
+    from cache import ResponseCache
+    from stub_backend import StubBackend
+
+    trip = ("Boston", "Rome", "June 10-14, 2027", "$3000", "2", ["food"])
+    monkeypatch.setattr(gemini_api.model, "backend", RecordingBackend(StubBackend(), CassetteWriter(str(tmp_path))))
+    monkeypatch.setattr(gemini_api, "response_cache", ResponseCache())
+    recorded = gemini_api.generate_travel_plan(*trip, include_flights=True)
+    gemini_api.model.backend.writer.close()
+
+    monkeypatch.setattr(gemini_api.model, "backend", ReplayBackend(load_cassettes(str(tmp_path)), latency=0))
+    monkeypatch.setattr(gemini_api, "response_cache", ResponseCache())
+    replayed = gemini_api.generate_travel_plan(*trip, include_flights=True)
+    assert replayed['travel_plan'] == recorded['travel_plan'] and replayed['flight_details']
@@ -0,0 +1,46 @@
+from destinations import (DestinationCatalog, daily_budget_usd, shortlist_destinations, trip_days, DEFAULT_TRIP_DAYS,
+                          DESTINATION_SHORTLIST, ON_GROUND_BUDGET_SHARE, USD_RATES)
+
+
+def test_shortlist_keeps_catalog_order_for_equal_scores():
+    rows = [{'name': f"City {i}", 'country': "X", 'airport': f"C{i:02d}", 'tags': "food",
+             'daily_cost_usd': "100", 'climate': "|".join(["7"] * 12)} for i in range(40)]
+    shortlist = DestinationCatalog(rows).shortlist(["food"], "", "", 1, limit=10)
+    assert [d['name'] for d in shortlist] == [f"City {i}" for i in range(10)]
+
+
+def row(name, tags, cost, good_month):
+    return {'name': name, 'country': "X", 'airport': name[:3].upper(), 'tags': tags, 'daily_cost_usd': str(cost),
+            'climate': "|".join("10" if month == good_month else "2" for month in range(1, 13))}
+
+
+CATALOG = DestinationCatalog([
+    row("Beachtown", "beach|food", 80, 8),
+    row("Skiville", "skiing|mountains", 90, 1),
+    row("Pricey Bay", "beach|food", 600, 8),
+    row("Museum City", "art|museums|food", 100, 5),
+])
+
+
+def test_interests_budget_and_season_rank_the_catalog():
+    ranked = CATALOG.shortlist(["Beaches", "food"], "$3000", "August 1-10", "2")
+    assert [d['name'] for d in ranked] == ["Beachtown", "Pricey Bay", "Museum City", "Skiville"]
+    assert ranked[0]['matched_interests'] == ["beach", "food"] and ranked[0]['within_budget']
+    assert not ranked[1]['within_budget'] and ranked[0]['climate'] == 10.0
+    assert [d['name'] for d in CATALOG.shortlist(["skiing"], "$2000", "January 1-10", "2", limit=1)] == ["Skiville"]
+
+
+def test_budget_per_day_and_person_in_usd():
+    assert daily_budget_usd("$2000", "2", "August 1-10") == 2000 * ON_GROUND_BUDGET_SHARE / 2 / 10
+    assert daily_budget_usd("$2000 per person", "2", "August 1-10") == 2000 * ON_GROUND_BUDGET_SHARE / 10
+    assert daily_budget_usd("€1000", "1", "2 weeks") == 1000 * USD_RATES['EUR'] * ON_GROUND_BUDGET_SHARE / 14
+    assert daily_budget_usd("whatever it takes", "2", "August") is None
+    assert trip_days("sometime") == DEFAULT_TRIP_DAYS
+
+
+def test_bundled_catalog_shortlists_airports_the_index_knows():
+    from airports import get_airport_index
+
+    shortlist = shortlist_destinations(["beach"], "$3000", "July 1-10", "2")
+    assert len(shortlist) == DESTINATION_SHORTLIST
+    assert all(get_airport_index().get_airport(d['airport_code']) for d in shortlist)
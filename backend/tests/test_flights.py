@@ -0,0 +1,61 @@
+import json
+import pytest
+from flights import FlightResults, FlightDataError, parse_flight_results, render_flight_markdown
+
+
+def option(price, airline="Delta", duration="7h 5m", source="BOS", destination="FCO"):
+    return {
+        "airline": airline, "price": price, "total_duration": duration,
+        "flights": [{
+            "departure_airport": {"id": source.lower(), "name": "Logan", "time": "2025-06-10 18:30"},
+            "arrival_airport": {"id": destination, "name": "Fiumicino", "time": "2025-06-11 08:35"},
+            "airline": airline, "flight_number": "DL 214", "duration": 425, "overnight": True,
+        }],
+        "carbon_emissions": {"this_flight": 512000, "difference_percent": -4},
+    }
+
+
+DATA = {"best_flights": [option("$1,234"), option(980, airline="ITA", duration=430)],
+        "search_metadata": {"google_flights_url": "https://www.google.com/travel/flights?q=BOS-FCO"}}
+
+
+def test_options_are_validated_into_typed_records():
+    results = parse_flight_results(json.dumps(DATA))
+    first, second = results.options
+    assert (first.price, first.total_duration, second.price, second.total_duration) == ("1234", 425, "980", 430)
+    assert first.segments[0].departure.id == "BOS" and first.segments[0].overnight
+    assert not results.partial
+    assert FlightResults.from_dict(results.to_dict()) == results
+
+
+def test_fenced_json_is_read_and_unreadable_options_are_dropped():
+    data = dict(DATA, best_flights=DATA["best_flights"] + [{"airline": "Ghost", "flights": []}, "junk"])
+    results = parse_flight_results(f"Here you go:\n```json\n{json.dumps(data)}\n```\n")
+    assert [option.airline for option in results.options] == ["Delta", "ITA"]
+    assert results.partial
+
+
+def test_complete_options_are_salvaged_from_a_cut_off_response():
+    text = json.dumps(DATA)
+    results = parse_flight_results(text[:text.index('"ITA"') + 20])
+    assert [option.airline for option in results.options] == ["Delta"]
+    assert results.partial
+
+
+@pytest.mark.parametrize('text', ["Sorry, no flights", '{"best_flights": [{"airline": "Ghost"}]}',
+                                  '{"best_flights": [{"airline": "Ghost", "flights": [{}]}'])
+def test_responses_without_flight_data_are_rejected(text):
+    with pytest.raises(FlightDataError):
+        parse_flight_results(text)
+
+
+def test_section_renders_the_requested_route_and_flags_partial_results():
+    markdown = render_flight_markdown(parse_flight_results(json.dumps(DATA)), "BOS", "FCO")
+    assert markdown.startswith("## ✈️ Flight Options\n\n**From**: BOS to **FCO**")
+    assert markdown.count("<tr>") == 3
+    assert "#### Option 1: $1234" in markdown and "#### Option 2: $980" in markdown
+    assert "* **Overnight flight**" in markdown
+    assert "could not be read" not in markdown
+
+    partial = FlightResults.from_dict(DATA, partial=True)
+    assert "could not be read" in render_flight_markdown(partial, "BOS", "FCO")
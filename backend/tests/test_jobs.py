@@ -0,0 +1,108 @@
+import time
+import pytest
+import jobs
+from jobs import JobQueue, plan_job_id
+from model_backends import RateLimitError
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Handler for 'test' jobs: the payload lists what each attempt does"""
+    runs = []
+
+    def handler(payload):
+        outcome = payload['outcomes'][len(runs)]
+        runs.append(outcome)
+        if outcome == 'slow':
+            time.sleep(0.6)
+        elif outcome == 'busy':
+            raise RateLimitError("429 Resource has been exhausted", retry_after=0.01)
+        elif outcome == 'broken':
+            raise ValueError("bad request")
+        return {'attempt': len(runs)}
+
+    monkeypatch.setitem(jobs.HANDLERS, 'test', handler)
+    return runs
+
+
+def queue(tmp_path, **options):
+    return JobQueue(path=str(tmp_path / "jobs.sqlite3"), workers=0, **options)
+
+
+def run_all(job_queue):
+    while job_queue.run_one() or job_queue.get('job')['status'] == 'queued':
+        time.sleep(0.01)
+    return job_queue.get('job')
+
+
+def test_identical_plan_requests_share_a_job():
+    args = ("Boston", "Rome", "June 10-20, 2025", "$3000", "2")
+    assert plan_job_id(*args, ["food", "art"]) == plan_job_id(" boston", "ROME", *args[2:], ["Art", "food"])
+    assert plan_job_id(*args, ["food"]) != plan_job_id(*args, ["food"], include_flights=True)
+
+
+def test_job_runs_once_and_a_repeat_submission_returns_it(tmp_path, runs):
+    job_queue = queue(tmp_path)
+    assert job_queue.submit('job', 'test', {'outcomes': ['ok']})['status'] == 'queued'
+    job = run_all(job_queue)
+    assert (job['status'], job['result'], job['attempts']) == ('done', {'attempt': 1}, 1)
+    assert job_queue.submit('job', 'test', {'outcomes': ['ok']})['status'] == 'done'
+    assert not job_queue.run_one() and runs == ['ok']
+
+
+def test_transient_errors_are_retried_until_the_attempts_run_out(tmp_path, runs):
+    job_queue = queue(tmp_path, max_attempts=3)
+    job_queue.submit('job', 'test', {'outcomes': ['busy', 'busy', 'ok']})
+    assert run_all(job_queue)['status'] == 'done' and runs == ['busy', 'busy', 'ok']
+
+    runs.clear()
+    job_queue = queue(tmp_path / "other", max_attempts=2)
+    job_queue.submit('job', 'test', {'outcomes': ['busy', 'busy', 'ok']})
+    job = run_all(job_queue)
+    assert (job['status'], job['attempts']) == ('failed', 2) and "429" in job['error']
+
+
+def test_other_errors_fail_the_job_and_a_resubmission_starts_over(tmp_path, runs):
+    job_queue = queue(tmp_path)
+    job_queue.submit('job', 'test', {'outcomes': ['broken', 'ok']})
+    job = run_all(job_queue)
+    assert (job['status'], job['error']) == ('failed', "bad request")
+    assert job_queue.submit('job', 'test', {'outcomes': ['broken', 'ok']})['attempts'] == 0
+    assert run_all(job_queue)['status'] == 'done'
+
+
+def test_job_of_a_dead_worker_is_picked_up_once_its_lease_expires(tmp_path, runs):
+    crashed = queue(tmp_path, lease_seconds=0.05)
+    crashed.submit('job', 'test', {'outcomes': ['ok']})
+    assert crashed._claim()[0] == 'job'
+    survivor = queue(tmp_path, lease_seconds=0.05)
+    assert not survivor.run_one()
+    time.sleep(0.06)
+    assert survivor.run_one()
+    job = survivor.get('job')
+    assert (job['status'], job['attempts']) == ('done', 2)
+
+
+def test_job_that_keeps_losing_its_worker_is_abandoned(tmp_path, runs):
+    job_queue = queue(tmp_path, lease_seconds=0.01, max_attempts=2)
+    job_queue.submit('job', 'test', {'outcomes': ['ok']})
+    for _ in range(2):
+        assert job_queue._claim()
+        time.sleep(0.02)
+    job = run_all(job_queue)
+    assert job['status'] == 'failed' and "abandoned" in job['error'] and not runs
+
+
+def test_running_workers_renew_their_leases(tmp_path, runs):
+    worker = JobQueue(path=str(tmp_path / "jobs.sqlite3"), workers=1, lease_seconds=0.3)
+    other = queue(tmp_path, lease_seconds=0.3)
+    worker.submit('job', 'test', {'outcomes': ['slow', 'ok']})
+    worker.start()
+    try:
+        time.sleep(0.45)
+        assert other.get('job')['status'] == 'running'
+        assert not other.run_one()
+        assert worker.wait('job', 2)['status'] == 'done'
+    finally:
+        worker.stop()
+    assert runs == ['slow']
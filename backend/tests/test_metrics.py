@@ -0,0 +1,51 @@
+import re
+from metrics import Counter, Histogram, Registry, observe_stage, begin_request, finish_request
+
+PLAN_REQUEST = {"source": "Boston", "destination": "Rome", "dates": "June 10-14, 2027", "budget": "$3000",
+                "travelers": "2", "interests": ["history"]}
+
+
+def test_histograms_and_counters_render_in_the_prometheus_format():
+    registry = Registry()
+    histogram = registry.register(Histogram("latency_seconds", "Latency", (0.1, 1), ("stage",)))
+    counter = registry.register(Counter("errors_total", "Errors", ("stage", "error")))
+    for value in (0.05, 0.5, 2):
+        histogram.observe(value, stage="itinerary")
+    counter.inc(stage="itinerary", error="StageTimeout")
+    registry.add_collector(lambda: [("cache_hits", "gauge", "Hits", [({"tier": "memory"}, 3)])])
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{stage="itinerary",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="itinerary",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="itinerary",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="itinerary"} 3' in lines
+    assert 'latency_seconds_sum{stage="itinerary"} 2.55' in lines
+    assert 'errors_total{stage="itinerary",error="StageTimeout"} 1' in lines
+    assert '# TYPE cache_hits gauge' in lines and 'cache_hits{tier="memory"} 3' in lines
+
+
+def test_server_timing_lists_the_request_stages():
+    start = begin_request()
+    with observe_stage("airport_index"):
+        pass
+    with observe_stage("itinerary"):
+        pass
+    header = finish_request(start, "create_travel_plan", 200)
+    assert re.fullmatch(r"airport_index;dur=\d+\.\d, itinerary;dur=\d+\.\d, total;dur=\d+\.\d", header)
+
+
+def test_plan_response_carries_server_timing_and_metrics_are_scraped(monkeypatch):
+    import gemini_api
+    from app import app
+    from cache import ResponseCache
+
+    monkeypatch.setattr(gemini_api, "response_cache", ResponseCache())
+    client = app.test_client()
+    response = client.post('/api/generate-plan', json=PLAN_REQUEST)
+    assert response.status_code == 200
+    stages = [entry.split(';')[0] for entry in response.headers['Server-Timing'].split(', ')]
+    assert "itinerary" in stages and stages[-1] == "total"
+    scrape = client.get('/metrics')
+    assert scrape.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    body = scrape.get_data(as_text=True)
+    assert 'travel_planner_model_tokens_count{stage="itinerary",kind="response"}' in body
+    assert 'travel_planner_http_request_seconds_count{endpoint="create_travel_plan",status="200"}' in body
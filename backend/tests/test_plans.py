@@ -0,0 +1,61 @@
+import gzip
+import json
+from plans import PlanStore, plan_sections
+
+PLAN = {
+    'travel_plan': "# Trip\n\n## A\n\nOne\n\n## B\n\nTwo\n\n## A-B\n\nThree\n\n## Tips\n\n" + "Pack light. " * 200,
+    'source_code': 'BOS', 'destination_code': 'FCO', 'flight_details': None,
+}
+
+
+def test_section_lists_get_distinct_etags():
+    store = PlanStore(path="")
+    key = store.save(PLAN)
+    single = store.response(key, ['a-b'])
+    pair = store.response(key, ['a', 'b'])
+    assert single[0] == pair[0] == 200
+    assert single[2]['ETag'] != pair[2]['ETag']
+
+
+def test_not_modified_repeats_the_etag_of_the_representation():
+    store = PlanStore(path="")
+    key = store.save(PLAN)
+    status, body, headers = store.response(key, accept_encoding='gzip')
+    assert status == 200 and headers['ETag'].endswith('-gzip"')
+    status, body, not_modified = store.response(key, if_none_match=headers['ETag'], accept_encoding='gzip')
+    assert status == 304 and body == b''
+    assert not_modified['ETag'] == headers['ETag']
+
+
+def test_identical_plans_are_stored_once_and_survive_a_restart(tmp_path):
+    path = str(tmp_path / "plans.sqlite3")
+    store = PlanStore(path=path)
+    key = store.save(dict(PLAN, timings={'total': 1.0}))
+    assert store.save(PLAN) == key
+    assert store.save(dict(PLAN, travel_plan="Other")) != key
+    assert PlanStore(path=path).get(key) == PLAN
+    assert PlanStore(path=path).get("0" * 32) is None
+
+
+def test_plan_is_split_into_flight_day_and_heading_sections():
+    document = {
+        'travel_plan': "## Flights\n\nBOS-FCO\n\n# Rome\n\n### Day 1\n\nColosseum\n\n### Day 2\n\nVatican\n\n"
+                       "## Must-Try Food\n\nCarbonara\n\n## Empty\n",
+        'flight_details': "## Flights\n\nBOS-FCO",
+    }
+    sections = plan_sections(document)
+    assert list(sections) == ['flights', 'day-1', 'day-2', 'must-try-food']
+    assert sections['day-2'] == "### Day 2\n\nVatican"
+
+
+def test_responses_are_compressed_and_revalidated():
+    store = PlanStore(path="")
+    key = store.save(PLAN)
+    status, body, headers = store.response(key, accept_encoding='gzip;q=1, br;q=0')
+    assert status == 200 and headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(body))['travel_plan'] == PLAN['travel_plan']
+    assert headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    status, _, _ = store.response(key, if_none_match=f'W/"{key}", "other"')
+    assert status == 304
+    assert store.response(key, ['day-9'])[0] == 404
+    assert store.response("0" * 32)[0] == 404
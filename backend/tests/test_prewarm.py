@@ -0,0 +1,86 @@
+import json
+import time
+import datetime
+import pytest
+import prewarm
+from cache import ResponseCache, LRUCache, SQLiteStore
+from model_backends import RateLimitError
+
+ROME = {"source": "Boston", "destination": "Rome", "dates": "June 10-20, 2027", "budget": "$3000", "travelers": "2",
+        "interests": ["food"]}
+BEACH = {"interests": ["beach"], "budget": "$2000", "dates": "August 1-10, 2027", "travelers": "2"}
+
+
+def write_log(path, lines):
+    path.write_text("\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines) + "\n")
+    return str(path)
+
+
+def test_most_frequent_requests_are_selected_after_normalization(tmp_path):
+    log = write_log(tmp_path / "requests.jsonl", [
+        dict(ROME, kind="plan"),
+        dict(BEACH, kind="recommend"),
+        dict(ROME, source=" boston", budget="3k"),
+        "not json",
+        {"kind": "plan", "source": "Boston"},
+        dict(BEACH, kind="recommend", interests=["Beach"]),
+        dict(ROME, kind="plan", destination="Paris"),
+        dict(ROME, kind="plan", interests=["Food"]),
+    ])
+    requests = prewarm.load_requests([log])
+    assert len(requests) == 6
+    assert [(kind, count) for kind, _, count in prewarm.top_requests(requests, top=2)] == [("plan", 3), ("recommend", 2)]
+
+
+def test_window_may_wrap_past_midnight():
+    window = prewarm.parse_window("23:00-02:00")
+    assert prewarm.in_window(window, datetime.datetime(2027, 1, 1, 23, 30))
+    assert prewarm.in_window(window, datetime.datetime(2027, 1, 1, 1, 59))
+    assert not prewarm.in_window(window, datetime.datetime(2027, 1, 1, 2, 0))
+    assert prewarm.in_window(None)
+
+
+@pytest.fixture
+def warmed(monkeypatch):
+    warmed = []
+
+    def warm(kind, payload):
+        if payload.get('destination') == "Quota":
+            raise RateLimitError("429 Resource has been exhausted", retry_after=60)
+        warmed.append(payload.get('destination', kind))
+
+    monkeypatch.setattr(prewarm, "response_cache", ResponseCache())
+    monkeypatch.setattr(prewarm, "warm", warm)
+    return warmed
+
+
+def test_prewarm_stops_when_the_quota_runs_out(warmed):
+    requests = [("plan", dict(ROME, destination=city)) for city in ("Rome", "Rome", "Quota", "Paris", "Oslo")]
+    summary = prewarm.prewarm(requests, concurrency=1)
+    assert warmed == ["Rome"]
+    assert (summary['warmed'], summary['failed'], summary['skipped']) == (1, 1, 2)
+    assert not prewarm.response_cache.serve_stale
+
+
+def test_prewarm_outside_its_window_generates_nothing(warmed):
+    now = datetime.datetime.now()
+    window = ((now + datetime.timedelta(hours=1)).time(), (now + datetime.timedelta(hours=2)).time())
+    assert prewarm.prewarm([("plan", ROME)], window=window)['skipped'] == 1
+    assert not warmed
+
+
+def test_stale_entry_is_served_while_it_is_refreshed(tmp_path):
+    cache = ResponseCache(LRUCache(ttl=0.05), SQLiteStore(str(tmp_path / "responses.sqlite3"), ttl=0.05))
+    cache.set("key", "old plan")
+    time.sleep(0.06)
+    assert cache.get_or_compute("key", lambda: "new plan") == "old plan"
+    for _ in range(100):
+        if cache.stats()['refreshes']:
+            break
+        time.sleep(0.01)
+    assert cache.get_or_compute("key", lambda: "newer plan") == "new plan"
+    assert cache.stats()['stale_hits'] == 1
+
+    cache.serve_stale = False
+    time.sleep(0.06)
+    assert cache.get_or_compute("key", lambda: "newest plan") == "newest plan"
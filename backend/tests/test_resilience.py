@@ -0,0 +1,214 @@
+import time
+import asyncio
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+import resilience
+from model_backends import ModelBackend
+from scheduler import Scheduler, ScheduledBackend, PRIORITY_AIRPORT
+from resilience import Stage, StageTimeout, StageOverloaded, CircuitOpenError
+
+
+class SlowBackend(ModelBackend):
+    name = "slow"
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        return prompt
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return prompt
+
+
+def queued_backend(latency):
+    """A backend behind a scheduler whose next admission is ~0.3s away"""
+    scheduler = Scheduler(rpm=600)
+    scheduler.requests.tokens = -2
+    return SlowBackend(latency), scheduler
+
+
+def test_deadline_starts_after_admission():
+    backend, scheduler = queued_backend(0.05)
+    stage = Stage("test", deadline=0.2)
+    model = ScheduledBackend(backend, scheduler)
+    assert stage.call(model.generate_content, "hi", priority=PRIORITY_AIRPORT) == "hi"
+    assert stage.stats()['timeouts'] == 0
+
+
+def test_deadline_starts_after_admission_async():
+    backend, scheduler = queued_backend(0.05)
+    stage = Stage("test", deadline=0.2)
+    model = ScheduledBackend(backend, scheduler)
+    result = asyncio.run(stage.call_async(lambda: model.generate_content_async("hi", priority=PRIORITY_AIRPORT)))
+    assert result == "hi"
+    assert stage.stats()['timeouts'] == 0
+
+
+def test_no_hedge_while_queued():
+    backend, scheduler = queued_backend(0.01)
+    stage = Stage("test", deadline=1)
+    stage._latencies.extend([0.01] * 50)
+    model = ScheduledBackend(backend, scheduler)
+    stage.call(model.generate_content, "hi", priority=PRIORITY_AIRPORT)
+    assert stage.stats()['hedges'] == 0
+    assert backend.calls == 1
+
+
+def test_timed_out_call_abandons_queued_hedge():
+    backend = SlowBackend(0.3)
+    scheduler = Scheduler(rpm=60)
+    stage = Stage("test", deadline=0.15)
+    stage._latencies.extend([0.01] * 50)
+    model = ScheduledBackend(backend, scheduler)
+    scheduler.requests.tokens = 1.05
+    with pytest.raises(StageTimeout):
+        stage.call(model.generate_content, "hi", priority=PRIORITY_AIRPORT)
+    # The hedge was still waiting for quota; it gives up instead of calling the model later
+    time.sleep(1.2)
+    assert backend.calls == 1
+    assert scheduler.stats()['waiting'] == 0
+
+
+@pytest.fixture
+def one_thread(monkeypatch):
+    """A hedge pool with a single thread, busy for the first 0.15s"""
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(resilience, '_hedge_executor', pool)
+    pool.submit(time.sleep, 0.15)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_waiting_for_a_thread_neither_times_out_nor_hedges(one_thread):
+    backend = SlowBackend(0.1)
+    stage = Stage("test", deadline=0.2)
+    stage._latencies.extend([0.09] * 50)
+    assert stage.call(backend.generate_content, "hi") == "hi"
+    stats = stage.stats()
+    assert (stats['timeouts'], stats['hedges'], backend.calls) == (0, 0, 1)
+
+
+def test_saturated_pool_is_not_a_model_failure(one_thread):
+    backend = SlowBackend(0.01)
+    stage = Stage("test", deadline=0.05)
+    with pytest.raises(StageOverloaded):
+        stage.call(backend.generate_content, "hi")
+    one_thread.shutdown(wait=True)
+    stats = stage.stats()
+    assert (stats['failures'], stats['timeouts'], stats['overloaded']) == (0, 0, 1)
+    assert stage.breaker.state == 'closed' and not stage.breaker._outcomes
+    # The attempt was dropped while queued instead of calling the model late
+    assert backend.calls == 0
+
+
+def chunks(delays):
+    for i, delay in enumerate(delays):
+        time.sleep(delay)
+        yield i
+
+
+async def chunks_async(delays):
+    for i, delay in enumerate(delays):
+        await asyncio.sleep(delay)
+        yield i
+
+
+def read_stream(stage, delays):
+    return list(stage.stream(chunks, delays))
+
+
+def read_stream_async(stage, delays):
+    async def opened():
+        return chunks_async(delays)
+
+    async def run():
+        return [chunk async for chunk in stage.stream_async(opened)]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('read', [read_stream, read_stream_async])
+def test_stream_passes_chunks_through(read):
+    stage = Stage("test", deadline=0.5, idle_timeout=0.2)
+    assert read(stage, [0.05, 0.1, 0.1, 0.1]) == [0, 1, 2, 3]
+    assert stage.stats()['successes'] == 1
+    # A stream's duration is not a call latency to hedge on
+    assert stage.stats()['p50_ms'] is None
+
+
+@pytest.mark.parametrize('read', [read_stream, read_stream_async])
+@pytest.mark.parametrize('delays', [[0.3], [0.01, 0.01, 0.3]], ids=['first chunk', 'idle'])
+def test_hung_stream_times_out_and_counts_against_the_breaker(read, delays):
+    stage = Stage("test", deadline=0.15, idle_timeout=0.1)
+    with pytest.raises(StageTimeout):
+        read(stage, delays)
+    assert stage.stats()['timeouts'] == 1
+    assert list(stage.breaker._outcomes) == [False]
+
+
+def test_stream_is_refused_while_the_breaker_is_open():
+    stage = Stage("test", deadline=0.15)
+    stage.breaker._open()
+    with pytest.raises(CircuitOpenError):
+        read_stream(stage, [0.01])
+
+
+def test_breaker_opens_on_errors_and_a_trial_call_closes_it():
+    from resilience import CircuitBreaker
+
+    breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, cooldown=0.05)
+    for success in (True, False, True):
+        breaker.record(success)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'open' and breaker.times_opened == 2
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == 'closed' and breaker.allow()
+
+
+def test_open_breaker_fails_fast():
+    stage = Stage("test", deadline=1)
+    stage.breaker.state, stage.breaker.opened_at = 'open', time.monotonic()
+    backend = SlowBackend(0)
+    with pytest.raises(CircuitOpenError):
+        stage.call(backend.generate_content, "hi")
+    assert backend.calls == 0 and stage.stats()['short_circuited'] == 1
+
+
+def test_slow_call_times_out_at_the_deadline():
+    stage = Stage("test", deadline=0.05)
+    start = time.perf_counter()
+    with pytest.raises(StageTimeout):
+        stage.call(SlowBackend(0.3).generate_content, "hi")
+    assert time.perf_counter() - start < 0.2
+    assert stage.stats()['timeouts'] == 1
+
+
+def test_slow_call_is_hedged_and_the_faster_attempt_wins():
+    class FirstSlowBackend(SlowBackend):
+        def generate_content(self, prompt, stream=False, **kwargs):
+            self.calls += 1
+            time.sleep(self.latency if self.calls == 1 else 0)
+            return self.calls
+
+    backend = FirstSlowBackend(0.5)
+    model = ScheduledBackend(backend, Scheduler(rpm=600))
+    stage = Stage("test", deadline=1)
+    stage._latencies.extend([0.01] * resilience.HEDGE_MIN_SAMPLES)
+    start = time.perf_counter()
+    assert stage.call(model.generate_content, "hi", priority=PRIORITY_AIRPORT) == 2
+    assert time.perf_counter() - start < 0.3
+    stats = stage.stats()
+    assert (stats['hedges'], stats['hedge_wins']) == (1, 1)
@@ -0,0 +1,55 @@
+import random
+import datetime
+import itertools
+from routing import plan_route, order_stops, distance_matrix, route_length, MULTI_CITY_DEFAULT_STAY_DAYS
+
+
+def test_round_trip_flies_home_on_the_last_day():
+    codes = {"Boston": "BOS", "Rome": "FCO", "Paris": "CDG"}
+    route = plan_route("Boston", ["Rome", "Paris"], codes, datetime.date(2025, 6, 10), days=11, round_trip=True)
+    assert [stop['arrive'] for stop in route['stops']] == ["2025-06-10", "2025-06-16"]
+    assert route['stops'][0]['depart'] == route['stops'][1]['arrive']
+    assert route['stops'][-1]['depart'] == "2025-06-20"
+    assert route['legs'][-1]['to'] == "Boston"
+    assert route['legs'][-1]['date'] == "2025-06-20"
+
+
+def test_stops_are_ordered_close_to_the_shortest_route():
+    rnd = random.Random(7)
+    for _ in range(100):
+        points = [(rnd.uniform(-60, 60), rnd.uniform(-170, 170)) for _ in range(rnd.randint(3, 7))]
+        for round_trip in (False, True):
+            distances = distance_matrix(points).tolist()
+            home = [0] if round_trip else []
+            order = order_stops(points[0], points[1:], round_trip)
+            length = route_length([0, *[index + 1 for index in order], *home], distances)
+            shortest = min(route_length([0, *route, *home], distances)
+                           for route in itertools.permutations(range(1, len(points))))
+            assert sorted(order) == list(range(len(points) - 1))
+            assert length <= shortest * 1.1
+
+
+def test_cities_without_coordinates_keep_their_order_at_the_end():
+    codes = {"Boston": "BOS", "Rome": "FCO", "Paris": "CDG", "London": "LHR", "Smallville": None, "Atlantis": None}
+    route = plan_route("Boston", ["Smallville", "Rome", "Atlantis", "London", "Paris"], codes,
+                       datetime.date(2025, 6, 10), days=12)
+    assert [stop['city'] for stop in route['stops']] == ["London", "Paris", "Rome", "Smallville", "Atlantis"]
+    assert [(stop['first_day'], stop['last_day']) for stop in route['stops']] == [(1, 3), (4, 6), (7, 8), (9, 10),
+                                                                                   (11, 12)]
+    assert route['distance_km'] is None and route['optimized']
+    kept = plan_route("Boston", ["Rome", "Paris"], codes, datetime.date(2025, 6, 10), optimize=False)
+    assert [stop['city'] for stop in kept['stops']] == ["Rome", "Paris"]
+    assert kept['stops'][-1]['last_day'] == 2 * MULTI_CITY_DEFAULT_STAY_DAYS
+
+
+def test_multi_city_plan_has_a_section_and_flights_per_stop():
+    from gemini_api import generate_multi_city_plan
+
+    result = generate_multi_city_plan("Boston", ["Rome", "London", "Paris"], "June 10-18, 2027", "$3000", "2",
+                                      ["food"], include_flights=True)
+    plan = result['travel_plan']
+    headings = [plan.index(f"## {city} (Days {days})") for city, days in (("London", "1-3"), ("Paris", "4-6"),
+                                                                          ("Rome", "7-9"))]
+    assert headings == sorted(headings)
+    assert [leg['date'] for leg in result['route']['legs']] == ["2027-06-10", "2027-06-13", "2027-06-16"]
+    assert plan.count("## ✈️ Flight Options") == 3
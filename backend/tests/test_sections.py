@@ -0,0 +1,123 @@
+import re
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import gemini_api
+from gemini_api import _fan_out
+from async_api import _fan_out_async
+
+
+class Tracker:
+    """Records how many calls run at once"""
+
+    def __init__(self):
+        self.running = 0
+        self.most = 0
+        self.started = []
+        self._lock = threading.Lock()
+
+    def call(self, n):
+        with self._lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+            self.started.append(n)
+        time.sleep(0.02)
+        with self._lock:
+            self.running -= 1
+        if n == 3:
+            raise ValueError(n)
+        return n
+
+    async def call_async(self, n):
+        self.running += 1
+        self.most = max(self.most, self.running)
+        self.started.append(n)
+        await asyncio.sleep(0.02)
+        self.running -= 1
+        return n
+
+
+def test_fan_out_caps_calls_in_flight_and_keeps_order():
+    tracker = Tracker()
+    futures = _fan_out([(tracker.call, (n,), {}) for n in range(10)], limit=3)
+    futures[8].cancel()
+    results = [f.exception() or f.result() if not f.cancelled() else None for f in futures]
+    assert results[:3] == [0, 1, 2] and isinstance(results[3], ValueError)
+    assert results[8] is None and results[9] == 9
+    assert tracker.most == 3
+    assert 8 not in tracker.started
+
+
+def test_fan_out_async_caps_calls_in_flight():
+    tracker = Tracker()
+
+    async def run():
+        tasks = _fan_out_async([lambda n=n: tracker.call_async(n) for n in range(10)], limit=3)
+        return [await task for task in tasks]
+
+    assert asyncio.run(run()) == list(range(10))
+    assert tracker.most == 3
+    assert tracker.started == list(range(10))
+
+
+
+def test_submit_from_an_executor_thread_runs_inline(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=2, initializer=lambda: setattr(gemini_api._executor_thread, 'active', True))
+    monkeypatch.setattr(gemini_api, '_executor', pool)
+    both_busy = threading.Barrier(2)
+
+    def outer(n):
+        both_busy.wait(timeout=5)
+        inner = gemini_api._submit(lambda: (n, threading.current_thread().name))
+        return inner.result(timeout=5)
+
+    try:
+        results = [future.result(timeout=10) for future in [gemini_api._submit(outer, n) for n in range(2)]]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    assert [n for n, _ in results] == [0, 1]
+    assert all(name.startswith('ThreadPoolExecutor') for _, name in results)
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+
+SKELETON = "# Rome in 14 Days\n\nA long trip.\n\n## Outline\nDay 1: Forum\nDay 14: Ostia\n\n## Where to Stay\nMonti"
+
+
+def fake_model(calls):
+    """call_model stand-in answering skeleton, day block and section prompts, later day blocks first"""
+
+    def call_model(stage, prompt, **kwargs):
+        calls.append((stage, kwargs['max_output_tokens']))
+        if stage == "itinerary_skeleton":
+            return Response(SKELETON)
+        days = re.search(r'plan for days (\d+)-(\d+)', prompt)
+        if days:
+            first, last = map(int, days.groups())
+            time.sleep(0.05 / first)
+            return Response("\n\n".join(f"### Day {day}\nSights" for day in range(first, last + 1)))
+        heading = re.search(r'"(## [^"]+)"', prompt)
+        return Response(f"Text for {heading.group(1) if heading else prompt[:20]}")
+
+    return call_model
+
+
+def test_long_trip_is_stitched_from_its_sections_in_order(monkeypatch):
+    calls = []
+    monkeypatch.setattr(gemini_api, "call_model", fake_model(calls))
+    assert gemini_api.sectioned_itinerary_days("June 1-7, 2027") is None
+    days = gemini_api.sectioned_itinerary_days("June 1-14, 2027")
+    assert days == 14 and gemini_api.itinerary_day_blocks(days) == [(1, 4), (5, 7), (8, 10), (11, 14)]
+    plan = gemini_api.generate_itinerary("Boston", "Rome", "June 1-14, 2027", "$3000", "2", ["food"], "BOS", "FCO")
+    assert plan.startswith("# Rome in 14 Days\n\nA long trip.\n\n## Day-by-Day Itinerary\n\n### Day 1")
+    positions = [plan.index(f"### Day {day}\n") for day in range(1, 15)]
+    assert positions == sorted(positions)
+    headings = ["## Where to Stay"] + [heading for heading, _ in gemini_api.ITINERARY_SECTIONS]
+    positions = [plan.index(heading) for heading in headings]
+    assert positions == sorted(positions) and positions[0] > plan.index("### Day 14")
+    assert calls[0][0] == "itinerary_skeleton" and len(calls) == 1 + 4 + len(gemini_api.ITINERARY_SECTIONS)
+    assert all(tokens < 2000 for _, tokens in calls)
@@ -0,0 +1,99 @@
+from destinations import shortlist_destinations
+from semantic_cache import SemanticCache, recommendation_features
+
+
+def features(request):
+    shortlist = shortlist_destinations(*request)
+    return recommendation_features(*request, shortlist[:3]), [d['name'] for d in shortlist]
+
+
+def test_budget_change_that_moves_the_shortlist_still_hits():
+    cache = SemanticCache(path='')
+    first, _ = features((["beach", "food"], "$2000", "August 1-10", "2"))
+    cache.add(first, "recommendations")
+    second, shown = features((["food", "beaches"], "$2200", "mid-August", "2"))
+    assert first[2] != second[2]
+    assert cache.lookup(second, shown) == "recommendations"
+
+
+def test_answer_covering_destinations_not_shown_is_not_reused():
+    cache = SemanticCache(path='')
+    first, _ = features((["beach", "food"], "$2000", "August 1-10", "2"))
+    cache.add(first, "recommendations")
+    second, _ = features((["food", "beaches"], "$2200", "mid-August", "2"))
+    assert cache.lookup(second, [first[2][0]]) is None
+
+
+def test_other_month_or_currency_never_matches():
+    cache = SemanticCache(path='')
+    cache.add(features((["beach"], "$2000", "August 1-10", "2"))[0], "august")
+    for request in ((["beach"], "$2000", "December 1-10", "2"), (["beach"], "2000 EUR", "August 1-10", "2")):
+        assert cache.lookup(*features(request)) is None
+
+
+def request(month, interest="beach"):
+    return recommendation_features([interest], "$2000", f"{month} 1-10", "2")
+
+
+def test_eviction_is_least_recently_used_across_partitions_and_drops_empty_ones():
+    cache = SemanticCache(path='', max_entries=2)
+    cache.add(request("June"), "june")
+    cache.add(request("July"), "july")
+    assert cache.lookup(request("June")) == "june"
+    cache.add(request("August"), "august")
+    assert cache.lookup(request("July")) is None
+    assert cache.lookup(request("June")) == "june"
+    assert cache.stats()['partitions'] == 2
+    assert cache.stats()['evictions'] == 1
+
+
+def test_expired_entry_drops_its_partition():
+    cache = SemanticCache(path='', ttl=-1)
+    cache.add(request("June"), "june")
+    assert cache.lookup(request("June")) is None
+    assert cache.stats()['partitions'] == 0 and cache.stats()['entries'] == 0
+
+
+def test_zero_max_entries_disables_the_cache(tmp_path):
+    path = str(tmp_path / "index.npz")
+    saved = SemanticCache(path=path)
+    saved.add(request("June"), "june")
+    saved.save()
+    cache = SemanticCache(path=path, max_entries=0)
+    cache.add(request("July"), "july")
+    assert cache.lookup(request("June")) is None
+    assert cache.stats()['entries'] == 0
+    assert SemanticCache(path=path, max_entries=1).lookup(request("June")) == "june"
+
+
+def test_saved_index_is_reloaded_with_its_lru_order(tmp_path):
+    path = str(tmp_path / "index.npz")
+    cache = SemanticCache(path=path, max_entries=2, save_every=1)
+    cache.add(request("June"), "june")
+    cache.add(request("July"), "july")
+    cache.lookup(request("June"))
+    cache.save()
+    restarted = SemanticCache(path=path, max_entries=2)
+    restarted.add(request("August"), "august")
+    assert restarted.lookup(request("June")) == "june"
+    assert restarted.lookup(request("July")) is None
+
+
+def test_near_identical_requests_ask_the_model_once(monkeypatch):
+    import gemini_api
+    from cache import ResponseCache
+
+    written = []
+
+    def generate(interests, budget, dates, travelers, candidates):
+        written.append(interests)
+        return "recommendations"
+
+    monkeypatch.setattr(gemini_api, "response_cache", ResponseCache())
+    monkeypatch.setattr(gemini_api, "semantic_cache", SemanticCache(path=''))
+    monkeypatch.setattr(gemini_api, "_generate_destination_recommendations", generate)
+    first = gemini_api.get_destination_recommendations(["beach", "food"], "$2000", "August 1-10", "2")
+    second = gemini_api.get_destination_recommendations(["food", "beaches"], "$2100", "August 3-12", "2")
+    other = gemini_api.get_destination_recommendations(["skiing"], "$2000", "January 1-10", "2")
+    assert first == second == other == "recommendations"
+    assert written == [["beach", "food"], ["skiing"]]
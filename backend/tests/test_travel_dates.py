@@ -0,0 +1,47 @@
+import os
+import json
+from datetime import date
+import pytest
+from travel_dates import parse_travel_dates
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'travel_dates_corpus.jsonl')
+TODAY = date(2026, 10, 18)
+
+with open(CORPUS, encoding='utf-8') as f:
+    corpus = [json.loads(line) for line in f if line.strip()]
+
+
+def parsed(text, today=TODAY):
+    dates = parse_travel_dates(text, today)
+    return dates and (dates.start and dates.start.isoformat(), dates.end and dates.end.isoformat(), dates.days)
+
+
+@pytest.mark.parametrize('case', corpus, ids=[case['text'] for case in corpus])
+def test_corpus(case):
+    dates = parsed(case['text'], date.fromisoformat(case['today'])) or (None, None, None)
+    assert dates == (case['start'], case['end'], case['days'])
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("I may travel in June", ("2027-06-01", "2027-06-30", None)),
+    ("maybe in June", ("2027-06-01", "2027-06-30", None)),
+    ("I may go for 10 days", (None, None, 10)),
+    ("May", ("2027-05-01", "2027-05-31", None)),
+    ("sometime in May", ("2027-05-01", "2027-05-31", None)),
+    ("mid-May", ("2027-05-11", "2027-05-20", None)),
+    ("May 2027", ("2027-05-01", "2027-05-31", None)),
+    ("May 3-9", ("2027-05-03", "2027-05-09", 7)),
+    ("June, 10 days", ("2027-06-01", "2027-06-30", 10)),
+])
+def test_may_is_only_a_month_in_context(text, expected):
+    assert parsed(text) == expected
+
+
+@pytest.mark.parametrize('text', ["June 31", "Feb 29", "Feb 29 2027", "June 28 - 31", "31/06/2027"])
+def test_days_that_do_not_exist_are_rejected(text):
+    assert parse_travel_dates(text, TODAY) is None
+
+
+def test_leap_day_is_the_next_one_within_a_year():
+    assert parsed("Feb 29", date(2027, 6, 1)) == ("2028-02-29", "2028-02-29", None)
+    assert parsed("Feb 29 2028") == ("2028-02-29", "2028-02-29", None)
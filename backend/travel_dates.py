@@ -0,0 +1,426 @@
+import os
+import re
+import calendar
+from datetime import date, timedelta
+from dataclasses import dataclass
+from functools import lru_cache
+
+# Local parser for the free-form travel dates users type ("June 10-20",
+# "10/06/2025 - 20/06/2025", "next weekend", "2 weeks in August", ...). It turns
+# them into a structured range that feeds flight lookups, the itinerary prompt
+# and the response cache keys, so equivalent phrasings share cache entries and
+# flights are generated for the actual departure day.
+#
+# Dates without a year are the next occurrence on or after today. Month and
+# season names (and "next month") are travel windows: they set start and end but
+# not the trip length, which only comes from an explicit range or duration.
+# A day that does not exist ("June 31") makes the dates unparsed rather than
+# being widened to the whole month.
+
+# Order of day and month in ambiguous numeric dates such as 06/10/2025 ("MDY" or
+# "DMY"); dotted dates (10.06.2025) are always day first
+TRAVEL_DATE_ORDER = os.getenv("TRAVEL_DATE_ORDER", "MDY").upper()
+
+MONTHS = {
+    name: number for number, names in enumerate((
+        ('jan', 'january'), ('feb', 'february'), ('mar', 'march'), ('apr', 'april'), ('may',),
+        ('jun', 'june'), ('jul', 'july'), ('aug', 'august'), ('sep', 'sept', 'september'),
+        ('oct', 'october'), ('nov', 'november'), ('dec', 'december'),
+    ), start=1) for name in names
+}
+WEEKDAYS = {
+    name: number for number, names in enumerate((
+        ('mon', 'monday'), ('tue', 'tues', 'tuesday'), ('wed', 'wednesday'), ('thu', 'thur', 'thurs', 'thursday'),
+        ('fri', 'friday'), ('sat', 'saturday'), ('sun', 'sunday'),
+    )) for name in names
+}
+# Meteorological seasons (northern hemisphere): first month and number of months
+SEASONS = {'spring': (3, 3), 'summer': (6, 3), 'fall': (9, 3), 'autumn': (9, 3), 'winter': (12, 3)}
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'fourteen': 14, 'couple': 2, 'few': 3,
+}
+UNIT_DAYS = {'day': 1, 'night': 1, 'week': 7, 'fortnight': 14, 'month': 30}
+
+_MONTH = r'(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?' \
+         r'|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b'
+_WEEKDAY = r'(mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(?:day|nesday|sday|rsday|urday)?\b'
+_YEAR = r'(\d{4}|\'\d{2})'
+_NUMBER = r'(\d+(?:\.\d+)?|' + '|'.join(NUMBER_WORDS) + r')'
+
+_ISO_RE = re.compile(r'(?<!\d)(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?!\d)'
+                     r'(?:\s*(?:-|/|\.\.)\s*(?:(\d{4})[-/.](\d{1,2})[-/.])?(\d{1,2})(?![\d/.-]))?')
+_NUMERIC_RE = re.compile(r'(?<![\d/.])(\d{1,2})([/.])(\d{1,2})(?:\2(\d{4}|\d{2}))?(?![\d/.])'
+                         r'(?:\s*-\s*(\d{1,2})\2(\d{1,2})(?:\2(\d{4}|\d{2}))?(?![\d/.]))?')
+# A number followed by a unit is a duration ("June, 10 days"), not a day of the month
+_NOT_DURATION = r'(?![\d:])(?!\s*(?:day|night|week|fortnight|month)s?\b)'
+_MONTH_FIRST_RE = re.compile(rf'\b{_MONTH}\s*(\d{{1,2}}){_NOT_DURATION}(?:\s+{_YEAR})?'
+                             rf'(?:\s*-\s*(?:{_MONTH}\s*)?(\d{{1,2}}){_NOT_DURATION})?(?:\s+{_YEAR})?')
+_DAY_FIRST_RE = re.compile(rf'(?<![\d/.])(\d{{1,2}})(?:\s+{_MONTH})?(?:\s+{_YEAR})?\s*-\s*'
+                           rf'(\d{{1,2}})\s+{_MONTH}(?:\s+{_YEAR})?'
+                           rf'|(?<![\d/.])(\d{{1,2}})\s+{_MONTH}(?:\s+{_YEAR})?')
+_MONTH_ONLY_RE = re.compile(rf'\b(?:(early|mid|late|end|beginning|start|(?:first|second|third|fourth|last)\s+week)\s+)?{_MONTH}'
+                            rf'(?:\s*-\s*{_MONTH})?(?:\s+{_YEAR})?')
+# Words before a bare "may" that make it the month ("in May") rather than the verb ("I may travel")
+_MAY_MONTH_RE = re.compile(r'\b(?:in|during|by|for|around|before|after)\s+$')
+_SEASON_RE = re.compile(rf'\b(?:(this|next)\s+)?(spring|summer|fall|autumn|winter)(?:\s+{_YEAR})?')
+_RELATIVE_RE = re.compile(
+    rf'\b(?:(?:the\s+)?day after tomorrow|today|tonight|tomorrow|(this|next)\s+(weekend|week|month|year)'
+    rf'|(?:(this|next)\s+)?{_WEEKDAY}|in\s+{_NUMBER}\s+(day|week|month)s?|{_NUMBER}\s+(day|week|month)s?\s+from\s+now)\b'
+)
+_DURATION_RE = re.compile(rf'\b{_NUMBER}(?:\s+of)?\s*(?:-\s*)?(day|night|week|fortnight|month)s?\b|\b(long\s+)?weekend\b')
+
+
+@dataclass(frozen=True)
+class TravelDates:
+    """
+    Parsed travel dates.
+
+    `start` and `end` bound the trip, or the travel window for a month or season
+    (None if the dates do not say). `days` is the trip length when it is known from
+    an explicit range or duration.
+    """
+
+    __slots__ = ('start', 'end', 'days')
+    start: date
+    end: date
+    days: int
+
+    def key(self):
+        """Canonical form for cache keys, e.g. "2025-06-10..2025-06-20" or "2025-08-01..2025-08-31/14d\""""
+        key = ""
+        if self.start:
+            key = self.start.isoformat()
+            if self.end and self.end != self.start:
+                key += f"..{self.end.isoformat()}"
+        if self.days and (not self.start or not self.end or self.days != (self.end - self.start).days + 1):
+            key += f"/{self.days}d" if key else f"{self.days}d"
+        return key
+
+    def describe(self):
+        """Plain description for prompts, e.g. "2025-06-10 to 2025-06-20, 11 days\""""
+        length = f"{self.days} days" if self.days else ""
+        if self.start and self.end and self.days == (self.end - self.start).days + 1:
+            return f"{self.start.isoformat()} to {self.end.isoformat()}, {length}"
+        if self.start and self.end and self.end != self.start:
+            window = f"between {self.start.isoformat()} and {self.end.isoformat()}"
+            return f"{length} {window}" if length else f"sometime {window}"
+        if self.start:
+            return f"{length} starting {self.start.isoformat()}" if length else self.start.isoformat()
+        return length
+
+
+def normalize_date_text(text):
+    """Lowercase and simplify a dates string: ordinals, dashes, "to"/"until" and filler words"""
+    text = str(text).lower().replace('–', '-').replace('—', '-').replace(',', ' ')
+    text = re.sub(r'(\d)(?:st|nd|rd|th)\b', r'\1', text)
+    text = re.sub(r'\b(early|mid|late)-', r'\1 ', text)
+    text = re.sub(rf'\b{_MONTH}\.', r'\1', text)
+    text = re.sub(r'\b(?:to|until|till|til|thru|through|and)\b', '-', text)
+    text = re.sub(r'\b(?:from|the|of|on|starting|between)\b(?!\s+now)', ' ', text)
+    # A weekday naming a calendar date ("Fri June 13") adds nothing
+    text = re.sub(rf'(?<!this )(?<!next ){_WEEKDAY}\s+(?=\d|{_MONTH})', ' ', text)
+    return ' '.join(text.split())
+
+
+def _year(text):
+    if text is None:
+        return None
+    year = int(text.lstrip("'"))
+    return year + 2000 if year < 100 else year
+
+
+def _upcoming(month, day, year, today):
+    """
+    The given day, in the given year or else the next occurrence on or after today.
+
+    Raises:
+        ValueError: If the day does not exist in that month ("June 31"), or in the
+                    coming year ("Feb 29" when no leap day is less than a year away)
+    """
+    if year:
+        return date(year, month, day)
+    for year in (today.year, today.year + 1):
+        try:
+            result = date(year, month, day)
+        except ValueError:
+            continue
+        if result >= today:
+            return result
+    raise ValueError(f"day {day} is out of range for month {month} within a year")
+
+
+def _range(start, end_month, end_day, end_year):
+    """End of a range that started on `start`, rolling over the year if needed ("Dec 28 - Jan 4")"""
+    end = date(end_year or start.year, end_month, end_day)
+    if end < start and not end_year:
+        end = date(start.year + 1, end_month, end_day)
+    return end
+
+
+def _month_end(year, month):
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _parse_iso(text, today):
+    match = _ISO_RE.search(text)
+    if not match:
+        return None
+    year, month, day, end_year, end_month, end_day = match.groups()
+    start = date(int(year), int(month), int(day))
+    end = None
+    if end_day:
+        end = date(int(end_year or year), int(end_month or month), int(end_day))
+    else:
+        # "departing 2025-09-05, returning 2025-09-15"
+        second = _ISO_RE.search(text, match.end())
+        if second:
+            end = date(*map(int, second.groups()[:3]))
+            return start, end, False, (match.start(), second.end())
+    return start, end, False, match.span()
+
+
+def _numeric_order(first, second, separator):
+    """(month, day) from the two numbers of a numeric date"""
+    if separator == '.' or first > 12 or (TRAVEL_DATE_ORDER == 'DMY' and second <= 12):
+        return second, first
+    return first, second
+
+
+def _parse_numeric(text, today):
+    match = _NUMERIC_RE.search(text)
+    if not match:
+        return None
+    first, separator, second, year, end_first, end_second, end_year = match.groups()
+    month, day = _numeric_order(int(first), int(second), separator)
+    year, end_year = _year(year), _year(end_year)
+    if separator == '.' and not year:
+        # "1.5" is more likely a number than a date
+        return None
+    start = _upcoming(month, day, year or end_year, today)
+    end = None
+    if end_first:
+        end_month, end_day = _numeric_order(int(end_first), int(end_second), separator)
+        end = _range(start, end_month, end_day, end_year)
+    return start, end, False, match.span()
+
+
+def _parse_month_first(text, today):
+    match = _MONTH_FIRST_RE.search(text)
+    if not match:
+        return None
+    month, day, year, end_month, end_day, end_year = match.groups()
+    year, end_year = _year(year), _year(end_year)
+    start_month = MONTHS[month[:3]]
+    if year is None and end_year and not end_day:
+        year, end_year = end_year, None
+    end = None
+    if end_day:
+        end_month_number = MONTHS[end_month[:3]] if end_month else start_month
+        if year is None and end_year:
+            # "June 10 - July 2 2025": the start is in the same year, or the one before
+            year = end_year if (start_month, int(day)) <= (end_month_number, int(end_day)) else end_year - 1
+        start = _upcoming(start_month, int(day), year, today)
+        end = _range(start, end_month_number, int(end_day), end_year)
+    else:
+        start = _upcoming(start_month, int(day), year, today)
+    return start, end, False, match.span()
+
+
+def _parse_day_first(text, today):
+    match = _DAY_FIRST_RE.search(text)
+    if not match:
+        return None
+    day, month, year, end_day, end_month, end_year, single_day, single_month, single_year = match.groups()
+    if single_day:
+        return _upcoming(MONTHS[single_month[:3]], int(single_day), _year(single_year), today), None, False, match.span()
+    year, end_year = _year(year), _year(end_year)
+    end_month_number = MONTHS[end_month[:3]]
+    start_month = MONTHS[month[:3]] if month else end_month_number
+    if year is None and end_year:
+        year = end_year if (start_month, int(day)) <= (end_month_number, int(end_day)) else end_year - 1
+    start = _upcoming(start_month, int(day), year, today)
+    return start, _range(start, end_month_number, int(end_day), end_year), False, match.span()
+
+
+def _parse_month_only(text, today):
+    for match in _MONTH_ONLY_RE.finditer(text):
+        part, month, last_month, year = match.groups()
+        # A bare "may" is only the month on its own, or with a year, a range, a part of
+        # the month or "in" before it
+        if (month != 'may' or part or last_month or year or match.group(0) == text.strip()
+                or _MAY_MONTH_RE.search(text, 0, match.start())):
+            break
+    else:
+        return None
+    month = MONTHS[month[:3]]
+    last_month = MONTHS[last_month[:3]] if last_month else month
+
+    def window(year):
+        start, end = date(year, month, 1), _month_end(year + (last_month < month), last_month)
+        if part in ('early', 'beginning', 'start'):
+            end = date(year, month, 10)
+        elif part == 'mid':
+            start, end = date(year, month, 11), date(year, month, 20)
+        elif part in ('late', 'end'):
+            start = date(year, month, 21)
+        elif part and part.endswith('week'):
+            week = part.split()[0]
+            if week == 'last':
+                start = _month_end(year, month) - timedelta(days=6)
+            else:
+                start = date(year, month, 1 + 7 * ('first', 'second', 'third', 'fourth').index(week))
+            end = start + timedelta(days=6)
+        return start, end
+
+    if year:
+        start, end = window(_year(year))
+    else:
+        # This year's window unless it is already over; what is left of it if it has begun
+        start, end = window(today.year)
+        if end < today:
+            start, end = window(today.year + 1)
+        start = max(start, today)
+    return start, end, True, match.span()
+
+
+def _parse_season(text, today):
+    match = _SEASON_RE.search(text)
+    if not match:
+        return None
+    which, season, year = match.groups()
+    first_month, months = SEASONS[season]
+    last_month = (first_month + months - 2) % 12 + 1
+
+    def window(year):
+        return date(year, first_month, 1), _month_end(year + (last_month < first_month), last_month)
+
+    if year:
+        start, end = window(_year(year))
+    else:
+        start, end = window(today.year)
+        if end < today or (which == 'next' and start <= today):
+            start, end = window(today.year + 1)
+        start = max(start, today)
+    return start, end, True, match.span()
+
+
+def _count(text):
+    return NUMBER_WORDS[text] if text in NUMBER_WORDS else float(text)
+
+
+def _parse_relative(text, today):
+    match = _RELATIVE_RE.search(text)
+    if not match:
+        return None
+    phrase = match.group(0)
+    which, unit, weekday_which, weekday, in_count, in_unit, ago_count, ago_unit = match.groups()
+    window = False
+    end = None
+    if phrase == 'today' or phrase == 'tonight':
+        start = today
+    elif phrase == 'tomorrow':
+        start = today + timedelta(days=1)
+    elif phrase.endswith('day after tomorrow'):
+        start = today + timedelta(days=2)
+    elif unit == 'weekend':
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+        if today.weekday() == 6:
+            saturday = today - timedelta(days=1)
+        start, end = max(saturday, today), saturday + timedelta(days=1)
+        if which == 'next':
+            start, end = saturday + timedelta(days=7), saturday + timedelta(days=8)
+    elif unit == 'week':
+        monday = today - timedelta(days=today.weekday())
+        start, end = (today, monday + timedelta(days=6)) if which == 'this' else (monday + timedelta(days=7), monday + timedelta(days=13))
+    elif unit == 'month':
+        if which == 'this':
+            start, end = today, _month_end(today.year, today.month)
+        else:
+            first = _month_end(today.year, today.month) + timedelta(days=1)
+            start, end = first, _month_end(first.year, first.month)
+        window = True
+    elif unit == 'year':
+        year = today.year + (which == 'next')
+        start, end = max(date(year, 1, 1), today), date(year, 12, 31)
+        window = True
+    elif weekday:
+        ahead = (WEEKDAYS[weekday] - today.weekday()) % 7
+        if weekday_which == 'next' and ahead == 0:
+            ahead = 7
+        start = today + timedelta(days=ahead)
+    else:
+        count, in_unit = (_count(in_count), in_unit) if in_count else (_count(ago_count), ago_unit)
+        if in_unit == 'month':
+            month_index = today.month - 1 + round(count)
+            year, month = today.year + month_index // 12, month_index % 12 + 1
+            start = date(year, month, min(today.day, calendar.monthrange(year, month)[1]))
+        else:
+            start = today + timedelta(days=round(count * UNIT_DAYS[in_unit]))
+    return start, end, window, match.span()
+
+
+# Tried in order; the first that matches sets the start and end
+_PARSERS = (_parse_iso, _parse_numeric, _parse_month_first, _parse_day_first, _parse_relative,
+            _parse_month_only, _parse_season)
+
+
+def _parse_duration(text):
+    """Trip length in days from "10 days", "a week", "5 nights", "long weekend", ... or None"""
+    match = _DURATION_RE.search(text)
+    if not match:
+        return None
+    count, unit, long_weekend = match.groups()
+    if count is None:
+        return 3 if long_weekend else 2
+    days = round(_count(count) * UNIT_DAYS[unit])
+    # Nights are spent between days: 5 nights is a 6-day trip
+    return days + 1 if unit == 'night' else days
+
+
+@lru_cache(maxsize=4096)
+def _parse(text, today):
+    start = end = None
+    window = False
+    for parser in _PARSERS:
+        try:
+            parsed = parser(text, today)
+        except ValueError:
+            # A day that does not exist in that month ("June 31", "Feb 29 2027") is
+            # rejected rather than widened to the whole month
+            return None
+        if parsed:
+            start, end, window, (begin, finish) = parsed
+            text = text[:begin] + ' ' + text[finish:]
+            break
+
+    days = _parse_duration(text)
+    if start is None and days is None:
+        return None
+    if start and end and end < start:
+        return None
+    if start and end and not window and days is None:
+        days = (end - start).days + 1
+    elif start and not end and days:
+        end = start + timedelta(days=days - 1)
+    return TravelDates(start, end or start, days)
+
+
+def parse_travel_dates(dates, today=None):
+    """
+    Parse free-form travel dates.
+
+    Understands ISO dates and ranges (2025-06-10, 2025/06/10 - 2025/06/20), numeric
+    dates in either order (06/10/2025, 10.06.2025), month names with ranges in either
+    order ("June 10-20", "10-20 June 2025", "Dec 28 - Jan 4"), relative phrases
+    ("tomorrow", "next weekend", "next Friday", "in 3 weeks"), months and seasons
+    ("mid-June", "summer 2025") and durations ("for 10 days", "5 nights").
+
+    Args:
+        dates (str): Travel dates as entered by the user
+        today (date): Reference date for relative phrases and dates without a year
+
+    Returns:
+        TravelDates: Parsed dates, or None if nothing was recognised
+    """
+    return _parse(normalize_date_text(dates), today or date.today())
@@ -53,11 +53,12 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('loading').classList.remove('hidden');
         
         try {
-            // Send request to backend
+            // Send request to backend and ask for a streamed response
             const response = await fetch('/api/generate-plan', {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json'
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
                 },
                 body: JSON.stringify({
                     source,
@@ -66,56 +67,61 @@ document.addEventListener('DOMContentLoaded', function() {
                     budget,
                     travelers,
                     interests: selectedInterests,
-                    include_flights: includeFlights
+                    include_flights: includeFlights,
+                    stream: true
                 })
             });
-            
-            const data = await response.json();
-            
-            if (data.success) {
-                // Format and display the result
-                const resultContent = document.getElementById('result-content');
-
-                // Add airport codes if available
-                let headerContent = '';
-                if (data.source_code || data.destination_code) {
-                    headerContent += '<div class="airport-codes">';
-                    if (data.source_code) {
-                        headerContent += `<div class="airport-code"><span>From:</span> ${data.source_code}</div>`;
-                    }
-                    if (data.destination_code) {
-                        headerContent += `<div class="airport-code"><span>To:</span> ${data.destination_code}</div>`;
-                    }
-                    headerContent += '</div>';
-                }
 
-                // Check if flight details were requested but not available
-                if (includeFlights && !data.flight_details) {
-                    console.warn('Flight details were requested but not available');
-                    // Add a note about flight details not being available
-                    headerContent += '<div class="flight-warning">Flight details could not be retrieved. This could be due to invalid airport codes or API limitations.</div>';
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!contentType.includes('text/event-stream')) {
+                // Validation errors (and servers without streaming) answer with plain JSON
+                const data = await response.json();
+                if (!data.success) {
+                    throw new Error(data.error || 'Failed to generate travel plan');
                 }
+                renderTravelPlan(data, data.travel_plan, data.flight_details, includeFlights, true);
+                rememberPlan(data.plan_id);
+                return;
+            }
 
-                // Format the travel plan
-                const formattedPlan = formatTravelPlan(data.travel_plan);
-
-                // Add the content to the page
-                resultContent.innerHTML = headerContent + formattedPlan;
-
-                // The flight table now has a class directly in the HTML
+            // Render the plan incrementally as Server-Sent Events arrive
+            const state = { codes: {}, markdown: '', flightDetails: null, renderPending: false };
+            const scheduleRender = () => {
+                if (state.renderPending) {
+                    return;
+                }
+                state.renderPending = true;
+                requestAnimationFrame(() => {
+                    state.renderPending = false;
+                    renderTravelPlan(state.codes, state.markdown, state.flightDetails, includeFlights, false);
+                });
+            };
 
-                // Hide loading and show result
-                document.getElementById('loading').classList.add('hidden');
-                document.getElementById('result').classList.remove('hidden');
-            } else {
-                throw new Error(data.error || 'Failed to generate travel plan');
-            }
+            await readEventStream(response, (event, data) => {
+                if (event === 'codes') {
+                    state.codes = data;
+                    scheduleRender();
+                } else if (event === 'chunk') {
+                    state.markdown += data.text;
+                    scheduleRender();
+                } else if (event === 'flights') {
+                    state.flightDetails = data.flight_details;
+                    scheduleRender();
+                } else if (event === 'done') {
+                    // The final event carries the complete plan, including the flight section
+                    renderTravelPlan(data, data.travel_plan, data.flight_details, includeFlights, true);
+                    rememberPlan(data.plan_id);
+                } else if (event === 'error') {
+                    throw new Error(data.error || 'Failed to generate travel plan');
+                }
+            });
         } catch (error) {
             console.error('Error:', error);
             alert('An error occurred: ' + error.message);
             
-            // Hide loading and show form again
+            // Hide loading and result, and show form again
             document.getElementById('loading').classList.add('hidden');
+            document.getElementById('result').classList.add('hidden');
             document.getElementById('planner').classList.add('active');
         }
     });
@@ -151,40 +157,58 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('recommendations').classList.remove('active');
         document.getElementById('loading').classList.remove('hidden');
         
+        const showRecommendations = (markdown) => {
+            document.getElementById('result-content').innerHTML = formatRecommendations(markdown);
+
+            // Hide loading and show result
+            document.getElementById('loading').classList.add('hidden');
+            document.getElementById('result').classList.remove('hidden');
+        };
+
         try {
-            // Send request to backend
+            // Send request to backend and ask for a streamed response
             const response = await fetch('/api/recommend-destinations', {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json'
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
                 },
                 body: JSON.stringify({
                     dates,
                     budget,
                     travelers,
-                    interests: selectedInterests
+                    interests: selectedInterests,
+                    stream: true
                 })
             });
-            
-            const data = await response.json();
-            
-            if (data.success) {
-                // Format and display the result
-                const resultContent = document.getElementById('result-content');
-                resultContent.innerHTML = formatRecommendations(data.recommendations);
-                
-                // Hide loading and show result
-                document.getElementById('loading').classList.add('hidden');
-                document.getElementById('result').classList.remove('hidden');
-            } else {
-                throw new Error(data.error || 'Failed to get recommendations');
+
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!contentType.includes('text/event-stream')) {
+                const data = await response.json();
+                if (!data.success) {
+                    throw new Error(data.error || 'Failed to get recommendations');
+                }
+                showRecommendations(data.recommendations + formatShortlist(data.shortlist));
+                return;
             }
+
+            // The ranked shortlist arrives first; the write-up of the top destinations follows
+            await readEventStream(response, (event, data) => {
+                if (event === 'shortlist') {
+                    showRecommendations('# Recommended Destinations\n\n*Writing up the top matches...*\n' + formatShortlist(data.shortlist));
+                } else if (event === 'done') {
+                    showRecommendations(data.recommendations + formatShortlist(data.shortlist));
+                } else if (event === 'error') {
+                    throw new Error(data.error || 'Failed to get recommendations');
+                }
+            });
         } catch (error) {
             console.error('Error:', error);
             alert('An error occurred: ' + error.message);
             
-            // Hide loading and show form again
+            // Hide loading and result, and show form again
             document.getElementById('loading').classList.add('hidden');
+            document.getElementById('result').classList.add('hidden');
             document.getElementById('recommendations').classList.add('active');
         }
     });
@@ -248,6 +272,7 @@ document.addEventListener('DOMContentLoaded', function() {
     backButton.addEventListener('click', () => {
         // Hide result and show active tab
         document.getElementById('result').classList.add('hidden');
+        rememberPlan(null);
 
         // Determine which tab was active
         const activeTabBtn = document.querySelector('.tab-btn.active');
@@ -255,6 +280,114 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById(activeTabId).classList.add('active');
     });
     
+    // Open a shared plan link (?plan=<id>) without generating the plan again
+    const sharedPlanId = new URLSearchParams(window.location.search).get('plan');
+    if (sharedPlanId) {
+        loadSharedPlan(sharedPlanId);
+    }
+
+    async function loadSharedPlan(planId) {
+        document.getElementById('planner').classList.remove('active');
+        document.getElementById('loading').classList.remove('hidden');
+        try {
+            const response = await fetch('/api/plans/' + encodeURIComponent(planId));
+            const data = await response.json();
+            if (!data.success) {
+                throw new Error(data.error || 'Failed to load travel plan');
+            }
+            renderTravelPlan(data, data.travel_plan, data.flight_details, !!data.flight_details, true);
+        } catch (error) {
+            console.error('Error:', error);
+            alert('An error occurred: ' + error.message);
+            rememberPlan(null);
+            document.getElementById('loading').classList.add('hidden');
+            document.getElementById('planner').classList.add('active');
+        }
+    }
+
+    // Helper function to put the shown plan's id in the address bar, so the page can be shared or reloaded
+    function rememberPlan(planId) {
+        const url = new URL(window.location.href);
+        if (planId) {
+            url.searchParams.set('plan', planId);
+        } else {
+            url.searchParams.delete('plan');
+        }
+        history.replaceState(null, '', url);
+    }
+
+    // Helper function to render a (possibly partial) travel plan
+    function renderTravelPlan(codes, travelPlan, flightDetails, includeFlights, complete) {
+        const resultContent = document.getElementById('result-content');
+
+        // Add airport codes if available
+        let headerContent = '';
+        if (codes.source_code || codes.destination_code) {
+            headerContent += '<div class="airport-codes">';
+            if (codes.source_code) {
+                headerContent += `<div class="airport-code"><span>From:</span> ${codes.source_code}</div>`;
+            }
+            if (codes.destination_code) {
+                headerContent += `<div class="airport-code"><span>To:</span> ${codes.destination_code}</div>`;
+            }
+            headerContent += '</div>';
+        }
+
+        // Check if flight details were requested but not available
+        if (complete && includeFlights && !flightDetails) {
+            console.warn('Flight details were requested but not available');
+            // Add a note about flight details not being available
+            headerContent += '<div class="flight-warning">Flight details could not be retrieved. This could be due to invalid airport codes or API limitations.</div>';
+        }
+
+        // While streaming, the flight section is shown above the itinerary as soon as it arrives;
+        // the complete plan already contains it
+        let markdown = travelPlan || '';
+        if (!complete && flightDetails) {
+            markdown = flightDetails + '\n\n' + markdown;
+        }
+
+        // Add the content to the page
+        resultContent.innerHTML = headerContent + formatTravelPlan(markdown);
+
+        // Hide loading and show result
+        document.getElementById('loading').classList.add('hidden');
+        document.getElementById('result').classList.remove('hidden');
+    }
+
+    // Helper function to read a Server-Sent Events response body
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+                onEvent(event, data ? JSON.parse(data) : {});
+            }
+        }
+    }
+
     // Helper function to format travel plan with Markdown
     function formatTravelPlan(travelPlanText) {
         // Use the marked library to convert Markdown to HTML
@@ -287,6 +420,20 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Helper function to list the ranked destination shortlist in Markdown
+    function formatShortlist(shortlist) {
+        if (!shortlist || shortlist.length === 0) {
+            return '';
+        }
+        let markdown = '\n\n## All Top Matches\n\n';
+        shortlist.forEach((destination, index) => {
+            const interests = destination.matched_interests.length ? destination.matched_interests.join(', ') : 'general appeal';
+            markdown += `${index + 1}. **${destination.name}, ${destination.country}** (${destination.airport_code}) - ` +
+                `${destination.score}% match: ${interests}; about $${destination.daily_cost_usd} per person per day\n`;
+        });
+        return markdown;
+    }
+
     // Helper function to format recommendations with Markdown
     function formatRecommendations(recommendationsText) {
         // Use the same Markdown parser for recommendations